@@ -4,10 +4,16 @@ Validates and looks up EAN-13/UPC codes for products in grocery-products.json
 """
 
 import json
+import os
+import sys
 import time
 import requests
 from typing import Dict, List, Optional
 
+# Shared catalog modules live in product-db
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'product-db'))
+from lookup_file import BarcodeLookup
+
 def calculate_ean13_check_digit(barcode_12: str) -> str:
     """Calculate EAN-13 check digit from first 12 digits"""
     if len(barcode_12) != 12:
@@ -220,10 +226,31 @@ def extract_ean13_list(input_file: str, output_file: str):
     
     print(f"Extracted {len(ean13s)} EAN-13 codes to {output_file}")
 
-if __name__ == "__main__":
-    import sys
+def lookup_offline(lookup_file: str, barcodes: List[str]):
+    """Look up barcodes in the memory-mapped lookup file (no MongoDB needed)"""
+    if not os.path.exists(lookup_file):
+        print(f"Lookup file not found: {lookup_file}")
+        print("Build it with: python product-db/export_lookup.py")
+        return
     
+    with BarcodeLookup(lookup_file) as lookup:
+        print(f"Loaded {len(lookup)} products from {lookup_file}")
+        for barcode in barcodes:
+            start = time.perf_counter()
+            matches = lookup.lookup(barcode)
+            elapsed_us = (time.perf_counter() - start) * 1e6
+            
+            if not matches:
+                print(f"✗ {barcode}: not found ({elapsed_us:.0f} µs)")
+                continue
+            
+            print(f"✓ {barcode}: {len(matches)} match(es) ({elapsed_us:.0f} µs)")
+            for product in matches:
+                print(f"    {product.get('store', '')} | {product.get('name', '')} | ${product.get('price', 0)}")
+
+if __name__ == "__main__":
     input_file = "simple-scanner-app/grocery-products.json"
+    lookup_file = "product-db/barcode_lookup.bin"
     
     print("Barcode Lookup and Validation Tool")
     print("="*60)
@@ -232,7 +259,8 @@ if __name__ == "__main__":
     print("2. Validate + lookup in Open Food Facts API (slow)")
     print("3. Extract UPC codes to text file")
     print("4. Extract EAN-13 codes to text file")
-    print("\nEnter option (1-4) or press Enter for option 1: ", end='')
+    print("5. Look up barcodes in offline lookup file")
+    print("\nEnter option (1-5) or press Enter for option 1: ", end='')
     
     choice = input().strip() or "1"
     
@@ -257,5 +285,8 @@ if __name__ == "__main__":
         extract_upc_list(input_file, "upc_codes.txt")
     elif choice == "4":
         extract_ean13_list(input_file, "ean13_codes.txt")
+    elif choice == "5":
+        print("Enter barcodes separated by spaces: ", end='')
+        lookup_offline(lookup_file, input().split())
     else:
         print("Invalid option")
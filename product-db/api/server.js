@@ -21,6 +21,135 @@ const sslOptions = {
 
 let db;
 let productsCollection;
+let detailsCollection;
+
+// Bulky, rarely read fields live in grocery_product_details (see product_details.py)
+const DETAIL_FIELDS = [
+  "description",
+  "meta_tag_description",
+  "properties",
+  "product_clusters",
+  "cluster_highlights",
+  "all_images",
+  "categories",
+];
+
+function detailKey(product) {
+  return `${product.store || ""}:${product.sku || ""}`;
+}
+
+function splitProduct(product) {
+  const main = {};
+  const details = {};
+  for (const [key, value] of Object.entries(product)) {
+    if (!DETAIL_FIELDS.includes(key)) {
+      main[key] = value;
+    } else if (value && (!Array.isArray(value) || value.length)) {
+      details[key] = value;
+    }
+  }
+  return [main, Object.keys(details).length ? details : null];
+}
+
+// Every field that can hold a scannable code (same list as product_codes.py)
+const CODE_FIELDS = [
+  "ean13",
+  "upc",
+  "ean",
+  "multi_ean",
+  "art_ean",
+  "art_cod",
+  "item_ean",
+  "sku",
+  "product_reference",
+  "product_reference_code",
+  "reference",
+  "reference_id",
+  "product_id",
+];
+
+// The code plus its UPC-A/EAN-13 equivalent when it has one
+function gtinVariants(code) {
+  if (/^\d+$/.test(code)) {
+    if (code.length === 12) {
+      return [code, "0" + code];
+    }
+    if (code.length === 13 && code.startsWith("0")) {
+      return [code, code.slice(1)];
+    }
+  }
+  return [code];
+}
+
+// Sorted, deduplicated `codes` array of a product (product_codes.extract_codes)
+function extractCodes(product) {
+  const codes = new Set();
+  for (const field of CODE_FIELDS) {
+    const value = product[field];
+    const values = Array.isArray(value) ? value : [value];
+    for (const item of values) {
+      if (item === null || item === undefined) {
+        continue;
+      }
+      const code = String(item).trim().toUpperCase();
+      if (code && code !== "NONE") {
+        gtinVariants(code).forEach((variant) => codes.add(variant));
+      }
+    }
+  }
+  return [...codes].sort();
+}
+
+// Merge the details document into a product when ?details=1 is passed
+async function withDetails(req, product) {
+  if (!req.query.details) {
+    return product;
+  }
+  const details = await detailsCollection.findOne(
+    { _id: detailKey(product) },
+    { projection: { _id: 0, store: 0, sku: 0 } }
+  );
+  return details ? { ...product, ...details } : product;
+}
+
+// Recompute the catalog_stats document /api/stats serves (catalog_stats.refresh_stats)
+async function refreshStats() {
+  const [result = {}] = await productsCollection
+    .aggregate([
+      {
+        $facet: {
+          total: [{ $count: "count" }],
+          stores: [
+            { $group: { _id: "$store", count: { $sum: 1 } } },
+            { $sort: { _id: 1 } },
+          ],
+          brands: [{ $group: { _id: "$brand" } }, { $count: "count" }],
+          categories: [
+            { $group: { _id: "$category", count: { $sum: 1 } } },
+            { $sort: { _id: 1 } },
+          ],
+        },
+      },
+    ])
+    .toArray();
+
+  const counts = (rows = []) =>
+    rows
+      .filter((row) => row._id !== null && row._id !== undefined)
+      .map((row) => ({ name: row._id, count: row.count }));
+
+  await db.collection("catalog_stats").replaceOne(
+    { _id: productsCollection.collectionName },
+    {
+      total: result.total?.[0]?.count || 0,
+      stores: counts(result.stores),
+      brand_count: result.brands?.[0]?.count || 0,
+      categories: counts(result.categories),
+      computed_at: new Date().toISOString(),
+    },
+    { upsert: true }
+  );
+}
 
 // Middleware
 app.use(cors());
@@ -38,6 +167,7 @@ async function connectDB() {
 
     db = client.db("products");
     productsCollection = db.collection("grocery_products");
+    detailsCollection = db.collection("grocery_product_details");
 
     console.log("Connected to MongoDB successfully");
 
@@ -45,6 +175,7 @@ async function connectDB() {
     await productsCollection.createIndex({ sku: 1 }, { unique: true });
     await productsCollection.createIndex({ ean13: 1 });
     await productsCollection.createIndex({ upc: 1 });
+    await productsCollection.createIndex({ codes: 1 });
     await productsCollection.createIndex({
       name: "text",
       brand: "text",
@@ -157,17 +288,16 @@ app.get("/api/products/search", async (req, res) => {
 // Get product by barcode
 app.get("/api/products/barcode/:barcode", async (req, res) => {
   try {
-    const { barcode } = req.params;
+    const barcode = req.params.barcode.trim().toUpperCase();
 
-    const product = await productsCollection.findOne({
-      $or: [{ ean13: barcode }, { upc: barcode }, { sku: barcode }],
-    });
+    // Single indexed match on the normalized codes array
+    const product = await productsCollection.findOne({ codes: barcode });
 
     if (!product) {
       return res.status(404).json({ error: "Product not found" });
     }
 
-    res.json(product);
+    res.json(await withDetails(req, product));
   } catch (error) {
     console.error("Error fetching product by barcode:", error);
     res.status(500).json({ error: "Internal server error" });
@@ -178,14 +308,16 @@ app.get("/api/products/barcode/:barcode", async (req, res) => {
 app.get("/api/products/sku/:sku", async (req, res) => {
   try {
     const { sku } = req.params;
+    // SKUs are only unique per store: ?store= picks the right one
+    const query = req.query.store ? { sku, store: req.query.store } : { sku };
 
-    const product = await productsCollection.findOne({ sku });
+    const product = await productsCollection.findOne(query);
 
     if (!product) {
       return res.status(404).json({ error: "Product not found" });
     }
 
-    res.json(product);
+    res.json(await withDetails(req, product));
   } catch (error) {
     console.error("Error fetching product by SKU:", error);
     res.status(500).json({ error: "Internal server error" });
@@ -195,6 +327,22 @@ app.get("/api/products/sku/:sku", async (req, res) => {
 // Get statistics
 app.get("/api/stats", async (req, res) => {
   try {
+    // Materialized stats written by the importer/scraper (see catalog_stats.py)
+    const cached = await db
+      .collection("catalog_stats")
+      .findOne({ _id: "grocery_products" });
+    if (cached && req.query.fresh === undefined) {
+      const stores = cached.stores.map((s) => s.name);
+      return res.json({
+        totalProducts: cached.total,
+        totalStores: stores.length,
+        totalBrands: cached.brand_count,
+        totalCategories: cached.categories.length,
+        stores,
+        computedAt: cached.computed_at,
+      });
+    }
+
     const total = await productsCollection.countDocuments();
 
     const stores = await productsCollection.distinct("store");
@@ -260,17 +408,38 @@ app.post("/api/products/import", async (req, res) => {
     }
 
     // Use bulk operations for better performance
-    const operations = products.map((product) => ({
-      updateOne: {
-        filter: { sku: product.sku },
-        update: { $set: product },
-        upsert: true,
-      },
-    }));
+    const operations = [];
+    const detailOperations = [];
+    for (const product of products) {
+      const [main, details] = splitProduct(product);
+      // Barcode lookups only match the normalized codes array
+      main.codes = extractCodes(product);
+      operations.push({
+        updateOne: {
+          filter: { sku: product.sku },
+          update: { $set: main },
+          upsert: true,
+        },
+      });
+      if (details) {
+        detailOperations.push({
+          updateOne: {
+            filter: { _id: detailKey(product) },
+            update: { $set: { ...details, store: product.store || "", sku: product.sku || "" } },
+            upsert: true,
+          },
+        });
+      }
+    }
+
+    if (detailOperations.length) {
+      await detailsCollection.bulkWrite(detailOperations, { ordered: false });
+    }
 
     const result = await productsCollection.bulkWrite(operations, {
       ordered: false,
     });
+    await refreshStats();
 
     res.json({
       success: true,
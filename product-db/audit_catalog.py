@@ -0,0 +1,305 @@
+"""
+Catalog Audit
+Single-pass parallel health check over MongoDB or a JSON/NDJSON snapshot.
+Each worker audits one slice of the catalog into a partial aggregate; the
+partials are merged at the end.
+
+Reports invalid check digits, duplicate and colliding codes, missing and
+orphaned images, zero prices and stale scraped_at per store.
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from barcode_index import validate_ean13, validate_upc
+from product_codes import extract_codes
+
+IMAGES_DIR = "../scripts/product_images"
+STALE_DAYS = 7
+SAMPLE_SIZE = 20
+CHUNK_SIZE = 5000       # products per worker task for JSON array snapshots
+
+AUDIT_FIELDS = ['sku', 'store', 'ean', 'ean13', 'upc', 'codes', 'price', 'local_image', 'scraped_at']
+
+
+def new_partial():
+    """Empty partial aggregate"""
+    return {
+        'total': 0,
+        'stores': {},           # store -> {'count', 'oldest', 'newest', 'stale'}
+        'invalid_ean13': [],
+        'invalid_upc': [],
+        'zero_price': [],
+        'missing_image': [],
+        'codes': {},            # code -> [[store, sku], ...]
+        'image_files': [],      # basenames referenced by products
+    }
+
+
+def audit_product(partial, product, images_dir, stale_before):
+    """Fold one product into a partial aggregate"""
+    store = product.get('store', '')
+    sku = str(product.get('sku', ''))
+    ref = [store, sku]
+    partial['total'] += 1
+
+    stats = partial['stores'].setdefault(store, {'count': 0, 'oldest': '', 'newest': '', 'stale': 0})
+    stats['count'] += 1
+    scraped_at = product.get('scraped_at') or ''
+    if scraped_at:
+        if not stats['oldest'] or scraped_at < stats['oldest']:
+            stats['oldest'] = scraped_at
+        if scraped_at > stats['newest']:
+            stats['newest'] = scraped_at
+    if not scraped_at or scraped_at < stale_before:
+        stats['stale'] += 1
+
+    ean13 = product.get('ean13')
+    if ean13 and not validate_ean13(ean13):
+        partial['invalid_ean13'].append(ref + [ean13])
+    upc = product.get('upc')
+    if upc and not validate_upc(upc):
+        partial['invalid_upc'].append(ref + [upc])
+
+    # The primary code plus every alternate barcode lookups match (codes array)
+    codes = set(product.get('codes') or extract_codes(product))
+    code = product.get('ean') or ean13
+    if code:
+        codes.add(code)
+    for code in codes:
+        partial['codes'].setdefault(code, []).append(ref)
+
+    if not product.get('price'):
+        partial['zero_price'].append(ref)
+
+    local_image = product.get('local_image') or ''
+    if not local_image or local_image.startswith('http') or 'placeholder' in local_image:
+        partial['missing_image'].append(ref)
+    else:
+        name = os.path.basename(local_image.replace('\\', '/'))
+        partial['image_files'].append(name)
+        if not os.path.exists(os.path.join(images_dir, name)):
+            partial['missing_image'].append(ref)
+
+
+def merge_partials(partials):
+    """Merge worker partials into one aggregate"""
+    merged = new_partial()
+    for partial in partials:
+        merged['total'] += partial['total']
+        for store, stats in partial['stores'].items():
+            target = merged['stores'].setdefault(store, {'count': 0, 'oldest': '', 'newest': '', 'stale': 0})
+            target['count'] += stats['count']
+            target['stale'] += stats['stale']
+            if stats['oldest'] and (not target['oldest'] or stats['oldest'] < target['oldest']):
+                target['oldest'] = stats['oldest']
+            if stats['newest'] > target['newest']:
+                target['newest'] = stats['newest']
+        for key in ('invalid_ean13', 'invalid_upc', 'zero_price', 'missing_image', 'image_files'):
+            merged[key].extend(partial[key])
+        for code, refs in partial['codes'].items():
+            merged['codes'].setdefault(code, []).extend(refs)
+    return merged
+
+
+def audit_products(products, images_dir, stale_before):
+    """Worker: audit an in-memory slice of products"""
+    partial = new_partial()
+    for product in products:
+        audit_product(partial, product, images_dir, stale_before)
+    return partial
+
+
+def audit_ndjson_range(path, start, end, images_dir, stale_before):
+    """Worker: audit the NDJSON lines starting inside [start, end)"""
+    partial = new_partial()
+    with open(path, 'rb') as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()  # finish the line that straddles the boundary
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            line = line.strip()
+            if line:
+                audit_product(partial, json.loads(line), images_dir, stale_before)
+    return partial
+
+
+def audit_mongo_range(mongodb_uri, lower, upper, last, images_dir, stale_before):
+    """Worker: audit one _id range with its own connection"""
+    from db import get_collection
+
+    collection = get_collection(uri=mongodb_uri)
+    query = {'_id': {'$gte': lower, '$lte' if last else '$lt': upper}}
+    projection = {field: 1 for field in AUDIT_FIELDS}
+
+    partial = new_partial()
+    for product in collection.find(query, projection).batch_size(1000):
+        audit_product(partial, product, images_dir, stale_before)
+    return partial
+
+
+def plan_ndjson(path, workers):
+    """Split a file into byte ranges, one per worker"""
+    size = os.path.getsize(path)
+    step = max(1, size // workers + 1)
+    return [(path, start, min(start + step, size)) for start in range(0, size, step)]
+
+
+def plan_mongo(mongodb_uri, workers):
+    """Split the collection into _id ranges using the _id index"""
+    from db import get_collection
+
+    collection = get_collection(uri=mongodb_uri)
+    buckets = list(collection.aggregate([
+        {'$project': {'_id': 1}},
+        {'$bucketAuto': {'groupBy': '$_id', 'buckets': workers}}
+    ]))
+    return [
+        (mongodb_uri, b['_id']['min'], b['_id']['max'], i == len(buckets) - 1)
+        for i, b in enumerate(buckets)
+    ]
+
+
+def submit_json_array(pool, path, workers, tail):
+    """Stream a JSON array snapshot to the workers in chunks
+
+    At most a few chunks are waiting at a time, so the parent never holds
+    the whole snapshot.
+    """
+    from import_products import iter_json_array
+
+    tasks = []
+    chunk = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for product in iter_json_array(f):
+            chunk.append(product)
+            if len(chunk) >= CHUNK_SIZE:
+                tasks.append(pool.submit(audit_products, chunk, *tail))
+                chunk = []
+                pending = [task for task in tasks if not task.done()]
+                if len(pending) >= workers * 2:
+                    wait(pending, return_when=FIRST_COMPLETED)
+    if chunk:
+        tasks.append(pool.submit(audit_products, chunk, *tail))
+    return tasks
+
+
+def run_audit(source, mongodb_uri=None, images_dir=IMAGES_DIR, stale_days=STALE_DAYS, workers=None):
+    """Run the audit with one pass over the catalog"""
+    workers = workers or os.cpu_count() or 4
+    stale_before = (datetime.now() - timedelta(days=stale_days)).isoformat()
+    tail = (images_dir, stale_before)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if source == 'mongo':
+            tasks = [pool.submit(audit_mongo_range, *spec, *tail) for spec in plan_mongo(mongodb_uri, workers)]
+        elif source.endswith('.ndjson') or source.endswith('.jsonl'):
+            tasks = [pool.submit(audit_ndjson_range, *spec, *tail) for spec in plan_ndjson(source, workers)]
+        else:
+            tasks = submit_json_array(pool, source, workers, tail)
+        partials = [task.result() for task in tasks]
+
+    return build_report(merge_partials(partials), images_dir, stale_days)
+
+
+def build_report(merged, images_dir, stale_days):
+    """Turn the merged aggregate into the final report"""
+    duplicates = []
+    collisions = []
+    codes = merged['codes']
+    for code, refs in codes.items():
+        if len(refs) < 2:
+            continue
+        if len(code) == 13 and code.startswith('0') and sorted(codes.get(code[1:], [])) == sorted(refs):
+            continue    # same products as its UPC-A form, reported there
+        owners = {tuple(ref) for ref in refs}
+        if len(owners) == 1:
+            duplicates.append({'code': code, 'store': refs[0][0], 'sku': refs[0][1], 'rows': len(refs)})
+        else:
+            collisions.append({'code': code, 'products': sorted(list(o) for o in owners)})
+
+    referenced = set(merged['image_files'])
+    orphaned = []
+    if os.path.isdir(images_dir):
+        orphaned = sorted(
+            name for name in os.listdir(images_dir)
+            if name not in referenced and name != 'placeholder.png'
+        )
+
+    def section(items):
+        return {'count': len(items), 'sample': items[:SAMPLE_SIZE]}
+
+    return {
+        'audited_at': datetime.now().isoformat(),
+        'total': merged['total'],
+        'stale_days': stale_days,
+        'stores': merged['stores'],
+        'invalid_ean13': section(merged['invalid_ean13']),
+        'invalid_upc': section(merged['invalid_upc']),
+        'duplicate_codes': section(duplicates),
+        'colliding_codes': section(collisions),
+        'zero_price': section(merged['zero_price']),
+        'missing_image': section(merged['missing_image']),
+        'orphaned_images': section(orphaned),
+    }
+
+
+def print_report(report):
+    """Print the audit summary"""
+    print("=" * 60)
+    print("CATALOG AUDIT")
+    print("=" * 60)
+    print(f"Total products: {report['total']:,}")
+    print(f"Invalid EAN-13 check digits: {report['invalid_ean13']['count']:,}")
+    print(f"Invalid UPC check digits: {report['invalid_upc']['count']:,}")
+    print(f"Duplicate codes: {report['duplicate_codes']['count']:,}")
+    print(f"Colliding codes: {report['colliding_codes']['count']:,}")
+    print(f"Zero prices: {report['zero_price']['count']:,}")
+    print(f"Missing images: {report['missing_image']['count']:,}")
+    print(f"Orphaned images: {report['orphaned_images']['count']:,}")
+    print(f"\nStores (stale = older than {report['stale_days']} days):")
+    for store, stats in sorted(report['stores'].items()):
+        print(f"  {store:20s} {stats['count']:6,} products | stale: {stats['stale']:6,} | newest: {stats['newest'][:19]}")
+    print("=" * 60)
+
+
+def main():
+    """Main execution"""
+    args = sys.argv[1:]
+    if '--help' in args or not args:
+        print("Usage: python audit_catalog.py <mongo|snapshot.json|snapshot.ndjson> [OPTIONS]")
+        print("\nOptions:")
+        print("  --uri URI          MongoDB URI (source 'mongo')")
+        print("  --images DIR       Images directory (default: ../scripts/product_images)")
+        print("  --stale-days N     Age after which scraped_at is stale (default: 7)")
+        print("  --workers N        Worker processes (default: CPU count)")
+        return
+
+    source = args[0]
+    options = dict(zip(args[1::2], args[2::2]))
+
+    start_time = time.time()
+    report = run_audit(
+        source,
+        mongodb_uri=options.get('--uri'),
+        images_dir=options.get('--images', IMAGES_DIR),
+        stale_days=int(options.get('--stale-days', STALE_DAYS)),
+        workers=int(options['--workers']) if '--workers' in options else None
+    )
+    print_report(report)
+
+    filename = f"catalog_audit_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\nReport saved to {filename} ({time.time() - start_time:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Backfill the unified `codes` array on existing products
+Reads only the code fields, writes in unordered bulk batches and creates the
+multikey index afterwards
+"""
+
+from pymongo import UpdateOne
+import sys
+import time
+from datetime import datetime
+
+from db import MONGODB_URI, get_collection
+from product_codes import CODE_FIELDS, extract_codes
+
+BATCH_SIZE = 1000
+
+
+def backfill_codes(mongodb_uri, only_missing=False):
+    """Recompute `codes` for every product (or only those without it)"""
+    collection = get_collection(uri=mongodb_uri)
+
+    query = {'codes': {'$exists': False}} if only_missing else {}
+    projection = {field: 1 for field in CODE_FIELDS}
+    projection['codes'] = 1
+
+    total = collection.count_documents(query)
+    print(f"Products to check: {total:,}")
+
+    start_time = time.time()
+    scanned = 0
+    updated = 0
+    operations = []
+    now = datetime.now().isoformat()
+
+    for product in collection.find(query, projection).batch_size(BATCH_SIZE):
+        scanned += 1
+        codes = extract_codes(product)
+        if product.get('codes') != codes:
+            operations.append(UpdateOne({'_id': product['_id']},
+                                        {'$set': {'codes': codes, 'codes_updated_at': now}}))
+
+        if len(operations) >= BATCH_SIZE:
+            result = collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+            print(f"\r  Scanned {scanned:,}/{total:,} | Updated {updated:,}", end='', flush=True)
+
+    if operations:
+        result = collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+    print(f"\r  Scanned {scanned:,}/{total:,} | Updated {updated:,}")
+
+    print("\nCreating multikey index on codes...")
+    collection.create_index([('codes', 1)])
+
+    elapsed = time.time() - start_time
+    print(f"✓ Backfill complete in {elapsed:.2f}s")
+
+    return updated
+
+
+if __name__ == "__main__":
+    mongodb_uri = MONGODB_URI
+    only_missing = '--missing' in sys.argv
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if args:
+        mongodb_uri = args[0]
+
+    print("Barcode Codes Backfill")
+    print("=" * 60)
+    print(f"Mode: {'only missing' if only_missing else 'all products'}")
+    print("=" * 60)
+
+    try:
+        backfill_codes(mongodb_uri, only_missing=only_missing)
+    except Exception as e:
+        print(f"\n✗ Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,188 @@
+"""
+Barcode Collision Index
+Tracks which EAN-13 codes are real (from store APIs) and which are synthetic,
+and resolves collisions between generated codes deterministically
+"""
+
+import hashlib
+
+COUNTRY_CODE = '750'
+MAX_ATTEMPTS = 50
+
+
+def ean13_check_digit(code_12):
+    """Calculate EAN-13 check digit from first 12 digits"""
+    odd_sum = sum(int(code_12[i]) for i in range(1, 12, 2))
+    even_sum = sum(int(code_12[i]) for i in range(0, 12, 2))
+    return str((10 - ((even_sum + odd_sum * 3) % 10)) % 10)
+
+
+def validate_ean13(code):
+    """Validate EAN-13 check digit"""
+    code = str(code or '')
+    if len(code) != 13 or not code.isdigit():
+        return False
+    return ean13_check_digit(code[:12]) == code[12]
+
+
+def validate_upc(code):
+    """Validate UPC-A check digit (a UPC-A is an EAN-13 with a leading 0)"""
+    code = str(code or '')
+    if len(code) != 12 or not code.isdigit():
+        return False
+    return validate_ean13('0' + code)
+
+
+def generate_ean13(sku, attempt=0):
+    """Generate a synthetic EAN-13 code for a SKU
+
+    Attempt 0 is the historical scheme (country code + first 9 SKU digits).
+    Later attempts derive the 9 body digits from a hash of the SKU, so two
+    SKUs sharing their first 9 digits end up with different codes.
+    """
+    if attempt == 0:
+        numeric_sku = ''.join(filter(str.isdigit, str(sku)))
+        if len(numeric_sku) < 9:
+            numeric_sku = numeric_sku.zfill(9)
+        else:
+            numeric_sku = numeric_sku[:9]
+    else:
+        digest = hashlib.sha1(f"{sku}:{attempt}".encode('utf-8')).hexdigest()
+        numeric_sku = str(int(digest, 16) % 10**9).zfill(9)
+
+    code_12 = COUNTRY_CODE + numeric_sku
+    return code_12 + ean13_check_digit(code_12)
+
+
+def is_synthetic_ean13(code, sku):
+    """Check whether a code is the primary generated EAN-13 for this SKU"""
+    return bool(code) and code == generate_ean13(sku)
+
+
+class BarcodeIndex:
+    """In-memory code -> owner index used to deduplicate products in O(1)"""
+
+    def __init__(self):
+        self.entries = {}       # code -> {'store', 'sku', 'synthetic', 'persisted'}
+        self.collisions = []    # collision report for this run
+        self.moves = []         # (old_code, new_code) pending for evicted owners
+
+    def load(self, collection):
+        """Load codes already stored in MongoDB so reruns keep their assignments"""
+        cursor = collection.find(
+            {'ean': {'$nin': ['', None]}},
+            {'ean': 1, 'sku': 1, 'store': 1, 'ean_source': 1}
+        )
+        loaded = 0
+        for doc in cursor:
+            sku = str(doc.get('sku', ''))
+            code = doc['ean']
+            if 'ean_source' in doc:
+                synthetic = doc['ean_source'] == 'generated'
+            else:
+                synthetic = is_synthetic_ean13(code, sku)
+            self.entries[code] = {
+                'store': doc.get('store', ''),
+                'sku': sku,
+                'synthetic': synthetic,
+                'persisted': True
+            }
+            loaded += 1
+        return loaded
+
+    def get(self, code):
+        """Return the owner entry for a code, or None"""
+        return self.entries.get(code)
+
+    def owns(self, code, sku, store, synthetic=False):
+        """True if (store, sku) holds the code (or, for a synthetic code, one re-derived from it)"""
+        sku = str(sku)
+        candidates = [code]
+        if synthetic:
+            candidates += [generate_ean13(f"{store}:{sku}", attempt) for attempt in range(1, MAX_ATTEMPTS + 1)]
+        for candidate in candidates:
+            owner = self.entries.get(candidate)
+            if owner is None:
+                return False
+            if owner['store'] == store and owner['sku'] == sku:
+                return True
+        return False
+
+    def claim(self, code, sku, store, synthetic=False):
+        """Claim a code for (store, sku)
+
+        Returns the code the product should be saved under, or None when the
+        product is a duplicate. A synthetic code that is already owned by a
+        different product is re-derived; a real code that hits a synthetic
+        owner takes the slot and the owner is moved to its next free code
+        (see ``pop_moves``). Two products with the same real code are
+        duplicates, as before.
+        """
+        if not code:
+            return None
+
+        sku = str(sku)
+        attempt = 0
+        candidate = code
+        while attempt <= MAX_ATTEMPTS:
+            owner = self.entries.get(candidate)
+
+            if owner is None:
+                self._set(candidate, store, sku, synthetic)
+                if candidate != code:
+                    self._report(code, store, sku, self.entries[code], candidate, 'rederived')
+                return candidate
+
+            if owner['store'] == store and owner['sku'] == sku:
+                return None
+
+            if not synthetic and not owner['synthetic']:
+                return None
+
+            if not synthetic:
+                self._evict(candidate, owner, {'store': store, 'sku': sku})
+                self._set(candidate, store, sku, synthetic)
+                return candidate
+
+            attempt += 1
+            candidate = generate_ean13(f"{store}:{sku}", attempt)
+
+        self._report(code, store, sku, self.entries.get(code), None, 'unresolved')
+        return None
+
+    def pop_moves(self):
+        """Return and clear the (old_code, new_code) moves caused by evictions"""
+        moves, self.moves = self.moves, []
+        return moves
+
+    def _set(self, code, store, sku, synthetic):
+        self.entries[code] = {
+            'store': store,
+            'sku': sku,
+            'synthetic': synthetic,
+            'persisted': False
+        }
+
+    def _evict(self, code, owner, claimant):
+        """Move a synthetic owner off a code claimed by a real barcode"""
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            candidate = generate_ean13(f"{owner['store']}:{owner['sku']}", attempt)
+            if candidate not in self.entries:
+                self.entries[candidate] = owner
+                self.moves.append((code, candidate))
+                self._report(code, owner['store'], owner['sku'], claimant, candidate, 'evicted')
+                return candidate
+        self._report(code, owner['store'], owner['sku'], claimant, None, 'unresolved')
+        return None
+
+    def _report(self, code, store, sku, other, resolved, action):
+        other = other or {}
+        self.collisions.append({
+            'code': code,
+            'store': store,
+            'sku': sku,
+            'other_store': other.get('store', ''),
+            'other_sku': other.get('sku', ''),
+            'resolved_code': resolved,
+            'action': action
+        })
@@ -0,0 +1,71 @@
+"""
+Per-branch prices and stock
+Stores that price by branch (La Comer) keep the product document, with its
+attributes, once in grocery_products and one compact row per product and
+branch here (price, list price, stock, availability). Rows are keyed by
+store + sku + branch and only written when one of those values changed.
+"""
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+BRANCH_COLLECTION = 'grocery_branch_prices'
+BRANCH_FIELDS = ('price', 'list_price', 'stock', 'available')
+BATCH_SIZE = 500
+
+
+def branch_key(store, sku, branch):
+    """Branch row _id of a product"""
+    return f"{store}:{sku}:{branch}"
+
+
+class BranchPrices:
+    """Changed branch rows of one store, written in bulk
+
+    The store's current rows are loaded once, so unchanged rows cost no
+    write at all.
+    """
+
+    def __init__(self, db, store):
+        self.collection = db[BRANCH_COLLECTION] if db is not None else None
+        self.store = store
+        self.known = {}         # _id -> BRANCH_FIELDS values
+        self.seen = set()
+        self.pending = []
+        self.written = 0
+        self.unchanged = 0
+        if self.collection is not None:
+            self.collection.create_index([('store', 1), ('sku', 1)])
+            for row in self.collection.find({'store': store}, {field: 1 for field in BRANCH_FIELDS}):
+                self.known[row['_id']] = tuple(row.get(field) for field in BRANCH_FIELDS)
+
+    def record(self, product, branch):
+        """Queue a product's row for a branch if its values changed; True if queued"""
+        key = branch_key(self.store, product['sku'], branch)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        values = tuple(product.get(field) for field in BRANCH_FIELDS)
+        if self.known.get(key) == values:
+            self.unchanged += 1
+            return False
+        self.known[key] = values
+        row = dict(zip(BRANCH_FIELDS, values), store=self.store, sku=product['sku'], branch=branch,
+                   updated_at=datetime.now().isoformat())
+        self.pending.append(UpdateOne({'_id': key}, {'$set': row}, upsert=True))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Write the queued rows"""
+        if not self.pending:
+            return
+        if self.collection is not None:
+            try:
+                self.collection.bulk_write(self.pending, ordered=False)
+                self.written += len(self.pending)
+            except Exception as e:
+                print(f"  Error saving branch prices: {str(e)[:50]}")
+        self.pending = []
@@ -0,0 +1,64 @@
+"""
+Materialized catalog statistics
+Totals, stores, brands and per-category counts come from one $facet
+aggregation and are stored in a stats document, so readers don't rescan
+the collection. Writers refresh it after they finish a load.
+"""
+
+from datetime import datetime
+
+STATS_COLLECTION = 'catalog_stats'
+
+
+def compute_stats(collection):
+    """Compute all catalog statistics in a single aggregation"""
+    result = next(collection.aggregate([
+        {'$facet': {
+            'total': [{'$count': 'count'}],
+            'stores': [
+                {'$group': {'_id': '$store', 'count': {'$sum': 1}}},
+                {'$sort': {'_id': 1}}
+            ],
+            'brands': [
+                {'$group': {'_id': '$brand'}},
+                {'$count': 'count'}
+            ],
+            'categories': [
+                {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
+                {'$sort': {'_id': 1}}
+            ]
+        }}
+    ]), {})
+
+    def counts(rows):
+        return [{'name': row['_id'], 'count': row['count']} for row in rows if row['_id'] is not None]
+
+    total = result.get('total') or [{'count': 0}]
+    brands = result.get('brands') or [{'count': 0}]
+    return {
+        'total': total[0]['count'],
+        'stores': counts(result.get('stores', [])),
+        'brand_count': brands[0]['count'],
+        'categories': counts(result.get('categories', [])),
+        'computed_at': datetime.now().isoformat()
+    }
+
+
+def refresh_stats(collection):
+    """Recompute and store the stats document for a collection"""
+    stats = compute_stats(collection)
+    collection.database[STATS_COLLECTION].replace_one(
+        {'_id': collection.name},
+        stats,
+        upsert=True
+    )
+    return stats
+
+
+def get_stats(collection, fresh=False):
+    """Read the stats document, computing it if missing or fresh=True"""
+    if not fresh:
+        stats = collection.database[STATS_COLLECTION].find_one({'_id': collection.name})
+        if stats:
+            return stats
+    return refresh_stats(collection)
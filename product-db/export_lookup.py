@@ -0,0 +1,133 @@
+"""
+Export the catalog to a binary barcode lookup file for offline/edge use
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from lookup_file import BarcodeLookup, build_lookup_file, update_lookup_file
+from search_index import SearchIndex, build_from_collection
+
+OUTPUT_FILE = "barcode_lookup.bin"
+
+# Timestamps writers set when a product's lookup record changes: a scrape
+# rewrites the product, --refresh only its prices, barcode moves and
+# backfill_codes.py only its codes
+CHANGE_FIELDS = ('scraped_at', 'price_updated_at', 'codes_updated_at')
+
+
+def changed_since(product, since):
+    """True if a product changed after an ISO timestamp"""
+    return any(str(product.get(field) or '') > since for field in CHANGE_FIELDS)
+
+
+def mongo_products(mongodb_uri, query=None):
+    """Stream product documents from MongoDB"""
+    from db import get_collection
+
+    collection = get_collection(uri=mongodb_uri)
+    for product in collection.find(query or {}, {'_id': 0}).batch_size(1000):
+        yield product
+
+
+def json_products(json_file):
+    """Load product documents from a JSON snapshot"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def export_search_index(search_file, mongodb_uri=None, json_file=None):
+    """Build the text search index next to the lookup file"""
+    start_time = time.time()
+    if json_file:
+        index = SearchIndex().build(json_products(json_file))
+    else:
+        from db import get_collection
+        index = build_from_collection(get_collection(uri=mongodb_uri))
+    index.save(search_file)
+    print(f"✓ Search index: {len(index.docs):,} products, {len(index.vocab):,} terms "
+          f"({time.time() - start_time:.2f}s) -> {search_file}")
+
+
+def export_lookup(output_file, mongodb_uri=None, json_file=None, incremental=False):
+    """Build (or incrementally refresh) the lookup file"""
+    start_time = time.time()     # also the file's built_at: taken before the products are read
+
+    if incremental and os.path.exists(output_file):
+        with BarcodeLookup(output_file) as lookup:
+            since = datetime.fromtimestamp(lookup.built_at).isoformat()
+        print(f"Incremental update: products changed after {since}")
+
+        if json_file:
+            changed = [p for p in json_products(json_file) if changed_since(p, since)]
+        else:
+            changed = mongo_products(mongodb_uri, {'$or': [{field: {'$gt': since}} for field in CHANGE_FIELDS]})
+
+        count, keys, total = update_lookup_file(output_file, changed, built_at=start_time)
+        print(f"✓ Updated {count:,} products ({total:,} products, {keys:,} barcode keys)")
+    else:
+        products = json_products(json_file) if json_file else mongo_products(mongodb_uri)
+        keys, total = build_lookup_file(output_file, products, built_at=start_time)
+        print(f"✓ Exported {total:,} products ({keys:,} barcode keys)")
+
+    elapsed = time.time() - start_time
+    size = os.path.getsize(output_file)
+    print(f"File: {output_file} ({size / 1024:.1f} KB) in {elapsed:.2f}s")
+
+
+def print_usage():
+    """Print usage information"""
+    print("\nBarcode Lookup Export")
+    print("=" * 60)
+    print("\nUsage:")
+    print("  python export_lookup.py [output] [--json FILE] [--uri URI] [--incremental] [--search-index FILE]")
+    print("\nOptions:")
+    print("  --json FILE     Export from a JSON snapshot instead of MongoDB")
+    print("  --uri URI       MongoDB URI")
+    print("  --incremental   Only re-export products changed since the last build")
+    print("  --search-index FILE  Also build the text search index (always a full build)")
+    print("=" * 60)
+
+
+def main():
+    """Main execution"""
+    args = sys.argv[1:]
+    if '--help' in args:
+        print_usage()
+        return
+
+    output_file = OUTPUT_FILE
+    mongodb_uri = None
+    json_file = None
+    search_file = None
+    incremental = '--incremental' in args
+
+    i = 0
+    while i < len(args):
+        if args[i] == '--json' and i + 1 < len(args):
+            json_file = args[i + 1]
+            i += 1
+        elif args[i] == '--search-index' and i + 1 < len(args):
+            search_file = args[i + 1]
+            i += 1
+        elif args[i] == '--uri' and i + 1 < len(args):
+            mongodb_uri = args[i + 1]
+            i += 1
+        elif not args[i].startswith('--'):
+            output_file = args[i]
+        i += 1
+
+    try:
+        export_lookup(output_file, mongodb_uri, json_file, incremental)
+        if search_file:
+            export_search_index(search_file, mongodb_uri, json_file)
+    except Exception as e:
+        print(f"\n✗ Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
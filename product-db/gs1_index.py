@@ -0,0 +1,199 @@
+"""
+GS1 Company Prefix Index
+Groups products by the GS1 Mexico company prefix of their EAN-13 (750-759),
+so the same manufacturer's products can be found across stores without
+scanning the whole collection.
+
+Codes are kept in one sorted array: a company prefix is a contiguous range
+found by binary search, and a code maps to its cluster by checking at most
+13 prefixes (longest known prefix first, then the default length).
+"""
+
+import json
+import sys
+from bisect import bisect_left
+from collections import Counter
+
+from barcode_index import is_synthetic_ean13, validate_ean13
+
+# 750 + 4 digits is the most common length for established Mexican manufacturers
+DEFAULT_PREFIX_LENGTH = 7
+MEXICO_PREFIXES = tuple(str(p) for p in range(750, 760))
+
+
+def is_mexican_ean13(code):
+    """Real EAN-13 with a GS1 Mexico prefix"""
+    return validate_ean13(code) and code.startswith(MEXICO_PREFIXES)
+
+
+class GS1PrefixIndex:
+    """Sorted-range index from EAN-13 company prefix to products"""
+
+    def __init__(self, prefix_length=DEFAULT_PREFIX_LENGTH, known_prefixes=()):
+        self.prefix_length = prefix_length
+        self.known_prefixes = set(known_prefixes)
+        self.known_lengths = sorted({len(p) for p in self.known_prefixes}, reverse=True)
+        self._pending = []
+        self.codes = []
+        self.refs = []
+
+    def add(self, product):
+        """Add a product if it carries a real Mexican EAN-13"""
+        code = str(product.get('ean13') or product.get('ean') or '')
+        if not is_mexican_ean13(code):
+            return False
+        if product.get('ean_source') == 'generated' or is_synthetic_ean13(code, product.get('sku', '')):
+            return False
+        self._pending.append((code, {
+            'store': product.get('store', ''),
+            'sku': str(product.get('sku', '')),
+            'brand': product.get('brand', ''),
+            'name': product.get('name', '')
+        }))
+        return True
+
+    def build(self, products):
+        """Add products and sort the index"""
+        for product in products:
+            self.add(product)
+        self.freeze()
+        return self
+
+    def freeze(self):
+        """Merge pending codes into the sorted arrays"""
+        if not self._pending:
+            return
+        merged = sorted(list(zip(self.codes, self.refs)) + self._pending, key=lambda item: item[0])
+        self.codes = [code for code, _ in merged]
+        self.refs = [ref for _, ref in merged]
+        self._pending = []
+
+    def cluster_of(self, code):
+        """Company-prefix cluster of a code (longest known prefix wins)"""
+        code = str(code)
+        for length in self.known_lengths:
+            if code[:length] in self.known_prefixes:
+                return code[:length]
+        return code[:self.prefix_length]
+
+    def _range(self, prefix):
+        """Index range [lo, hi) of codes starting with prefix"""
+        lo = bisect_left(self.codes, prefix)
+        hi = bisect_left(self.codes, prefix + ':')  # ':' sorts right after '9'
+        return lo, hi
+
+    def _in_longer_cluster(self, code, prefix):
+        """True if a code belongs to a known prefix longer than prefix"""
+        cluster = self.cluster_of(code)
+        return len(cluster) > len(prefix) and cluster in self.known_prefixes
+
+    def _member_indexes(self, prefix):
+        lo, hi = self._range(prefix)
+        if not any(length > len(prefix) for length in self.known_lengths):
+            return range(lo, hi)
+        return [i for i in range(lo, hi) if not self._in_longer_cluster(self.codes[i], prefix)]
+
+    def members(self, prefix):
+        """Products of a prefix's cluster: codes starting with it, except those
+        of a longer known prefix (they form their own cluster)"""
+        return [dict(self.refs[i], code=self.codes[i]) for i in self._member_indexes(prefix)]
+
+    def count(self, prefix):
+        """Number of products in a prefix's cluster (see members)"""
+        return len(self._member_indexes(prefix))
+
+    def cluster_counts(self):
+        """Per-cluster product counts, largest first (one linear pass)"""
+        counts = Counter(self.cluster_of(code) for code in self.codes)
+        return counts.most_common()
+
+    def cluster_summary(self, prefix):
+        """Counts per store and brand inside one cluster"""
+        members = self.members(prefix)
+        return {
+            'prefix': prefix,
+            'count': len(members),
+            'stores': dict(Counter(m['store'] for m in members)),
+            'brands': dict(Counter(m['brand'] for m in members).most_common()),
+        }
+
+    def cross_store_clusters(self, min_stores=2):
+        """Clusters present in at least min_stores stores"""
+        stores = {}
+        for code, ref in zip(self.codes, self.refs):
+            stores.setdefault(self.cluster_of(code), set()).add(ref['store'])
+        return sorted(
+            (prefix for prefix, found in stores.items() if len(found) >= min_stores),
+            key=lambda prefix: -self.count(prefix)
+        )
+
+
+def load_products(source, mongodb_uri=None):
+    """Load products from MongoDB ('mongo') or a JSON snapshot"""
+    if source == 'mongo':
+        from db import get_collection
+
+        collection = get_collection(uri=mongodb_uri)
+        projection = {'_id': 0, 'ean13': 1, 'ean': 1, 'ean_source': 1, 'sku': 1, 'store': 1, 'brand': 1, 'name': 1}
+        products = list(collection.find({}, projection))
+        return products
+
+    with open(source, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    """Main execution"""
+    args = sys.argv[1:]
+    if not args or '--help' in args:
+        print("Usage: python gs1_index.py <mongo|snapshot.json> [OPTIONS]")
+        print("\nOptions:")
+        print("  --length N        Default company prefix length (default: 7)")
+        print("  --known FILE      JSON list of known company prefixes (any length)")
+        print("  --prefix P        Show members of one prefix")
+        print("  --top N           Number of clusters to list (default: 20)")
+        print("  --save FILE       Save per-cluster summaries as JSON")
+        print("  --uri URI         MongoDB URI (with 'mongo')")
+        return
+
+    source = args[0]
+    options = dict(zip(args[1::2], args[2::2]))
+
+    known = []
+    if '--known' in options:
+        with open(options['--known'], 'r', encoding='utf-8') as f:
+            known = json.load(f)
+
+    index = GS1PrefixIndex(int(options.get('--length', DEFAULT_PREFIX_LENGTH)), known)
+    index.build(load_products(source, options.get('--uri')))
+
+    if '--prefix' in options:
+        summary = index.cluster_summary(options['--prefix'])
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        for member in index.members(options['--prefix']):
+            print(f"  {member['code']} | {member['store']:16s} | {member['brand']:20s} | {member['name'][:50]}")
+        return
+
+    clusters = index.cluster_counts()
+    top = int(options.get('--top', 20))
+    print("=" * 60)
+    print("GS1 COMPANY PREFIX CLUSTERS")
+    print("=" * 60)
+    print(f"Products with real Mexican EAN-13: {len(index.codes):,}")
+    print(f"Clusters: {len(clusters):,}")
+    print(f"Clusters in 2+ stores: {len(index.cross_store_clusters()):,}\n")
+    for prefix, count in clusters[:top]:
+        summary = index.cluster_summary(prefix)
+        stores = ', '.join(f"{s}: {n}" for s, n in summary['stores'].items())
+        brands = list(summary['brands'])[:3]
+        print(f"{prefix:10s} {count:5,} products | {stores} | brands: {', '.join(brands)}")
+    print("=" * 60)
+
+    if '--save' in options:
+        with open(options['--save'], 'w', encoding='utf-8') as f:
+            json.dump([index.cluster_summary(prefix) for prefix, _ in clusters], f, ensure_ascii=False, indent=2)
+        print(f"Saved cluster summaries to {options['--save']}")
+
+
+if __name__ == "__main__":
+    main()
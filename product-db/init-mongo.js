@@ -8,6 +8,7 @@ db.createCollection("grocery_products");
 db.grocery_products.createIndex({ sku: 1 }, { unique: true });
 db.grocery_products.createIndex({ ean13: 1 });
 db.grocery_products.createIndex({ upc: 1 });
+db.grocery_products.createIndex({ codes: 1 });
 db.grocery_products.createIndex({
   name: "text",
   brand: "text",
@@ -0,0 +1,182 @@
+"""
+Binary barcode -> product lookup file
+Sorted 64-bit barcode keys pointing at compact product records, read through
+mmap with a binary search (no MongoDB needed)
+
+Layout (little-endian):
+    header   magic, version, key_count, record_count, built_at
+    keys     key_count x (uint64 barcode, uint32 record index), sorted
+    offsets  (record_count + 1) x uint64, relative to the records section
+    records  compact UTF-8 JSON, one per product
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+
+from product_codes import extract_codes
+
+MAGIC = b'BCLKUP01'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIQ4x')
+KEY = struct.Struct('<QI')
+OFFSET = struct.Struct('<Q')
+
+# Fields kept in the compact record (enough to show a scanned product)
+RECORD_FIELDS = [
+    'store', 'sku', 'ean13', 'upc', 'ean', 'name', 'brand', 'category',
+    'price', 'list_price', 'currency', 'available', 'stock', 'local_image',
+    'product_url', 'scraped_at'
+]
+
+
+def barcode_key(code):
+    """Convert a code to its 64-bit key, or None if it is not a numeric barcode"""
+    code = str(code).strip()
+    if not code.isdigit() or len(code) > 19:
+        return None
+    return int(code)
+
+
+def record_id(product):
+    """Identity of a product across rebuilds"""
+    return (product.get('store', ''), str(product.get('sku', '')))
+
+
+def compact_record(product):
+    """Keep only the fields needed for an offline lookup"""
+    record = {field: product[field] for field in RECORD_FIELDS if field in product}
+    record['codes'] = product.get('codes') or extract_codes(product)
+    return record
+
+
+def write_lookup_file(path, records, built_at=None):
+    """Write compact records to a lookup file (atomically replaces path)"""
+    records = list(records)
+    keys = []
+    blobs = []
+    for index, record in enumerate(records):
+        for code in record.get('codes', []):
+            key = barcode_key(code)
+            if key is not None:
+                keys.append((key, index))
+        blobs.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    keys = sorted(set(keys))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), len(records), int(built_at or time.time())))
+        for key, index in keys:
+            f.write(KEY.pack(key, index))
+        offset = 0
+        for blob in blobs:
+            f.write(OFFSET.pack(offset))
+            offset += len(blob)
+        f.write(OFFSET.pack(offset))
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return len(keys), len(records)
+
+
+def build_lookup_file(path, products, built_at=None):
+    """Full build from an iterable of product documents"""
+    return write_lookup_file(path, (compact_record(p) for p in products), built_at)
+
+
+def update_lookup_file(path, changed_products, built_at=None):
+    """Incremental rebuild: replace/add changed products, keep everything else
+
+    Products removed from the catalog are only dropped by a full build.
+    Pass the time the products were queried as built_at, so changes made
+    while the file was being built are picked up by the next update.
+    """
+    with BarcodeLookup(path) as lookup:
+        records = {record_id(r): r for r in lookup.iter_records()}
+    changed = 0
+    for product in changed_products:
+        records[record_id(product)] = compact_record(product)
+        changed += 1
+    keys, total = write_lookup_file(path, records.values(), built_at)
+    return changed, keys, total
+
+
+class BarcodeLookup:
+    """Memory-mapped reader for a lookup file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.key_count, self.record_count, self.built_at = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a barcode lookup file (version {VERSION})")
+
+        self._keys_start = HEADER.size
+        self._offsets_start = self._keys_start + self.key_count * KEY.size
+        self._records_start = self._offsets_start + (self.record_count + 1) * OFFSET.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __len__(self):
+        return self.record_count
+
+    def _key_at(self, i):
+        return KEY.unpack_from(self._mm, self._keys_start + i * KEY.size)
+
+    def record(self, index):
+        """Decode the record at a given index"""
+        base = self._offsets_start + index * OFFSET.size
+        start = OFFSET.unpack_from(self._mm, base)[0]
+        end = OFFSET.unpack_from(self._mm, base + OFFSET.size)[0]
+        blob = self._mm[self._records_start + start:self._records_start + end]
+        return json.loads(blob.decode('utf-8'))
+
+    def lookup(self, code):
+        """Return every product record carrying this barcode
+
+        Keys drop leading zeros ('123' and '00123' share one), so the records
+        found are checked against their codes.
+        """
+        code = str(code).strip()
+        key = barcode_key(code)
+        if key is None:
+            return []
+
+        lo, hi = 0, self.key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        results = []
+        while lo < self.key_count:
+            found, index = self._key_at(lo)
+            if found != key:
+                break
+            record = self.record(index)
+            if code in record.get('codes', []):
+                results.append(record)
+            lo += 1
+        return results
+
+    def iter_records(self):
+        """Iterate over all product records in file order"""
+        for index in range(self.record_count):
+            yield self.record(index)
@@ -0,0 +1,48 @@
+"""
+Unified barcode field
+Every writer stores a normalized `codes` array so barcode lookups are a single
+indexed equality match ({'codes': code}) instead of an $or over many fields
+"""
+
+# Every field that can hold a scannable code, in any store's schema
+CODE_FIELDS = [
+    'ean13', 'upc', 'ean', 'multi_ean', 'art_ean', 'art_cod', 'item_ean',
+    'sku', 'product_reference', 'product_reference_code', 'reference',
+    'reference_id', 'product_id'
+]
+
+
+def normalize_code(value):
+    """Normalize a single code (strip whitespace, uppercase)"""
+    if value is None:
+        return ''
+    return str(value).strip().upper()
+
+
+def gtin_variants(code):
+    """Return the code plus its UPC-A/EAN-13 equivalent when it has one"""
+    if code.isdigit():
+        if len(code) == 12:
+            return [code, '0' + code]
+        if len(code) == 13 and code.startswith('0'):
+            return [code, code[1:]]
+    return [code]
+
+
+def extract_codes(product):
+    """Build the sorted, deduplicated `codes` array for a product"""
+    codes = set()
+    for field in CODE_FIELDS:
+        value = product.get(field)
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            code = normalize_code(item)
+            if code and code != 'NONE':
+                codes.update(gtin_variants(code))
+    return sorted(codes)
+
+
+def with_codes(product):
+    """Set the `codes` array on a product dict and return it"""
+    product['codes'] = extract_codes(product)
+    return product
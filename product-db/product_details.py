@@ -0,0 +1,124 @@
+"""
+Hot/cold product document split
+Barcode lookups only read a handful of small fields, so the bulky, rarely read
+ones (descriptions, VTEX properties and clusters, image lists, category paths)
+are kept in a separate details collection keyed by store + sku. The main
+grocery_products documents stay compact.
+"""
+
+import sys
+
+from pymongo import UpdateOne
+
+DETAILS_COLLECTION = 'grocery_product_details'
+
+DETAIL_FIELDS = (
+    'description',
+    'meta_tag_description',
+    'properties',
+    'product_clusters',
+    'cluster_highlights',
+    'all_images',
+    'categories',
+)
+
+
+def detail_key(product):
+    """Details document _id of a product"""
+    return f"{product.get('store', '')}:{product.get('sku', '')}"
+
+
+def split_product(product):
+    """Split a product into (main document, details) without modifying it
+
+    Details is None when the product has no non-empty bulky fields.
+    """
+    main = {k: v for k, v in product.items() if k not in DETAIL_FIELDS}
+    details = {k: product[k] for k in DETAIL_FIELDS if product.get(k)}
+    return main, details or None
+
+
+def details_fields(product, details):
+    """$set fields of a details document"""
+    return dict(details, store=product.get('store', ''), sku=product.get('sku', ''))
+
+
+def details_update(product, details):
+    """Bulk upsert operation for a product's details document"""
+    return UpdateOne({'_id': detail_key(product)}, {'$set': details_fields(product, details)}, upsert=True)
+
+
+def save_details(db, product, details):
+    """Upsert one product's details document"""
+    if details:
+        db[DETAILS_COLLECTION].update_one(
+            {'_id': detail_key(product)},
+            {'$set': details_fields(product, details)},
+            upsert=True
+        )
+
+
+def with_details(db, product):
+    """Merge a product's details back into it (for full product views)"""
+    if product is None:
+        return None
+    details = db[DETAILS_COLLECTION].find_one({'_id': detail_key(product)}, {'_id': 0, 'store': 0, 'sku': 0})
+    if details:
+        product.update(details)
+    return product
+
+
+def migrate(collection, batch_size=1000):
+    """Move bulky fields of existing documents to the details collection"""
+    db = collection.database
+    details_collection = db[DETAILS_COLLECTION]
+    query = {'$or': [{field: {'$exists': True}} for field in DETAIL_FIELDS]}
+    projection = {field: 1 for field in DETAIL_FIELDS + ('store', 'sku')}
+    unset = {field: '' for field in DETAIL_FIELDS}
+
+    moved = 0
+    details_ops = []
+    main_ops = []
+    for doc in collection.find(query, projection).batch_size(batch_size):
+        _, details = split_product(doc)
+        if details:
+            details_ops.append(details_update(doc, details))
+        main_ops.append(UpdateOne({'_id': doc['_id']}, {'$unset': unset}))
+
+        if len(main_ops) >= batch_size:
+            # Details first, so a crash never loses fields
+            if details_ops:
+                details_collection.bulk_write(details_ops, ordered=False)
+            collection.bulk_write(main_ops, ordered=False)
+            moved += len(main_ops)
+            details_ops, main_ops = [], []
+            print(f"\r  Migrated {moved:,} products", end='', flush=True)
+
+    if main_ops:
+        if details_ops:
+            details_collection.bulk_write(details_ops, ordered=False)
+        collection.bulk_write(main_ops, ordered=False)
+        moved += len(main_ops)
+    print(f"\r  Migrated {moved:,} products")
+    return moved
+
+
+def main():
+    """Main execution"""
+    args = sys.argv[1:]
+    if '--help' in args or not args or args[0] != '--migrate':
+        print("Usage: python product_details.py --migrate [mongodb_uri]")
+        print("\nMoves description, properties, image lists, etc. of existing products")
+        print(f"to the {DETAILS_COLLECTION} collection.")
+        return
+
+    from db import get_collection
+
+    collection = get_collection(uri=args[1] if len(args) > 1 else None)
+    print(f"Moving bulky fields to {DETAILS_COLLECTION}...")
+    moved = migrate(collection)
+    print(f"✓ {moved:,} products compacted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Query profiler for the Python tools
+Groups every find/aggregate/count/distinct/update/delete sent through db.py
+by query shape (the filter with values replaced by '?') and records latency
+and documents returned (running totals plus a bounded sample of latencies,
+so long runs don't grow memory). On demand, one sample per shape is
+explained with executionStats to get documents/keys examined and the
+winning plan, and shapes answered by a collection scan are flagged as
+missing an index.
+
+Enabled from db.py with DB_PROFILE=1 (add DB_EXPLAIN=1 to run explains);
+the ranked report is printed and saved as query_profile_<timestamp>.json
+when the tool exits.
+"""
+
+import json
+import random
+import threading
+from datetime import datetime
+
+from pymongo import monitoring
+
+# command -> field holding the filter
+FILTER_FIELDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+}
+PROFILED_COMMANDS = set(FILTER_FIELDS) | {'aggregate', 'update', 'delete'}
+
+# Keys the driver adds that don't belong in an explain
+SESSION_KEYS = {'lsid', '$db', '$clusterTime', 'txnNumber', '$readPreference', 'readConcern',
+                'writeConcern', 'cursor', 'batchSize', 'singleBatch', 'ordered', 'maxTimeMS'}
+
+SLOW_MS = 100
+SAMPLE_SIZE = 1000      # latencies kept per shape (reservoir) for the p95
+
+
+def shape_of(value):
+    """Replace the values of a filter with '?' and keep its structure"""
+    if isinstance(value, dict):
+        return {k: shape_of(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        shapes = [shape_of(v) for v in value]
+        # $in lists of any length share a shape
+        if all(s == '?' for s in shapes):
+            return ['?'] if shapes else []
+        return shapes
+    return '?'
+
+
+def command_shape(name, command):
+    """Shape of the filter a command runs with (aggregates add their stage names)"""
+    if name in FILTER_FIELDS:
+        return shape_of(command.get(FILTER_FIELDS[name]) or {})
+    if name == 'aggregate':
+        pipeline = command.get('pipeline') or []
+        first = pipeline[0] if pipeline else {}
+        stages = [next(iter(stage)) for stage in pipeline]
+        return {'$match': shape_of(first.get('$match', {})), 'stages': stages}
+    if name == 'update':
+        updates = command.get('updates') or [{}]
+        return shape_of(updates[0].get('q', {}))
+    if name == 'delete':
+        deletes = command.get('deletes') or [{}]
+        return shape_of(deletes[0].get('q', {}))
+    return {}
+
+
+def returned_count(name, reply):
+    """Documents returned (reads) or affected (writes) according to a reply"""
+    if 'cursor' in reply:
+        cursor = reply['cursor']
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if name == 'distinct':
+        return len(reply.get('values', []))
+    if 'n' in reply:
+        return reply['n']
+    return 0
+
+
+def find_key(document, key):
+    """First value of a key anywhere inside an explain document"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def plan_stages(document):
+    """All stage names of a plan"""
+    stages = []
+    if isinstance(document, dict):
+        if isinstance(document.get('stage'), str):
+            stages.append(document['stage'])
+        for value in document.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(document, list):
+        for value in document:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+class QueryProfiler(monitoring.CommandListener):
+    """Per query shape latency, returned documents and explain output"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.cursors = {}       # cursor id -> shape key, so getMore batches count too
+        self.shapes = {}
+
+    def started(self, event):
+        name = event.command_name
+        if name == 'getMore':
+            key = self.cursors.get(event.command.get('getMore'))
+        elif name in PROFILED_COMMANDS:
+            collection = event.command.get(name)
+            shape = json.dumps(command_shape(name, event.command), sort_keys=True)
+            key = (event.database_name, collection, name, shape)
+            with self.lock:
+                if key not in self.shapes:
+                    sample = {k: v for k, v in event.command.items() if k not in SESSION_KEYS}
+                    # Explain takes a single write statement
+                    for field in ('updates', 'deletes'):
+                        if field in sample:
+                            sample[field] = sample[field][:1]
+                    self.shapes[key] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'durations': [],
+                                        'cursor_ms': 0.0, 'returned': 0, 'sample': sample, 'explain': None}
+        else:
+            key = None
+        if key is not None:
+            with self.lock:
+                self.pending[(event.connection_id, event.request_id)] = key
+
+    def succeeded(self, event):
+        with self.lock:
+            key = self.pending.pop((event.connection_id, event.request_id), None)
+            if key is None:
+                return
+            stats = self.shapes[key]
+            duration = event.duration_micros / 1000
+            if event.command_name == 'getMore':
+                stats['cursor_ms'] += duration
+            else:
+                self.add_duration(stats, duration)
+            stats['returned'] += returned_count(event.command_name, event.reply)
+            cursor_id = (event.reply.get('cursor') or {}).get('id')
+            if cursor_id:
+                self.cursors[cursor_id] = key
+            elif event.command_name == 'getMore':
+                self.cursors.pop(event.command.get('getMore'), None)     # exhausted
+
+    @staticmethod
+    def add_duration(stats, duration):
+        """Count a call; its latency replaces a random sample once the reservoir is full"""
+        stats['calls'] += 1
+        stats['total_ms'] += duration
+        stats['max_ms'] = max(stats['max_ms'], duration)
+        if len(stats['durations']) < SAMPLE_SIZE:
+            stats['durations'].append(duration)
+        else:
+            slot = random.randrange(stats['calls'])
+            if slot < SAMPLE_SIZE:
+                stats['durations'][slot] = duration
+
+    def failed(self, event):
+        with self.lock:
+            self.pending.pop((event.connection_id, event.request_id), None)
+
+    def explain(self, client, limit=20):
+        """Explain one sample of the slowest shapes (executionStats)"""
+        for key, stats in self.ranked()[:limit]:
+            database, collection, name, _ = key
+            try:
+                result = client[database].command(
+                    {'explain': stats['sample'], 'verbosity': 'executionStats'}
+                )
+            except Exception as e:
+                stats['explain'] = {'error': str(e)[:200]}
+                continue
+            stages = plan_stages(find_key(result, 'winningPlan') or result)
+            stats['explain'] = {
+                'docs_examined': find_key(result, 'totalDocsExamined'),
+                'keys_examined': find_key(result, 'totalKeysExamined'),
+                'n_returned': find_key(result, 'nReturned'),
+                'stages': stages,
+                'collscan': 'COLLSCAN' in stages,
+            }
+
+    def ranked(self):
+        """(key, stats) by total time, slowest first"""
+        with self.lock:
+            items = [(key, stats) for key, stats in self.shapes.items() if stats['calls']]
+        return sorted(items, key=lambda item: -(item[1]['total_ms'] + item[1]['cursor_ms']))
+
+    def report(self):
+        """Report rows, slowest shapes first"""
+        rows = []
+        for (database, collection, name, shape), stats in self.ranked():
+            durations = sorted(stats['durations'])
+            calls = stats['calls']
+            total = stats['total_ms'] + stats['cursor_ms']
+            row = {
+                'collection': f"{database}.{collection}",
+                'command': name,
+                'shape': json.loads(shape),
+                'calls': calls,
+                'total_ms': round(total, 1),
+                'getmore_ms': round(stats['cursor_ms'], 1),
+                'avg_ms': round(total / calls, 2),
+                'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'returned_per_call': round(stats['returned'] / calls, 1),
+            }
+            if stats['explain']:
+                row['explain'] = stats['explain']
+            rows.append(row)
+        return rows
+
+    def print_report(self, limit=15, save=True):
+        """Print the ranked report (and save it as JSON)"""
+        rows = self.report()
+        if not rows:
+            return
+        print("\n" + "=" * 60)
+        print("QUERY PROFILE (slowest query shapes first)")
+        print("=" * 60)
+        for i, row in enumerate(rows[:limit], 1):
+            flags = []
+            explain = row.get('explain') or {}
+            if explain.get('collscan'):
+                flags.append('COLLSCAN - missing index?')
+            if row['avg_ms'] >= SLOW_MS:
+                flags.append('SLOW')
+            print(f"{i:2d}. {row['collection']} {row['command']} {json.dumps(row['shape'])[:80]}")
+            print(f"    {row['calls']:,} calls | total {row['total_ms'] / 1000:.2f}s | avg {row['avg_ms']}ms | "
+                  f"p95 {row['p95_ms']}ms | returned/call {row['returned_per_call']}")
+            if explain and 'error' not in explain:
+                print(f"    examined: {explain['docs_examined']} docs, {explain['keys_examined']} keys | "
+                      f"plan: {' > '.join(explain['stages'])}")
+            if flags:
+                print(f"    ⚠ {', '.join(flags)}")
+        print("=" * 60)
+
+        if save:
+            filename = f"query_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2, default=str)
+            print(f"Profile saved to {filename}")
@@ -0,0 +1,250 @@
+"""
+In-process product text search
+Accent-folded, Spanish-aware index over name, brand and category with exact,
+prefix and typo-tolerant matching:
+
+    "galletas marias"  -> Galletas Marías      (accents folded, plurals stemmed)
+    "cocacol"          -> Coca-Cola            (joined words + prefix)
+    "galetas"          -> Galletas             (trigram similarity)
+
+The vocabulary is a sorted array: prefixes are contiguous ranges found by
+binary search, typos are resolved through a trigram -> term map over the
+vocabulary (not over documents), and each term has a posting list of
+(document, field) entries. Indexes are saved as gzip'd JSON.
+"""
+
+import gzip
+import heapq
+import json
+import re
+import sys
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+FORMAT_VERSION = 1
+
+# name matches count most, then brand, then category
+FIELDS = ('name', 'brand', 'category')
+FIELD_WEIGHTS = (1.0, 0.8, 0.6)
+
+# Weight of each kind of term match
+EXACT, PREFIX, FUZZY = 3.0, 2.0, 1.5
+MIN_SIMILARITY = 0.45
+MAX_EXPANSIONS = 40
+
+# Document fields kept for displaying results
+DOC_FIELDS = ('store', 'sku', 'ean13', 'name', 'brand', 'category', 'price', 'currency')
+
+STOPWORDS = {
+    'de', 'del', 'la', 'las', 'el', 'los', 'y', 'e', 'o', 'u', 'con', 'sin', 'para',
+    'por', 'en', 'a', 'al', 'un', 'una', 'unos', 'unas',
+}
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def fold(text):
+    """Lowercase and strip accents (Marías -> marias, Piña -> pina)"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def stem(word):
+    """Light Spanish plural stemming (galletas -> galleta, limones -> limon)"""
+    if word.isdigit() or len(word) <= 3:
+        return word
+    if word.endswith('ces') and len(word) > 4:
+        return word[:-3] + 'z'   # nueces -> nuez
+    if word.endswith('es') and len(word) > 4 and word[-3] not in 'aeiou':
+        return word[:-2]         # limones -> limon, panes -> pan
+    if word.endswith('s') and word[-2] in 'aeiou':
+        return word[:-1]         # galletas -> galleta
+    return word
+
+
+def tokenize(text):
+    """Folded, stemmed terms of a text (stopwords dropped)"""
+    return [stem(word) for word in _WORD.findall(fold(text)) if word not in STOPWORDS]
+
+
+def trigrams(term):
+    """Trigrams of a padded term"""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Term/prefix/trigram index over product text fields"""
+
+    def __init__(self):
+        self.docs = []          # compact result records
+        self.vocab = []         # sorted terms
+        self.postings = []      # term index -> array of doc * 4 + field
+        self.grams = {}         # trigram -> array of term indexes
+
+    def build(self, products):
+        """Index an iterable of product documents"""
+        terms = defaultdict(list)
+        for product in products:
+            doc = len(self.docs)
+            self.docs.append({k: product[k] for k in DOC_FIELDS if k in product})
+            for field, name in enumerate(FIELDS):
+                words = tokenize(product.get(name, ''))
+                seen = set(words)
+                # Adjacent words joined, so "cocacola" finds "Coca-Cola"
+                seen.update(a + b for a, b in zip(words, words[1:]))
+                for term in seen:
+                    terms[term].append(doc * 4 + field)
+
+        self.vocab = sorted(terms)
+        self.postings = [array('I', terms[term]) for term in self.vocab]
+        self._build_grams()
+        return self
+
+    def _build_grams(self):
+        grams = defaultdict(list)
+        for i, term in enumerate(self.vocab):
+            if len(term) >= 3 and not term.isdigit():
+                for gram in trigrams(term):
+                    grams[gram].append(i)
+        self.grams = {gram: array('I', ids) for gram, ids in grams.items()}
+
+    # -- matching ------------------------------------------------------------
+
+    def _term_id(self, term):
+        i = bisect_left(self.vocab, term)
+        return i if i < len(self.vocab) and self.vocab[i] == term else None
+
+    def _prefix_ids(self, prefix):
+        lo = bisect_left(self.vocab, prefix)
+        hi = bisect_left(self.vocab, prefix + '\uffff', lo)
+        return range(lo, min(hi, lo + MAX_EXPANSIONS))
+
+    def _similar_ids(self, term):
+        """Vocabulary terms sharing enough trigrams with term"""
+        query = trigrams(term)
+        counts = defaultdict(int)
+        for gram in query:
+            for i in self.grams.get(gram, ()):
+                counts[i] += 1
+        similar = []
+        for i, shared in counts.items():
+            other = len(self.vocab[i]) + 2   # trigram count of a padded term
+            similarity = shared / (len(query) + other - shared)
+            if similarity >= MIN_SIMILARITY:
+                similar.append((similarity, i))
+        return heapq.nlargest(MAX_EXPANSIONS, similar)
+
+    def _match_term(self, term, last):
+        """doc -> best score for one query term"""
+        scores = {}
+
+        def add(term_id, weight):
+            for entry in self.postings[term_id]:
+                doc, field = divmod(entry, 4)
+                score = weight * FIELD_WEIGHTS[field]
+                if score > scores.get(doc, 0):
+                    scores[doc] = score
+
+        exact = self._term_id(term)
+        if exact is not None:
+            add(exact, EXACT)
+        # Prefixes for every term of 3+ letters, and for the last (being typed) one
+        if len(term) >= 3 or (last and len(term) >= 2):
+            for i in self._prefix_ids(term):
+                if i != exact:
+                    add(i, PREFIX)
+        if exact is None and len(term) >= 4 and not term.isdigit():
+            for similarity, i in self._similar_ids(term):
+                add(i, FUZZY * similarity)
+        return scores
+
+    def search(self, query, limit=10):
+        """Ranked results: documents matching most query terms, best scores first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        matched = defaultdict(int)
+        totals = defaultdict(float)
+        for position, term in enumerate(terms):
+            for doc, score in self._match_term(term, position == len(terms) - 1).items():
+                matched[doc] += 1
+                totals[doc] += score
+
+        top = heapq.nlargest(limit, totals, key=lambda doc: (matched[doc], totals[doc]))
+        return [dict(self.docs[doc], score=round(totals[doc], 3), matched=matched[doc]) for doc in top]
+
+    # -- persistence ---------------------------------------------------------
+
+    def save(self, path):
+        """Write the index as gzip'd JSON"""
+        data = {
+            'version': FORMAT_VERSION,
+            'built_at': time.time(),
+            'docs': self.docs,
+            'vocab': self.vocab,
+            'postings': [p.tolist() for p in self.postings],
+        }
+        with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save()"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version: {data.get('version')}")
+        index = cls()
+        index.docs = data['docs']
+        index.vocab = data['vocab']
+        index.postings = [array('I', p) for p in data['postings']]
+        index._build_grams()
+        return index
+
+
+def build_from_collection(collection):
+    """Build an index from the products collection"""
+    projection = {'_id': 0}
+    projection.update({field: 1 for field in DOC_FIELDS})
+    return SearchIndex().build(collection.find({}, projection).batch_size(1000))
+
+
+def main():
+    """Main execution"""
+    args = sys.argv[1:]
+    if not args or '--help' in args:
+        print("Usage:")
+        print("  python search_index.py build <mongo|snapshot.json> [output]")
+        print("  python search_index.py query <index file> <text>")
+        return
+
+    if args[0] == 'build':
+        output = args[2] if len(args) > 2 else 'search_index.json.gz'
+        start_time = time.time()
+        if args[1] == 'mongo':
+            from db import get_collection
+            index = build_from_collection(get_collection())
+        else:
+            with open(args[1], 'r', encoding='utf-8') as f:
+                index = SearchIndex().build(json.load(f))
+        index.save(output)
+        print(f"✓ Indexed {len(index.docs):,} products ({len(index.vocab):,} terms) "
+              f"in {time.time() - start_time:.2f}s -> {output}")
+    elif args[0] == 'query':
+        index = SearchIndex.load(args[1])
+        start_time = time.time()
+        results = index.search(' '.join(args[2:]))
+        elapsed = (time.time() - start_time) * 1000
+        for i, r in enumerate(results, 1):
+            print(f"{i:2d}. {r.get('name', '')[:50]:50s} | {r.get('brand', '')[:15]:15s} | "
+                  f"{r.get('store', '')} | {r['score']}")
+        print(f"\n{len(results)} results in {elapsed:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1011 @@
+"""
+Embedded SQLite catalog backend
+A small pymongo-compatible facade (client -> database -> collection) over one
+SQLite file, so the scraper, importer and manage_db run without a MongoDB
+server. Select it with a sqlite URI, e.g. MONGODB_URI=sqlite:///catalog.db
+
+Documents are stored as JSON. Indexes map to SQLite expression indexes,
+array fields listed in MULTIKEY_FIELDS (the barcode `codes` array) get a side
+table, and text indexes are FTS5 tables with accent folding. Filters are
+pushed down to SQL where an index can answer them; everything is then checked
+with the same matching rules MongoDB uses, so results are identical.
+
+Supported: find/find_one (sort, skip, limit, projection, $text score),
+count_documents, distinct, insert/update/replace/delete (one and many, upserts,
+$set/$unset/$setOnInsert/$inc), bulk_write with pymongo operation objects,
+create/drop/list indexes, rename and the aggregation stages the tools use
+($match, $project, $set, $group, $count, $sort, $skip, $limit, $facet,
+$bucketAuto, $out, $merge). Write concerns are accepted and ignored.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import uuid
+
+MULTIKEY_FIELDS = {'codes'}
+
+
+class OperationFailure(Exception):
+    """Query or update the backend can't run"""
+
+
+class DuplicateKeyError(OperationFailure):
+    """Unique index violation"""
+
+
+class UpdateResult:
+    def __init__(self, matched_count=0, modified_count=0, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+class DeleteResult:
+    def __init__(self, deleted_count=0):
+        self.deleted_count = deleted_count
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+        self.deleted_count = 0
+
+
+# ---------------------------------------------------------------------------
+# Document helpers (MongoDB semantics)
+# ---------------------------------------------------------------------------
+
+_MISSING = object()
+
+
+def _dumps(doc):
+    return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+def _get_path(doc, path):
+    """Value at a dotted path, or _MISSING"""
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _type_rank(value):
+    if value is None or value is _MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 4
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    return 5
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 0:
+        return (0, 0)
+    if rank in (1, 2, 4):
+        return (rank, value)
+    return (rank, _dumps(value))
+
+
+def _eq(value, target):
+    if target is None:
+        return value is _MISSING or value is None
+    if value is _MISSING:
+        return False
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    if isinstance(value, list) and isinstance(target, list):
+        return value == target or target in value
+    return value == target
+
+
+def _compare(value, target, op):
+    values = value if isinstance(value, list) else [value]
+    for item in values:
+        if item is _MISSING or _type_rank(item) != _type_rank(target):
+            continue
+        if ((op == '$gt' and item > target) or (op == '$gte' and item >= target) or
+                (op == '$lt' and item < target) or (op == '$lte' and item <= target)):
+            return True
+    return False
+
+
+def _regex(cond, options=''):
+    if isinstance(cond, re.Pattern):
+        return cond
+    flags = 0
+    for char in options or '':
+        flags |= {'i': re.I, 'm': re.M, 's': re.S, 'x': re.X}.get(char, 0)
+    return re.compile(cond, flags)
+
+
+def _match_regex(value, pattern):
+    values = value if isinstance(value, list) else [value]
+    return any(isinstance(item, str) and pattern.search(item) for item in values)
+
+
+def _match_value(value, cond):
+    if isinstance(cond, re.Pattern):
+        return _match_regex(value, cond)
+    if not (isinstance(cond, dict) and cond and all(k.startswith('$') for k in cond)):
+        return _eq(value, cond)
+
+    for op, arg in cond.items():
+        if op == '$eq':
+            ok = _eq(value, arg)
+        elif op == '$ne':
+            ok = not _eq(value, arg)
+        elif op == '$in':
+            ok = any(_match_regex(value, a) if isinstance(a, re.Pattern) else _eq(value, a) for a in arg)
+        elif op == '$nin':
+            ok = not any(_eq(value, a) for a in arg)
+        elif op == '$exists':
+            ok = (value is not _MISSING) == bool(arg)
+        elif op in ('$gt', '$gte', '$lt', '$lte'):
+            ok = _compare(value, arg, op)
+        elif op == '$regex':
+            ok = _match_regex(value, _regex(arg, cond.get('$options', '')))
+        elif op == '$options':
+            continue
+        elif op == '$size':
+            ok = isinstance(value, list) and len(value) == arg
+        elif op == '$all':
+            ok = isinstance(value, list) and all(a in value for a in arg)
+        elif op == '$not':
+            ok = not _match_value(value, arg)
+        else:
+            raise OperationFailure(f"Unsupported query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, query):
+    """MongoDB filter matching on a plain document"""
+    for key, cond in (query or {}).items():
+        if key == '$or':
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, q) for q in cond):
+                return False
+        elif key == '$text':
+            continue  # answered by the FTS table
+        elif not _match_value(_get_path(doc, key), cond):
+            return False
+    return True
+
+
+def apply_update(doc, update, inserting=False):
+    """Apply an update document; returns the new document"""
+    if not any(key.startswith('$') for key in update):
+        new = dict(update)
+        if '_id' in doc:
+            new['_id'] = doc['_id']
+        return new
+
+    new = json.loads(_dumps(doc))
+    for op, fields in update.items():
+        if op == '$set' or (op == '$setOnInsert' and inserting):
+            for path, value in fields.items():
+                _set_path(new, path, value)
+        elif op == '$setOnInsert':
+            continue
+        elif op == '$unset':
+            for path in fields:
+                _unset_path(new, path)
+        elif op == '$inc':
+            for path, amount in fields.items():
+                current = _get_path(new, path)
+                _set_path(new, path, (0 if current is _MISSING else current) + amount)
+        else:
+            raise OperationFailure(f"Unsupported update operator {op}")
+    return new
+
+
+def _upsert_seed(query):
+    """Fields an upsert copies from its filter"""
+    seed = {}
+    for key, cond in query.items():
+        if key.startswith('$'):
+            continue
+        if isinstance(cond, dict) and any(k.startswith('$') for k in cond):
+            if '$eq' in cond:
+                _set_path(seed, key, cond['$eq'])
+            continue
+        if not isinstance(cond, re.Pattern):
+            _set_path(seed, key, cond)
+    return seed
+
+
+def project(doc, projection, score=None):
+    """Apply an inclusion or exclusion projection"""
+    if not projection:
+        return doc
+    meta = {k for k, v in projection.items() if isinstance(v, dict) and v.get('$meta') == 'textScore'}
+    plain = {k: v for k, v in projection.items() if k not in meta}
+    include = [k for k, v in plain.items() if v and k != '_id']
+
+    if include:
+        result = {}
+        if plain.get('_id', 1) and '_id' in doc:
+            result['_id'] = doc['_id']
+        for path in include:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(result, path, value)
+    else:
+        result = json.loads(_dumps(doc))
+        for path, flag in plain.items():
+            if not flag:
+                _unset_path(result, path)
+    for key in meta:
+        result[key] = score or 0.0
+    return result
+
+
+def _index_name(keys):
+    return '_'.join(f"{field}_{direction}" for field, direction in keys)
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _json_path(field):
+    return '$.' + '.'.join('"' + part.replace('"', '') + '"' for part in field.split('.'))
+
+
+def _expr(field):
+    return f"json_extract(doc, '{_json_path(field)}')"
+
+
+def _sql_scalar(value):
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+# ---------------------------------------------------------------------------
+# Aggregation expressions
+# ---------------------------------------------------------------------------
+
+def _eval(expr, doc):
+    if isinstance(expr, str) and expr.startswith('$'):
+        value = _get_path(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, dict):
+        return {k: _eval(v, doc) for k, v in expr.items()}
+    return expr
+
+
+def _group(docs, spec):
+    groups = {}
+    order = []
+    for doc in docs:
+        key = _eval(spec['_id'], doc)
+        marker = _dumps(key)
+        if marker not in groups:
+            groups[marker] = {'_id': key, '__values': {}}
+            order.append(marker)
+        values = groups[marker]['__values']
+        for field, acc in spec.items():
+            if field == '_id':
+                continue
+            (op, arg), = acc.items()
+            values.setdefault(field, (op, []))[1].append(_eval(arg, doc))
+
+    results = []
+    for marker in order:
+        group = groups[marker]
+        row = {'_id': group['_id']}
+        for field, (op, items) in group['__values'].items():
+            numbers = [v for v in items if isinstance(v, (int, float)) and not isinstance(v, bool)]
+            present = [v for v in items if v is not None]
+            if op == '$sum':
+                row[field] = sum(numbers)
+            elif op == '$avg':
+                row[field] = sum(numbers) / len(numbers) if numbers else None
+            elif op == '$min':
+                row[field] = min(present, key=_sort_key) if present else None
+            elif op == '$max':
+                row[field] = max(present, key=_sort_key) if present else None
+            elif op == '$first':
+                row[field] = items[0]
+            elif op == '$last':
+                row[field] = items[-1]
+            elif op == '$push':
+                row[field] = items
+            elif op == '$addToSet':
+                row[field] = list({_dumps(v): v for v in items}.values())
+            else:
+                raise OperationFailure(f"Unsupported accumulator {op}")
+        results.append(row)
+    return results
+
+
+def _sort_docs(docs, keys):
+    docs = list(docs)
+    for field, direction in reversed(keys):
+        if isinstance(direction, dict):
+            docs.sort(key=lambda d: d.get(field) or 0.0, reverse=True)
+        else:
+            docs.sort(key=lambda d, f=field: _sort_key(_get_path(d, f)), reverse=direction == -1)
+    return docs
+
+
+def _sort_spec(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+def _bucket_auto(docs, spec):
+    values = sorted((_eval(spec['groupBy'], d) for d in docs), key=_sort_key)
+    if not values:
+        return []
+    buckets = max(1, min(spec['buckets'], len(values)))
+    size = -(-len(values) // buckets)
+    results = []
+    for i in range(0, len(values), size):
+        chunk = values[i:i + size]
+        upper = values[i + size] if i + size < len(values) else chunk[-1]
+        results.append({'_id': {'min': chunk[0], 'max': upper}, 'count': len(chunk)})
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Collections
+# ---------------------------------------------------------------------------
+
+class Cursor:
+    """Lazy find() result supporting sort/skip/limit/batch_size"""
+
+    def __init__(self, collection, query, projection):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        docs = []
+        for _, doc, score in self.collection._select(self.query):
+            if score is not None:
+                doc['__score'] = score
+            docs.append(doc)
+
+        if self._sort:
+            meta = [k for k, d in self._sort if isinstance(d, dict)]
+            for doc in docs:
+                for key in meta:
+                    doc[key] = doc.get('__score', 0.0)
+            docs = _sort_docs(docs, self._sort)
+        if self._skip:
+            docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+
+        for doc in docs:
+            score = doc.pop('__score', None)
+            yield project(doc, self.projection, score)
+
+
+class SQLiteCollection:
+    """MongoDB-style collection stored in one SQLite table"""
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._lock = database._lock
+        self._conn = database._conn
+        self.table = _quote('c_' + name)
+
+    # -- storage -----------------------------------------------------------
+
+    def _exists(self):
+        return self.database._has_collection(self.name)
+
+    def _create(self):
+        if self._exists():
+            return
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            f"(id INTEGER PRIMARY KEY, _key TEXT UNIQUE NOT NULL, doc TEXT NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO _collections (name) VALUES (?)", (self.name,))
+
+    def _indexes(self):
+        cache = self.database.client._index_cache
+        if self.name not in cache:
+            rows = self._conn.execute(
+                "SELECT name, spec FROM _indexes WHERE collection = ?", (self.name,)
+            ).fetchall()
+            cache[self.name] = {name: json.loads(spec) for name, spec in rows}
+        return cache[self.name]
+
+    def _side_table(self, field):
+        return _quote(f"m_{self.name}__{field}")
+
+    def _fts_table(self):
+        return _quote(f"t_{self.name}")
+
+    def _multikey_fields(self):
+        return {spec['key'][0][0] for spec in self._indexes().values()
+                if spec.get('multikey')}
+
+    def _text_fields(self):
+        for spec in self._indexes().values():
+            if spec.get('text'):
+                return [field for field, _ in spec['key']]
+        return None
+
+    def _write_row(self, doc, row_id=None):
+        """Insert or replace a document and maintain side/FTS tables"""
+        key = _dumps(doc['_id'])
+        try:
+            if row_id is None:
+                cur = self._conn.execute(f"INSERT INTO {self.table} (_key, doc) VALUES (?, ?)", (key, _dumps(doc)))
+                row_id = cur.lastrowid
+            else:
+                self._conn.execute(f"UPDATE {self.table} SET _key = ?, doc = ? WHERE id = ?", (key, _dumps(doc), row_id))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e))
+
+        for field in self._multikey_fields():
+            table = self._side_table(field)
+            self._conn.execute(f"DELETE FROM {table} WHERE doc_id = ?", (row_id,))
+            value = _get_path(doc, field)
+            values = value if isinstance(value, list) else [] if value is _MISSING else [value]
+            self._conn.executemany(
+                f"INSERT INTO {table} (doc_id, value) VALUES (?, ?)",
+                [(row_id, v) for v in set(values) if _sql_scalar(v)]
+            )
+
+        text_fields = self._text_fields()
+        if text_fields:
+            fts = self._fts_table()
+            self._conn.execute(f"DELETE FROM {fts} WHERE rowid = ?", (row_id,))
+            texts = [str(_get_path(doc, f)) if _get_path(doc, f) not in (_MISSING, None) else '' for f in text_fields]
+            self._conn.execute(
+                f"INSERT INTO {fts} (rowid, {', '.join(_quote(f) for f in text_fields)}) "
+                f"VALUES (?, {', '.join('?' for _ in text_fields)})",
+                [row_id] + texts
+            )
+        return row_id
+
+    def _delete_rows(self, row_ids):
+        for row_id in row_ids:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (row_id,))
+            for field in self._multikey_fields():
+                self._conn.execute(f"DELETE FROM {self._side_table(field)} WHERE doc_id = ?", (row_id,))
+            if self._text_fields():
+                self._conn.execute(f"DELETE FROM {self._fts_table()} WHERE rowid = ?", (row_id,))
+
+    def _pushdown(self, query):
+        """SQL conditions for the parts of a filter an index/json_extract can answer"""
+        clauses = []
+        params = []
+        multikey = self._multikey_fields()
+        for key, cond in query.items():
+            if key == '$text':
+                if not self._text_fields():
+                    raise OperationFailure("text index required for $text query")
+                continue
+            if key.startswith('$'):
+                continue
+            plain = not (isinstance(cond, dict) and any(k.startswith('$') for k in cond))
+            values = None
+            if plain and _sql_scalar(cond):
+                values = [cond]
+            elif not plain and set(cond) == {'$in'} and all(_sql_scalar(v) for v in cond['$in']):
+                values = list(cond['$in'])
+            if values is None:
+                continue
+            if not values:
+                clauses.append('0')
+                continue
+            marks = ', '.join('?' for _ in values)
+            if key == '_id':
+                clauses.append(f"_key IN ({marks})")
+                params.extend(_dumps(v) for v in values)
+            elif key in multikey:
+                clauses.append(f"id IN (SELECT doc_id FROM {self._side_table(key)} WHERE value IN ({marks}))")
+                params.extend(values)
+            elif key in MULTIKEY_FIELDS:
+                continue  # array field without its side table: json_extract can't match members
+            else:
+                clauses.append(f"{_expr(key)} IN ({marks})")
+                params.extend(values)
+        return clauses, params
+
+    def _select(self, query, limit=None):
+        """(row id, document, text score) for documents matching a filter"""
+        query = query or {}
+        with self._lock:
+            if not self._exists():
+                if '$text' in query:
+                    raise OperationFailure("text index required for $text query")
+                return []
+            clauses, params = self._pushdown(query)
+            if '$text' in query:
+                terms = re.findall(r'"[^"]+"|\S+', query['$text']['$search'])
+                match = ' OR '.join('"' + t.strip('"').replace('"', '""') + '"' for t in terms if t.strip('"'))
+                if not match:
+                    return []
+                fts = self._fts_table()
+                sql = (f"SELECT c.id, c.doc, -bm25({fts}) FROM {self.table} c "
+                       f"JOIN {fts} ON {fts}.rowid = c.id WHERE {fts} MATCH ?")
+                params = [match] + params
+                if clauses:
+                    sql += ' AND ' + ' AND '.join(clauses)
+            else:
+                sql = f"SELECT id, doc, NULL FROM {self.table}"
+                if clauses:
+                    sql += ' WHERE ' + ' AND '.join(clauses)
+            rows = self._conn.execute(sql, params).fetchall()
+
+        results = []
+        for row_id, text, score in rows:
+            doc = json.loads(text)
+            if matches(doc, query):
+                results.append((row_id, doc, score))
+                if limit and len(results) >= limit:
+                    break
+        return results
+
+    # -- reads -------------------------------------------------------------
+
+    def find(self, filter=None, projection=None, **kwargs):
+        cursor = Cursor(self, filter, projection)
+        if kwargs.get('sort'):
+            cursor.sort(kwargs['sort'])
+        if kwargs.get('limit'):
+            cursor.limit(kwargs['limit'])
+        return cursor
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        for doc in self.find(filter, projection, **kwargs).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter, **kwargs):
+        if not filter:
+            return self.estimated_document_count()
+        return len(self._select(filter))
+
+    def estimated_document_count(self, **kwargs):
+        with self._lock:
+            if not self._exists():
+                return 0
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def distinct(self, key, filter=None, **kwargs):
+        seen = {}
+        for _, doc, _ in self._select(filter or {}):
+            value = _get_path(doc, key)
+            for item in (value if isinstance(value, list) else [value]):
+                if item is not _MISSING:
+                    seen.setdefault(_dumps(item), item)
+        return list(seen.values())
+
+    # -- writes ------------------------------------------------------------
+
+    def insert_one(self, document, **kwargs):
+        with self._lock:
+            self._create()
+            document.setdefault('_id', uuid.uuid4().hex)
+            self._write_row(document)
+        return InsertOneResult(document['_id'])
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        ids = []
+        with self.database._transaction():
+            for document in documents:
+                ids.append(self.insert_one(document).inserted_id)
+        return InsertManyResult(ids)
+
+    def _update(self, filter, update, upsert=False, multi=False):
+        with self._lock:
+            self._create()
+            found = self._select(filter, limit=None if multi else 1)
+            if not found:
+                if not upsert:
+                    return UpdateResult()
+                doc = apply_update(_upsert_seed(filter), update, inserting=True)
+                if '_id' not in doc:
+                    doc['_id'] = _upsert_seed(filter).get('_id', uuid.uuid4().hex)
+                self._write_row(doc)
+                return UpdateResult(upserted_id=doc['_id'])
+
+            modified = 0
+            for row_id, doc, _ in found:
+                new = apply_update(doc, update)
+                if new != doc:
+                    self._write_row(new, row_id)
+                    modified += 1
+            return UpdateResult(len(found), modified)
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        return self._update(filter, update, upsert=upsert)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        with self.database._transaction():
+            return self._update(filter, update, upsert=upsert, multi=True)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        if any(key.startswith('$') for key in replacement):
+            raise OperationFailure("replacement document must not contain update operators")
+        return self._update(filter, replacement, upsert=upsert)
+
+    def _delete(self, filter, multi):
+        with self._lock:
+            if not self._exists():
+                return DeleteResult()
+            if not filter and multi:
+                count = self.estimated_document_count()
+                self.database.drop_collection(self.name, keep_indexes=True)
+                return DeleteResult(count)
+            found = self._select(filter, limit=None if multi else 1)
+            self._delete_rows([row_id for row_id, _, _ in found])
+            return DeleteResult(len(found))
+
+    def delete_one(self, filter, **kwargs):
+        return self._delete(filter, multi=False)
+
+    def delete_many(self, filter, **kwargs):
+        with self.database._transaction():
+            return self._delete(filter, multi=True)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        """Run pymongo operation objects (InsertOne, UpdateOne, ...) in one transaction"""
+        result = BulkWriteResult()
+        with self.database._transaction():
+            for op in requests:
+                kind = type(op).__name__
+                if kind == 'InsertOne':
+                    self.insert_one(op._doc)
+                    result.inserted_count += 1
+                    continue
+                if kind in ('DeleteOne', 'DeleteMany'):
+                    result.deleted_count += self._delete(op._filter, multi=kind == 'DeleteMany').deleted_count
+                    continue
+                if kind not in ('UpdateOne', 'UpdateMany', 'ReplaceOne'):
+                    raise OperationFailure(f"Unsupported bulk operation {kind}")
+                outcome = self._update(op._filter, op._doc, upsert=bool(op._upsert), multi=kind == 'UpdateMany')
+                result.matched_count += outcome.matched_count
+                result.modified_count += outcome.modified_count
+                result.upserted_count += outcome.upserted_id is not None
+        return result
+
+    # -- indexes -----------------------------------------------------------
+
+    def create_index(self, keys, unique=False, name=None, **kwargs):
+        keys = _sort_spec(keys, 1) if isinstance(keys, str) else [tuple(k) for k in keys]
+        name = name or _index_name(keys)
+        with self._lock, self.database._transaction():
+            self._create()
+            if name in self._indexes():
+                return name
+
+            spec = {'key': keys, 'unique': bool(unique)}
+            table_name = 'c_' + self.name
+            if any(direction == 'text' for _, direction in keys):
+                if self._text_fields():
+                    raise OperationFailure("only one text index per collection")
+                spec['text'] = True
+                columns = ', '.join(_quote(field) for field, _ in keys)
+                self._conn.execute(
+                    f"CREATE VIRTUAL TABLE {self._fts_table()} USING fts5({columns}, "
+                    f"tokenize='unicode61 remove_diacritics 2')"
+                )
+            elif len(keys) == 1 and keys[0][0] in MULTIKEY_FIELDS:
+                spec['multikey'] = True
+                table = self._side_table(keys[0][0])
+                self._conn.execute(f"CREATE TABLE {table} (doc_id INTEGER NOT NULL, value NOT NULL)")
+                self._conn.execute(f"CREATE INDEX {_quote(f'{table_name}__{name}')} ON {table} (value, doc_id)")
+            else:
+                columns = ', '.join(_expr(field) + (' DESC' if direction == -1 else '') for field, direction in keys)
+                try:
+                    self._conn.execute(
+                        f"CREATE {'UNIQUE ' if unique else ''}INDEX {_quote(f'{table_name}__{name}')} "
+                        f"ON {self.table} ({columns})"
+                    )
+                except sqlite3.IntegrityError as e:
+                    raise DuplicateKeyError(str(e))
+
+            self._conn.execute(
+                "INSERT INTO _indexes (collection, name, spec) VALUES (?, ?, ?)",
+                (self.name, name, json.dumps(spec))
+            )
+            self.database.client._index_cache.pop(self.name, None)
+            if spec.get('text') or spec.get('multikey'):
+                for row_id, text in self._conn.execute(f"SELECT id, doc FROM {self.table}").fetchall():
+                    self._write_row(json.loads(text), row_id)
+        return name
+
+    def create_indexes(self, models):
+        return [self.create_index(m.document['key'].items(), **{k: v for k, v in m.document.items()
+                                                                  if k not in ('key', 'name')})
+                for m in models]
+
+    def index_information(self):
+        with self._lock:
+            info = {'_id_': {'key': [('_id', 1)]}}
+            if not self._exists():
+                return {}
+            for name, spec in self._indexes().items():
+                info[name] = {'key': [tuple(k) for k in spec['key']]}
+                if spec.get('unique'):
+                    info[name]['unique'] = True
+            return info
+
+    def drop_index(self, name):
+        with self._lock, self.database._transaction():
+            spec = self._indexes().get(name)
+            if spec is None:
+                raise OperationFailure(f"index not found with name [{name}]")
+            if spec.get('text'):
+                self._conn.execute(f"DROP TABLE IF EXISTS {self._fts_table()}")
+            elif spec.get('multikey'):
+                self._conn.execute(f"DROP TABLE IF EXISTS {self._side_table(spec['key'][0][0])}")
+            else:
+                self._conn.execute(f"DROP INDEX IF EXISTS {_quote('c_' + self.name + '__' + name)}")
+            self._conn.execute("DELETE FROM _indexes WHERE collection = ? AND name = ?", (self.name, name))
+            self.database.client._index_cache.pop(self.name, None)
+
+    def drop_indexes(self):
+        for name in list(self._indexes()):
+            self.drop_index(name)
+
+    # -- collection level --------------------------------------------------
+
+    def drop(self):
+        self.database.drop_collection(self.name)
+
+    def rename(self, new_name, dropTarget=False, **kwargs):
+        """Atomically replace new_name with this collection (one transaction)"""
+        with self._lock, self.database._transaction():
+            if not self._exists():
+                raise OperationFailure(f"source namespace {self.name} does not exist")
+            if self.database._has_collection(new_name):
+                if not dropTarget:
+                    raise OperationFailure(f"target namespace {new_name} exists")
+                self.database.drop_collection(new_name)
+            target = self.database[new_name]
+            target._create()
+            self._conn.execute(f"INSERT INTO {target.table} (id, _key, doc) SELECT id, _key, doc FROM {self.table}")
+            for name, spec in self._indexes().items():
+                target.create_index([tuple(k) for k in spec['key']], unique=spec.get('unique', False), name=name)
+            self.database.drop_collection(self.name)
+
+    def aggregate(self, pipeline, **kwargs):
+        stages = list(pipeline)
+        if stages and '$match' in stages[0]:
+            docs = [doc for _, doc, _ in self._select(stages.pop(0)['$match'])]
+        else:
+            docs = [doc for _, doc, _ in self._select({})]
+        return iter(self.database._run_pipeline(docs, stages))
+
+
+class SQLiteDatabase:
+    """MongoDB-style database: a namespace of collections in one SQLite file"""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._conn = client._conn
+        self._lock = client._lock
+
+    def __getitem__(self, name):
+        return SQLiteCollection(self, name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name, **kwargs):
+        return self[name]
+
+    def _has_collection(self, name):
+        return self._conn.execute("SELECT 1 FROM _collections WHERE name = ?", (name,)).fetchone() is not None
+
+    def _transaction(self):
+        return self.client._transaction()
+
+    def list_collection_names(self, **kwargs):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM _collections ORDER BY name")]
+
+    def drop_collection(self, name, keep_indexes=False):
+        with self._lock, self._transaction():
+            collection = self[name]
+            if not self._has_collection(name):
+                return
+            indexes = collection._indexes()
+            self._conn.execute(f"DROP TABLE IF EXISTS {collection.table}")
+            self._conn.execute(f"DROP TABLE IF EXISTS {collection._fts_table()}")
+            for spec in indexes.values():
+                if spec.get('multikey'):
+                    self._conn.execute(f"DROP TABLE IF EXISTS {collection._side_table(spec['key'][0][0])}")
+            self._conn.execute("DELETE FROM _indexes WHERE collection = ?", (name,))
+            self.client._index_cache.pop(name, None)
+            self._conn.execute("DELETE FROM _collections WHERE name = ?", (name,))
+            if keep_indexes:
+                for index_name, spec in indexes.items():
+                    collection.create_index([tuple(k) for k in spec['key']],
+                                            unique=spec.get('unique', False), name=index_name)
+
+    def command(self, command, *args, **kwargs):
+        if command == 'ping' or command == {'ping': 1}:
+            return {'ok': 1.0}
+        raise OperationFailure(f"Unsupported command {command}")
+
+    def _run_pipeline(self, docs, stages):
+        for stage in stages:
+            (op, spec), = stage.items()
+            if op == '$match':
+                docs = [d for d in docs if matches(d, spec)]
+            elif op == '$project':
+                computed = {k: v for k, v in spec.items() if isinstance(v, (str, dict))}
+                docs = [dict(project(d, {k: v for k, v in spec.items() if k not in computed}),
+                             **{k: _eval(v, d) for k, v in computed.items()}) for d in docs]
+            elif op in ('$set', '$addFields'):
+                docs = [dict(d, **{k: _eval(v, d) for k, v in spec.items()}) for d in docs]
+            elif op == '$group':
+                docs = _group(docs, spec)
+            elif op == '$count':
+                docs = [{spec: len(docs)}] if docs else []
+            elif op == '$sort':
+                docs = _sort_docs(docs, list(spec.items()))
+            elif op == '$skip':
+                docs = docs[spec:]
+            elif op == '$limit':
+                docs = docs[:spec]
+            elif op == '$facet':
+                docs = [{name: self._run_pipeline(list(docs), sub) for name, sub in spec.items()}]
+            elif op == '$bucketAuto':
+                docs = _bucket_auto(docs, spec)
+            elif op == '$out':
+                with self._transaction():
+                    target = self[spec if isinstance(spec, str) else spec['coll']]
+                    target.delete_many({})
+                    if docs:
+                        target.insert_many(docs)
+                docs = []
+            elif op == '$merge':
+                target_name = spec if isinstance(spec, str) else spec['into']
+                with self._transaction():
+                    target = self[target_name]
+                    for doc in docs:
+                        target.replace_one({'_id': doc['_id']}, doc, upsert=True)
+                docs = []
+            else:
+                raise OperationFailure(f"Unsupported aggregation stage {op}")
+        return docs
+
+
+class _Transaction:
+    """Re-entrant BEGIN/COMMIT around a block (outermost block commits)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __enter__(self):
+        self.client._lock.acquire()
+        if self.client._depth == 0:
+            self.client._conn.execute("BEGIN IMMEDIATE")
+        self.client._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.client._depth -= 1
+        try:
+            if self.client._depth == 0:
+                self.client._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.client._lock.release()
+        return False
+
+
+class SQLiteClient:
+    """MongoClient stand-in backed by one SQLite file (thread-safe)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._index_cache = {}  # collection -> index specs
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS _collections (name TEXT PRIMARY KEY)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _indexes "
+            "(collection TEXT NOT NULL, name TEXT NOT NULL, spec TEXT NOT NULL, PRIMARY KEY (collection, name))"
+        )
+
+    def __getitem__(self, name):
+        return SQLiteDatabase(self, name)
+
+    def get_database(self, name, write_concern=None, **kwargs):
+        return SQLiteDatabase(self, name)
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def sqlite_path(uri):
+    """File path of a sqlite:// URI (sqlite:///relative.db, sqlite:////abs/path.db)"""
+    if uri.startswith('sqlite:///'):
+        return uri[len('sqlite:///'):]
+    return uri[len('sqlite:'):].lstrip('/') or ':memory:'
@@ -0,0 +1,103 @@
+"""
+Crawl planner for search terms and categories
+Learns, per store and task label (search term or category), how many new
+products a task found and on which page the last new one appeared, and uses
+it on the next run:
+
+    - tasks are crawled in order of expected yield (new products per request),
+      tasks never crawled before first
+    - each task is capped a couple of pages past the depth where it last found
+      new products (the cap doubles when a task was still finding new
+      products on its last allowed page)
+    - a few low-yield tasks run uncapped each time (exploration), so a term
+      that starts matching new products is noticed
+
+With a time budget (ScrapeEngine(time_budget=...)) the productive tasks run
+first, so a short run finds more unique products. State is kept in
+crawl_plan.json next to the other scraper state files.
+"""
+
+import json
+import os
+import random
+from datetime import datetime
+
+PLAN_STATE_FILE = 'crawl_plan.json'
+MIN_PAGES = 2           # never cap a task below this
+DEPTH_MARGIN = 1        # pages allowed past the last page with new products
+EXPLORE_RATIO = 0.1     # share of the low-yield tasks crawled uncapped each run
+YIELD_WEIGHT = 0.5      # weight of the latest run in the expected yield
+
+
+class CrawlPlanner:
+    """Orders and caps the tasks of planned adapters from previous runs"""
+
+    def __init__(self, state_file=PLAN_STATE_FILE, explore_ratio=EXPLORE_RATIO):
+        self.state_file = state_file
+        self.explore_ratio = explore_ratio
+        self.state = self.load_state()
+
+    def load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        if not self.state_file:
+            return
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+
+    def cap(self, history):
+        """Page limit for a task from its history"""
+        cap = max(MIN_PAGES, history['depth'] + DEPTH_MARGIN)
+        if history.get('stopped') == 'capped' and history['depth'] >= history['pages']:
+            cap = max(cap, history['pages'] * 2)
+        return cap
+
+    def plan(self, adapter, tasks):
+        """Tasks in crawl order; sets adapter.page_limits for the capped ones"""
+        known = self.state.get(adapter.store, {})
+        fresh = [task for task in tasks if task.label not in known]
+        seen = sorted((task for task in tasks if task.label in known),
+                      key=lambda task: -known[task.label]['yield'])
+        low = seen[len(seen) // 2:]
+        explore = random.sample(low, min(len(low), max(1, round(len(low) * self.explore_ratio)))) if low else []
+        exploring = {task.label for task in explore}
+
+        adapter.page_limits = {}
+        for task in seen:
+            if task.label not in exploring:
+                adapter.page_limits[task.label] = min(adapter.max_pages, self.cap(known[task.label]))
+        ordered = fresh + explore + [task for task in seen if task.label not in exploring]
+        print(f"[INFO] {adapter.store} plan: {len(fresh)} new tasks, {len(explore)} exploring, "
+              f"{len(adapter.page_limits)} capped "
+              f"({sum(adapter.page_limits.values()):,} pages max) by expected yield")
+        return ordered
+
+    def record(self, adapter, stats):
+        """Update the history of every task the run crawled and save it"""
+        known = self.state.setdefault(adapter.store, {})
+        for label, term in stats['terms'].items():
+            if not term['pages']:
+                continue        # never started (time budget)
+            history = known.get(label)
+            run_yield = term['new'] / term['pages']
+            depth = max((i + 1 for i, new in enumerate(term['new_per_page']) if new), default=0)
+            if term['stopped'] == 'budget' and history:
+                depth = max(depth, history['depth'])    # cut short: depth is only a lower bound
+            known[label] = {
+                'runs': (history['runs'] if history else 0) + 1,
+                'yield': round(run_yield if not history else
+                               YIELD_WEIGHT * run_yield + (1 - YIELD_WEIGHT) * history['yield'], 2),
+                'new': term['new'],
+                'pages': term['pages'],
+                'depth': depth,
+                'stopped': term['stopped'],
+                'updated': datetime.now().isoformat(),
+            }
+        self.save_state()
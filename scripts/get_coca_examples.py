@@ -1,23 +1,43 @@
 import requests
 import json
+import os
+import sys
 import urllib3
 urllib3.disable_warnings()
 
-# Get one Coca-Cola product from each store via API
-response = requests.get('https://localhost:3443/api/products/all', verify=False, timeout=10)
+stores = ['Chedraui', 'La Comer', 'Papelerias Tony', 'Dulces Balu']
 
-if response.status_code == 200:
-    all_products = response.json()
-    
-    stores = ['Chedraui', 'La Comer', 'Papelerias Tony', 'Dulces Balu']
+
+def find_examples(all_products):
+    """Find first Coca-Cola product from each store"""
     examples = {}
-    
     for store in stores:
-        # Find first Coca-Cola product from this store
         for product in all_products:
             if product['store'] == store and 'coca' in product['name'].lower():
                 examples[store] = product
                 break
+    return examples
+
+
+# Offline mode: read the memory-mapped lookup file instead of the API
+# python get_coca_examples.py --offline ../product-db/barcode_lookup.bin
+if '--offline' in sys.argv:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'product-db'))
+    from lookup_file import BarcodeLookup
+
+    index = sys.argv.index('--offline')
+    lookup_path = sys.argv[index + 1] if len(sys.argv) > index + 1 else '../product-db/barcode_lookup.bin'
+    with BarcodeLookup(lookup_path) as lookup:
+        examples = find_examples(list(lookup.iter_records()))
+    print(json.dumps(examples, indent=2, ensure_ascii=False))
+    sys.exit(0)
+
+# Get one Coca-Cola product from each store via API
+response = requests.get('https://localhost:3443/api/products/all', verify=False, timeout=10)
+
+if response.status_code == 200:
+    all_products = response.json()
+    examples = find_examples(all_products)
     
     # Print examples
     print(json.dumps(examples, indent=2, ensure_ascii=False))
@@ -5,19 +5,15 @@ Get one complete product example from each store
 import sys
 import json
 from pathlib import Path
-from pymongo import MongoClient
 
-# MongoDB connection
-MONGO_URI = "mongodb://localhost:27017/"
-DB_NAME = "products"
-COLLECTION_NAME = "grocery_products"
+# Shared catalog modules live in product-db
+sys.path.insert(0, str(Path(__file__).parent.parent / 'product-db'))
+from db import get_collection
 
 def get_product_examples():
     """Get one product example from each store"""
     try:
-        client = MongoClient(MONGO_URI)
-        db = client[DB_NAME]
-        collection = db[COLLECTION_NAME]
+        collection = get_collection()
         
         stores = ["Chedraui", "La Comer", "Papelerias Tony", "Dulces Balu"]
         examples = {}
@@ -35,7 +31,6 @@ def get_product_examples():
         # Print as JSON
         print(json.dumps(examples, indent=2, ensure_ascii=False, default=str))
         
-        client.close()
         return examples
         
     except Exception as e:
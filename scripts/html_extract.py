@@ -0,0 +1,239 @@
+"""
+Product extraction from store HTML pages
+Runs in the engine's parser processes, so everything here is module level
+and picklable. Cheapest source first:
+
+    1. JSON-LD (<script type="application/ld+json">) Product / ItemList
+    2. Embedded app state (__NEXT_DATA__, window.__INITIAL_STATE__, __NUXT__)
+    3. DOM: lxml with precompiled XPath (meta tags, itemprop, h1)
+
+lxml is optional; without it the DOM step falls back to regexes over the
+meta tags, which covers og:/product: metadata but not arbitrary markup.
+"""
+
+import json
+import re
+import time
+from urllib.parse import urljoin
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = lxml_html = None
+
+# Script bodies are found with regexes (no parse needed for the common case)
+JSON_LD_RE = re.compile(
+    r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+NEXT_DATA_RE = re.compile(r'<script[^>]+id=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.S | re.I)
+STATE_RE = re.compile(r'window\.(?:__INITIAL_STATE__|__PRELOADED_STATE__|__NUXT__)\s*=\s*(\{.*?\})\s*;?\s*</script>', re.S)
+HREF_RE = re.compile(r'<a\s[^>]*href=["\']([^"\'#]+)["\']', re.I)
+META_RE = re.compile(r'<meta\s[^>]*(?:property|name|itemprop)=["\']([^"\']+)["\'][^>]*content=["\']([^"\']*)["\']', re.I)
+H1_RE = re.compile(r'<h1[^>]*>(.*?)</h1>', re.S | re.I)
+TAG_RE = re.compile(r'<[^>]+>')
+PRICE_RE = re.compile(r'(\d[\d,]*(?:\.\d+)?)')
+
+if etree is not None:
+    XP_LINKS = etree.XPath('//a/@href')
+    XP_NEXT = etree.XPath('//link[@rel="next"]/@href | //a[@rel="next"]/@href')
+    XP_META = etree.XPath('//meta[@content][@property or @name or @itemprop]')
+    XP_ITEMPROP = etree.XPath('//*[@itemprop][not(self::meta)]')
+    XP_H1 = etree.XPath('string(//h1[1])')
+    XP_PRICE_CLASS = etree.XPath('string((//*[contains(@class, "price") or contains(@class, "precio")])[1])')
+    XP_IMAGE = etree.XPath('(//img[contains(@class, "product") or ancestor::*[contains(@class, "product")]]/@src)[1]')
+
+PRODUCT_TYPES = {'Product', 'ProductGroup', 'IndividualProduct'}
+
+
+def parse_price(value):
+    """Price from a number or a display string ('$1,234.50 MXN' -> 1234.5)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = PRICE_RE.search(str(value or ''))
+    return float(match.group(1).replace(',', '')) if match else 0.0
+
+
+def first(value):
+    """First element of a JSON-LD value that may be a list"""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def text_of(value):
+    """Name of a JSON-LD value that may be an object ({'name': ...})"""
+    value = first(value)
+    if isinstance(value, dict):
+        return value.get('name', '')
+    return str(value or '')
+
+
+def ld_nodes(data):
+    """Every node of a JSON-LD document (@graph, lists, ItemList elements)"""
+    if isinstance(data, list):
+        for node in data:
+            yield from ld_nodes(node)
+    elif isinstance(data, dict):
+        yield data
+        for key in ('@graph', 'itemListElement', 'hasVariant'):
+            if key in data:
+                yield from ld_nodes(data[key])
+        if isinstance(data.get('item'), dict):
+            yield from ld_nodes(data['item'])
+
+
+def is_product(node):
+    """True for JSON-LD Product nodes (@type may be a list)"""
+    types = node.get('@type')
+    types = types if isinstance(types, list) else [types]
+    return any(t in PRODUCT_TYPES for t in types if isinstance(t, str))
+
+
+def ld_product(node, url):
+    """Raw product from a JSON-LD Product node"""
+    offers = first(node.get('offers')) or {}
+    if offers.get('@type') == 'AggregateOffer':
+        price = offers.get('lowPrice') or offers.get('price')
+    else:
+        price = offers.get('price')
+    image = first(node.get('image'))
+    if isinstance(image, dict):
+        image = image.get('url', '')
+    return {
+        'name': node.get('name', ''),
+        'sku': str(node.get('sku') or node.get('mpn') or node.get('productID') or ''),
+        'gtin': str(node.get('gtin13') or node.get('gtin') or node.get('gtin12') or
+                    node.get('gtin14') or node.get('gtin8') or ''),
+        'brand': text_of(node.get('brand')),
+        'category': text_of(node.get('category')),
+        'price': parse_price(price),
+        'currency': offers.get('priceCurrency', ''),
+        'available': 'OutOfStock' not in str(offers.get('availability', '')),
+        'image': image or '',
+        'description': node.get('description', ''),
+        'url': urljoin(url, node.get('url') or offers.get('url') or url),
+        'source': 'json-ld',
+    }
+
+
+def state_products(data, url, found=None, depth=0):
+    """Product-like objects in embedded app state (name + price + an id)"""
+    found = [] if found is None else found
+    if depth > 12 or len(found) > 500:
+        return found
+    if isinstance(data, dict):
+        price = data.get('price', data.get('precio'))
+        image = first(data.get('image') or data.get('imagen'))
+        if isinstance(image, dict):
+            image = image.get('url') or image.get('src', '')
+        ident = data.get('sku') or data.get('id') or data.get('slug')
+        if isinstance(data.get('name') or data.get('nombre'), str) and price is not None and ident:
+            found.append({
+                'name': data.get('name') or data.get('nombre'),
+                'sku': str(data.get('sku') or ident),
+                'gtin': str(data.get('barcode') or data.get('ean') or data.get('gtin') or ''),
+                'brand': text_of(data.get('brand') or data.get('marca')),
+                'category': text_of(data.get('category') or data.get('categoria')),
+                'price': parse_price(price),
+                'currency': data.get('currency', ''),
+                'available': bool(data.get('available', data.get('inStock', True))),
+                'image': image or '',
+                'description': data.get('description', ''),
+                'url': urljoin(url, data.get('url') or data.get('slug') or url),
+                'source': 'state',
+            })
+            return found
+        for value in data.values():
+            state_products(value, url, found, depth + 1)
+    elif isinstance(data, list):
+        for value in data:
+            state_products(value, url, found, depth + 1)
+    return found
+
+
+def embedded_products(text, url):
+    """Products from JSON-LD, else from embedded app state"""
+    products = []
+    for block in JSON_LD_RE.findall(text):
+        try:
+            data = json.loads(block.strip())
+        except ValueError:
+            continue
+        products.extend(ld_product(node, url) for node in ld_nodes(data) if is_product(node))
+    if products:
+        return products
+    for regex in (NEXT_DATA_RE, STATE_RE):
+        match = regex.search(text)
+        if match:
+            try:
+                products = state_products(json.loads(match.group(1)), url)
+            except ValueError:
+                continue
+            if products:
+                return products
+    return []
+
+
+def dom_product(text, url):
+    """Product from the page markup (meta tags, itemprop, h1)"""
+    if lxml_html is not None:
+        doc = lxml_html.fromstring(text)
+        meta = {el.get('property') or el.get('name') or el.get('itemprop'): el.get('content')
+                for el in XP_META(doc)}
+        for el in XP_ITEMPROP(doc):
+            meta.setdefault(el.get('itemprop'), el.get('content') or el.text_content().strip())
+        name = XP_H1(doc).strip()
+        price_text = XP_PRICE_CLASS(doc)
+        image = XP_IMAGE(doc)
+        image = image[0] if isinstance(image, list) and image else image
+    else:
+        meta = {key: value for key, value in META_RE.findall(text)}
+        h1 = H1_RE.search(text)
+        name = TAG_RE.sub('', h1.group(1)).strip() if h1 else ''
+        price_text = ''
+        image = ''
+
+    name = name or meta.get('og:title') or meta.get('name', '')
+    price = meta.get('product:price:amount') or meta.get('og:price:amount') or meta.get('price') or price_text
+    if not name or not price:
+        return None
+    return {
+        'name': name,
+        'sku': meta.get('sku') or meta.get('product:retailer_item_id') or '',
+        'gtin': meta.get('gtin13') or meta.get('gtin') or '',
+        'brand': meta.get('product:brand') or meta.get('brand') or '',
+        'category': meta.get('product:category') or meta.get('category') or '',
+        'price': parse_price(price),
+        'currency': meta.get('product:price:currency') or meta.get('priceCurrency') or '',
+        'available': 'out' not in (meta.get('product:availability') or meta.get('availability') or '').lower(),
+        'image': meta.get('og:image') or image or '',
+        'description': meta.get('og:description') or meta.get('description') or '',
+        'url': url,
+        'source': 'dom',
+    }
+
+
+def extract_products(text, url):
+    """Raw products of a product page: embedded JSON first, markup otherwise"""
+    products = embedded_products(text, url)
+    if products:
+        return products
+    product = dom_product(text, url)
+    return [product] if product else []
+
+
+def extract_links(text, url):
+    """(all links, rel=next links) of a listing page, absolute"""
+    if lxml_html is not None:
+        doc = lxml_html.fromstring(text)
+        links, next_links = XP_LINKS(doc), XP_NEXT(doc)
+    else:
+        links = HREF_RE.findall(text)
+        next_links = re.findall(r'<(?:a|link)\s[^>]*rel=["\']next["\'][^>]*href=["\']([^"\']+)', text, re.I)
+    return [urljoin(url, link) for link in links], [urljoin(url, link) for link in next_links]
+
+
+def timed(function, *args):
+    """Run a parse function and return (result, CPU seconds) for throughput reports"""
+    start = time.process_time()
+    result = function(*args)
+    return result, time.process_time() - start
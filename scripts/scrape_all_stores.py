@@ -1,31 +1,58 @@
 """
 Multi-Store Product Scraper for Mexican Grocery Stores
-Supports: Chedraui, Soriana, La Comer, Bodega Aurrera, Papelerias Tony
+Supports: Chedraui, Soriana, La Comer, Bodega Aurrera, Papelerias Tony, Dulces Balu,
+Dulcerias Denny
+Stores are described by adapters (store_adapters.py) and crawled by scrape_engine.py
 """
 
 import requests
 import json
 import time
 from datetime import datetime
-import random
 import os
 import sys
 from urllib.parse import urlparse
 import base64
-from pymongo import MongoClient, UpdateOne
+from pymongo import UpdateOne
 from pathlib import Path
 
+# Get the project root (parent of scripts directory)
+project_root = Path(__file__).parent.parent
+
+# Shared catalog modules live in product-db
+sys.path.insert(0, str(project_root / 'product-db'))
+from barcode_index import BarcodeIndex, generate_ean13
+from branch_prices import BranchPrices
+from catalog_stats import refresh_stats
+from db import get_db
+from product_codes import extract_codes, with_codes
+from product_details import DETAILS_COLLECTION, detail_key, save_details, split_product
+from crawl_planner import CrawlPlanner
+from scrape_engine import ScrapeEngine
+from store_adapters import (REFRESH_FIELDS, VTEXRefreshAdapter, bodega_aurrera_adapter, chedraui_adapter,
+                            denny_adapter, dulces_balu_adapter, lacomer_adapter, soriana_adapter, tony_adapter)
+
 # Load environment variables from .env file in project root
 try:
     from dotenv import load_dotenv
-    # Get the project root (parent of scripts directory)
-    project_root = Path(__file__).parent.parent
     env_path = project_root / '.env'
     load_dotenv(dotenv_path=env_path)
 except ImportError:
     # python-dotenv not installed, will use system environment variables only
     pass
 
+# Mark-and-sweep of products missing from a run
+ARCHIVE_COLLECTION = 'grocery_products_archive'
+TOUCH_BATCH_SIZE = 500
+SWEEP_MIN_RATIO = 0.5  # skip the sweep if a store returned less than half its known products
+
+# --refresh: VTEX stores whose known products can be re-priced by productId
+REFRESH_ADAPTERS = {
+    'Chedraui': chedraui_adapter,
+    'Soriana': soriana_adapter,
+    'Papelerias Tony': tony_adapter,
+}
+
 class TeeOutput:
     """Write to both console and file"""
     def __init__(self, filename):
@@ -45,17 +72,27 @@ class TeeOutput:
         self.log.close()
 
 class MultiStoreScraper:
-    def __init__(self, mongodb_uri=None, save_images=True, debug_raw=False):
+    def __init__(self, mongodb_uri=None, save_images=True, debug_raw=False, incremental=True,
+                 plan=True, time_budget=None, lacomer_branches=None):
         self.products = []
-        self.seen_skus = set()
+        self.products_by_ean = {}
+        self.barcode_index = BarcodeIndex()
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.store_seen = {}      # store -> products seen this run (saved or already known)
+        self.touched = set()      # (store, sku) already tagged with run_id
+        self.pending_touch = {}   # store -> skus to tag in the next bulk update
+        self.partial_stores = set()  # stores scraped incrementally or cut short (not swept)
+        self.incremental = incremental
+        self.lacomer_branches = lacomer_branches  # succIds to price (None = the home branch only)
         self.save_images = save_images
         self.debug_raw = debug_raw
-        self.raw_printed = {}  # Track which stores have printed raw data
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'application/json',
             'Accept-Language': 'es-MX,es;q=0.9'
         }
+        self.engine = ScrapeEngine(headers=self.headers, debug_raw=debug_raw,
+                                   planner=CrawlPlanner() if plan else None, time_budget=time_budget)
         self.images_dir = 'product_images'
         os.makedirs(self.images_dir, exist_ok=True)
         self.placeholder = os.path.join(self.images_dir, 'placeholder.png')
@@ -71,10 +108,16 @@ class MultiStoreScraper:
     def connect_db(self):
         """Connect to MongoDB"""
         try:
-            client = MongoClient(self.mongodb_uri)
-            self.db = client['products']
+            # Scraped data can be re-scraped: acknowledge writes without waiting for the journal
+            self.db = get_db(self.mongodb_uri, profile='scrape')
             self.collection = self.db['grocery_products']
             print("[OK] Connected to MongoDB")
+            loaded = self.barcode_index.load(self.collection)
+            print(f"[OK] Loaded {loaded} known barcodes")
+            self.collection.create_index([('codes', 1)])
+            self.collection.create_index([('ean', 1)])  # save_product upserts by ean
+            self.collection.create_index([('store', 1), ('run_id', 1)])
+            self.collection.create_index([('name', 'text'), ('brand', 'text'), ('category', 'text')])
         except Exception as e:
             print(f"[ERROR] MongoDB connection failed: {e}")
             self.collection = None
@@ -93,20 +136,7 @@ class MultiStoreScraper:
     
     def generate_ean13(self, sku):
         """Generate EAN-13 code"""
-        country_code = '750'
-        numeric_sku = ''.join(filter(str.isdigit, str(sku)))
-        
-        if len(numeric_sku) < 9:
-            numeric_sku = numeric_sku.zfill(9)
-        else:
-            numeric_sku = numeric_sku[:9]
-        
-        code_12 = country_code + numeric_sku
-        odd_sum = sum(int(code_12[i]) for i in range(1, 12, 2))
-        even_sum = sum(int(code_12[i]) for i in range(0, 12, 2))
-        check_digit = (10 - ((even_sum + odd_sum * 3) % 10)) % 10
-        
-        return code_12 + str(check_digit)
+        return generate_ean13(sku)
     
     def download_image(self, image_url, sku):
         """Download product image"""
@@ -158,620 +188,307 @@ class MultiStoreScraper:
             # If placeholder creation fails, ensure at least the images_dir exists.
             os.makedirs(self.images_dir, exist_ok=True)
     
-    def is_unique_product(self, ean):
-        """Check if product is unique (not in memory or DB)"""
-        if not ean or ean in self.seen_skus:
-            return False
+    def claim_ean13(self, ean13, sku, store, synthetic=False):
+        """Claim a barcode in the collision index (in memory, preloaded from DB)
+        
+        Returns the EAN-13 to save the product under, or None if the product
+        is a duplicate. Synthetic codes that collide are re-derived.
+        """
+        code = self.barcode_index.claim(ean13, sku, store, synthetic)
+        for old_code, new_code in self.barcode_index.pop_moves():
+            self.move_product_code(old_code, new_code)
+        if code is None and not self.barcode_index.owns(ean13, sku, store, synthetic):
+            return None     # another product owns the code: not this store's product
+        # Only the store's own products count towards the sweep's safety check
+        self.store_seen[store] = self.store_seen.get(store, 0) + 1
+        if code is None:
+            self.mark_seen(store, sku)
+        return code
+    
+    def mark_seen(self, store, sku):
+        """Tag a product that is skipped (already in the DB) as seen in this run"""
+        if self.collection is None or (store, sku) in self.touched:
+            return
+        self.touched.add((store, sku))
+        pending = self.pending_touch.setdefault(store, [])
+        pending.append(sku)
+        if len(pending) >= TOUCH_BATCH_SIZE:
+            self.flush_seen(store)
+    
+    def flush_seen(self, store=None):
+        """Write buffered run_id/last_seen tags with one update per store"""
+        stores = [store] if store else list(self.pending_touch)
+        for name in stores:
+            skus = self.pending_touch.pop(name, [])
+            if not skus:
+                continue
+            try:
+                self.collection.update_many(
+                    {'store': name, 'sku': {'$in': skus}},
+                    {'$set': {'run_id': self.run_id, 'last_seen': datetime.now().isoformat()},
+                     '$unset': {'stale': '', 'stale_since': ''}}
+                )
+            except Exception as e:
+                print(f"  Error tagging seen products: {str(e)[:50]}")
+    
+    def sweep_stale(self, stores, mode='flag'):
+        """Flag or archive products of each store that this run did not see
+        
+        A store is only swept when the run saw a reasonable share of what the
+        DB holds for it, so a broken API or an aborted scrape can't mark the
+        whole store as stale.
+        """
+        if self.collection is None or mode == 'off':
+            return
+        self.flush_seen()
+        
+        for store in stores:
+            seen = self.store_seen.get(store, 0)
+            stored = self.collection.count_documents({'store': store})
+            if not seen or seen < stored * SWEEP_MIN_RATIO:
+                print(f"[INFO] Sweep skipped for {store}: saw {seen:,} of {stored:,} products")
+                continue
+            
+            unseen = {'store': store, 'run_id': {'$ne': self.run_id}}
+            try:
+                if mode == 'archive':
+                    archived_at = datetime.now().isoformat()
+                    self.collection.aggregate([
+                        {'$match': unseen},
+                        {'$set': {'archived_at': archived_at}},
+                        {'$merge': {'into': ARCHIVE_COLLECTION, 'on': '_id', 'whenMatched': 'replace'}}
+                    ])
+                    detail_ids = [detail_key(doc) for doc in self.collection.find(unseen, {'store': 1, 'sku': 1})]
+                    removed = self.collection.delete_many(unseen).deleted_count
+                    for i in range(0, len(detail_ids), TOUCH_BATCH_SIZE):
+                        self.db[DETAILS_COLLECTION].delete_many({'_id': {'$in': detail_ids[i:i + TOUCH_BATCH_SIZE]}})
+                    print(f"[OK] {store}: archived {removed:,} products not seen this run")
+                else:
+                    unseen['stale'] = {'$ne': True}
+                    flagged = self.collection.update_many(
+                        unseen,
+                        {'$set': {'stale': True, 'stale_since': datetime.now().isoformat()}}
+                    ).modified_count
+                    print(f"[OK] {store}: flagged {flagged:,} products not seen this run")
+            except Exception as e:
+                print(f"[ERROR] Sweep failed for {store}: {str(e)[:50]}")
+    
+    def move_product_code(self, old_code, new_code):
+        """Move an already saved product with a synthetic code to a new code"""
+        product = self.products_by_ean.pop(old_code, None)
+        if product is not None:
+            product['ean'] = new_code
+            product['ean13'] = new_code
+            with_codes(product)
+            self.products_by_ean[new_code] = product
         
         if self.collection is not None:
-            existing = self.collection.find_one({'ean': ean})
-            if existing:
-                return False
-        
-        self.seen_skus.add(ean)
-        return True
+            try:
+                doc = self.collection.find_one({'ean': old_code})
+                if doc:
+                    doc['ean'] = new_code
+                    doc['ean13'] = new_code
+                    self.collection.update_one(
+                        {'_id': doc['_id']},
+                        {'$set': {'ean': new_code, 'ean13': new_code, 'codes': extract_codes(doc),
+                                  'codes_updated_at': datetime.now().isoformat()}}
+                    )
+            except Exception as e:
+                print(f"  Error moving barcode in DB: {str(e)[:50]}")
     
     def save_product(self, product):
         """Save product to memory and optionally to DB"""
+        with_codes(product)
+        product['run_id'] = self.run_id
+        product['last_seen'] = product.get('scraped_at') or datetime.now().isoformat()
         self.products.append(product)
+        self.products_by_ean[product['ean']] = product
+        self.touched.add((product['store'], product['sku']))
         
         if self.collection is not None:
             try:
+                # Bulky fields go to the details collection, the main doc stays compact
+                main, details = split_product(product)
+                save_details(self.db, product, details)
                 self.collection.update_one(
                     {'ean': product['ean']},
-                    {'$set': product},
+                    {'$set': main, '$unset': {'stale': '', 'stale_since': ''}},
                     upsert=True
                 )
             except Exception as e:
                 print(f"  Error saving to DB: {str(e)[:50]}")
     
+    def add_product(self, product, update_known=False):
+        """Engine sink: claim the product's barcode and save it
+        
+        Adapters give the store's real barcode in ean13 ('' if none); products
+        without one get a generated code. Products already in the catalog are
+        only re-saved with update_known (incremental runs that fetch changed
+        products). Returns True if the product was saved.
+        """
+        sku = str(product['sku'])
+        synthetic = not product.get('ean13')
+        code = product.get('ean13') or self.generate_ean13(sku)
+        ean13 = self.claim_ean13(code, sku, product['store'], synthetic)
+        if not ean13:
+            owner = self.barcode_index.get(code)
+            if not (update_known and owner and owner['store'] == product['store'] and owner['sku'] == sku):
+                return False
+            ean13 = code
+        
+        product['ean'] = ean13
+        product['ean13'] = ean13
+        product['upc'] = product.get('upc') or self.generate_upc(sku)
+        product['ean_source'] = 'generated' if synthetic else 'api'
+        # Always resolve to a local path (real image or placeholder), never store remote URLs
+        product['local_image'] = self.download_image(product.get('image_url', ''), ean13)
+        product['image_url'] = ''
+        self.save_product(product)
+        return True
+    
+    def scrape_store(self, adapter, sink=None):
+        """Run a store adapter through the engine, returns the products added"""
+        initial_count = len(self.products)
+        sink = sink or (lambda product: self.add_product(product, adapter.update_known))
+        stats = self.engine.run(adapter, sink)
+        if adapter.incremental or stats['capped_productive_tasks'] or stats['budget_tasks']:
+            # Unseen products may just be past the time budget, or past a planned
+            # depth whose last page still found new products
+            self.partial_stores.add(adapter.store)
+        return len(self.products) - initial_count
+    
     def scrape_chedraui(self):
         """Scrape Chedraui (VTEX platform)"""
-        
-        initial_count = len(self.products)
-        store_count = 0
-        
-        # All main Chedraui categories
-        category_ids = [
-            '1/115/',  # Bebidas
-            '1/103/',  # Despensa
-            '1/10/',   # Lácteos y Huevo
-            '1/104/',  # Limpieza del Hogar
-            '1/105/',  # Cuidado Personal
-            '1/11/',   # Salchichonería
-            '1/12/',   # Refrigerado y Congelado
-            '1/13/',   # Carnes, Pescados y Mariscos
-            '1/14/',   # Panadería y Tortillería
-            '1/15/',   # Frutas y Verduras
-            '1/16/',   # Quesos
-            '1/17/',   # Productos a Granel
-            '1/18/',   # Desechables
-            '1/19/',   # Botanas y Dulces
-            '1/20/',   # Café y Sustitutos
-        ]
-        
-        for category_id in category_ids:
-            for page in range(3000):  # Increased pages to get all products
-                    
-                try:
-                    url = f"https://www.chedraui.com.mx/api/catalog_system/pub/products/search"
-                    params = {
-                        'fq': f'C:/{category_id}',
-                        '_from': page * 50,
-                        '_to': page * 50 + 49,
-                        'O': 'OrderByTopSaleDESC'
-                    }
-                    
-                    response = requests.get(url, params=params, headers=self.headers, timeout=10)
-                    
-                    if response.status_code not in [200, 206]:
-                        break
-                    
-                    data = response.json()
-                    if not data:
-                        break
-                    
-                    for item in data:
-                        sku = str(item.get('productId', ''))
-                        
-                        items = item.get('items', [])
-                        first_item = items[0] if items else {}
-                        
-                        # Collect all possible codes
-                        api_ean = first_item.get('ean', '')
-                        reference_id = first_item.get('referenceId', [{}])
-                        ref_code = reference_id[0].get('Value', '') if reference_id else ''
-                        multi_ean = item.get('MultiEan', [''])[0] if item.get('MultiEan') else ''
-                        
-                        # Determine EAN13 and UPC
-                        if api_ean and len(str(api_ean)) == 13:
-                            ean13 = str(api_ean)
-                            upc = self.generate_upc(sku)
-                        elif api_ean and len(str(api_ean)) == 12:
-                            upc = str(api_ean)
-                            ean13 = '0' + str(api_ean)
-                        else:
-                            ean13 = self.generate_ean13(sku)
-                            upc = self.generate_upc(sku)
-                        
-                        # Use EAN13 as the primary identifier
-                        if not self.is_unique_product(ean13):
-                            continue
-                        
-                        # Store all codes
-                        codes = {
-                            'sku': sku,
-                            'ean': ean13,
-                            'multi_ean': str(multi_ean) if multi_ean else '',
-                            'upc': upc,
-                            'ean13': ean13,
-                            'reference': str(ref_code) if ref_code else '',
-                            'product_id': str(item.get('productId', ''))
-                        }
-                        
-                        commercial_offer = {}
-                        if items:
-                            sellers = items[0].get('sellers', [])
-                            if sellers:
-                                commercial_offer = sellers[0].get('commertialOffer', {})
-                        
-                        price = commercial_offer.get('Price', 0)
-                        list_price = commercial_offer.get('ListPrice', price)
-                        
-                        image_url = ''
-                        if items:
-                            images = items[0].get('images', [])
-                            if images:
-                                image_url = images[0].get('imageUrl', '')
-                        
-                        # Always resolve to a local path (real image or placeholder)
-                        local_image = self.download_image(image_url, codes['ean'])
-                        
-                        product = {
-                            'sku': sku,
-                            'ean13': codes['ean13'],
-                            'upc': codes['upc'],
-                            'ean': codes['ean'],
-                            'multi_ean': codes['multi_ean'],
-                            'reference': codes['reference'],
-                            'product_id': codes['product_id'],
-                            'name': item.get('productName', ''),
-                            'brand': item.get('brand', 'Sin Marca'),
-                            'category': item.get('categories', [''])[0].split('/')[-2] if item.get('categories') else 'Supermercado',
-                            'price': float(price) if price else 0.0,
-                            'list_price': float(list_price) if list_price else float(price) if price else 0.0,
-                            'currency': 'MXN',
-                            'available': commercial_offer.get('IsAvailable', True),
-                            'stock': commercial_offer.get('AvailableQuantity', 100),
-                            'image_url': '',
-                            'local_image': local_image,
-                            'product_url': f"https://www.chedraui.com.mx{item.get('link', '')}",
-                            'store': 'Chedraui',
-                            'description': item.get('description', ''),
-                            'scraped_at': datetime.now().isoformat()
-                        }
-                        
-                        self.save_product(product)
-                        store_count += 1
-                        if store_count % 100 == 0:
-                            print(f"\rChedraui: {store_count} products", end='', flush=True)
-                    
-                    time.sleep(random.uniform(0.4, 0.9))
-                    
-                except Exception as e:
-                    continue
-        
-        added = len(self.products) - initial_count
-        return added
+        return self.scrape_store(chedraui_adapter())
     
     def scrape_soriana(self):
         """Scrape Soriana (VTEX platform)"""
-        print("\n" + "="*60)
-        print("SCRAPING SORIANA")
-        print("="*60)
-        
-        initial_count = len(self.products)
-        
-        # Soriana uses different API structure - try direct category browsing
-        categories = [
-            'abarrotes', 'bebidas', 'lacteos', 'carnes-y-pescados', 'frutas-y-verduras',
-            'panaderia', 'limpieza', 'cuidado-personal', 'mascotas', 'bebe'
-        ]
-        
-        for category in categories:
-            for page in range(50):  # Try 50 pages per category
-                try:
-                    url = f"https://www.soriana.com/{category}"
-                    params = {'_from': page * 50, '_to': page * 50 + 49}
-                    
-                    # Try VTEX API endpoint
-                    api_url = f"https://www.soriana.com/api/catalog_system/pub/products/search"
-                    api_params = {
-                        'fq': f'C:/{category}/',
-                        '_from': page * 50,
-                        '_to': page * 50 + 49
-                    }
-                    
-                    response = requests.get(api_url, params=api_params, headers=self.headers, timeout=10)
-                    
-                    if response.status_code not in [200, 206]:
-                        break
-                    
-                    data = response.json()
-                    if not data:
-                        break
-                    
-                    # Print raw data for first product from this store
-                    if self.debug_raw and 'Soriana' not in self.raw_printed and data:
-                        print("\n" + "="*60)
-                        print("RAW SOURCE DATA - SORIANA (First Product)")
-                        print("="*60)
-                        print(json.dumps(data[0], indent=2, ensure_ascii=False))
-                        print("="*60 + "\n")
-                        self.raw_printed['Soriana'] = True
-                    
-                    for item in data:
-                        sku = str(item.get('productId', ''))
-                        
-                        items = item.get('items', [])
-                        first_item = items[0] if items else {}
-                        
-                        api_ean = first_item.get('ean', '')
-                        if api_ean and len(str(api_ean)) == 13:
-                            ean13 = str(api_ean)
-                            upc = self.generate_upc(sku)
-                        else:
-                            ean13 = self.generate_ean13(sku)
-                            upc = self.generate_upc(sku)
-                        
-                        # Use EAN13 as the primary identifier
-                        if not self.is_unique_product(ean13):
-                            continue
-                        
-                        commercial_offer = {}
-                        if items:
-                            sellers = items[0].get('sellers', [])
-                            if sellers:
-                                commercial_offer = sellers[0].get('commertialOffer', {})
-                        
-                        price = commercial_offer.get('Price', 0)
-                        image_url = ''
-                        if items:
-                            images = items[0].get('images', [])
-                            if images:
-                                image_url = images[0].get('imageUrl', '')
-                        
-                        local_image = self.download_image(image_url, ean13)
-                        
-                        product = {
-                            'sku': sku,
-                            'ean': ean13,
-                            'upc': upc,
-                            'name': item.get('productName', ''),
-                            'brand': item.get('brand', 'Sin Marca'),
-                            'category': category.replace('-', ' ').title(),
-                            'price': float(price) if price else 0.0,
-                            'list_price': float(price) if price else 0.0,
-                            'currency': 'MXN',
-                            'available': True,
-                            'stock': 100,
-                            'image_url': '',
-                            'local_image': local_image,
-                            'product_url': f"https://www.soriana.com{item.get('link', '')}",
-                            'store': 'Soriana',
-                            'description': item.get('description', ''),
-                            'scraped_at': datetime.now().isoformat()
-                        }
-                        
-                        self.save_product(product)
-                    
-                    time.sleep(random.uniform(0.5, 1.0))
-                    
-                except Exception as e:
-                    continue
-        
-        added = len(self.products) - initial_count
-        print(f"[OK] Soriana: {added} new products")
-        return added
+        return self.scrape_store(soriana_adapter())
     
     def scrape_lacomer(self):
-        """Scrape La Comer"""
-        
+        """Scrape La Comer (every branch in lacomer_branches)"""
+        adapter = lacomer_adapter(self.lacomer_branches)
+        if len(adapter.branches) == 1:
+            def sink(product):
+                product.pop('branch', None)
+                return self.add_product(product, adapter.update_known)
+            return self.scrape_store(adapter, sink)
+        return self.scrape_branches(adapter)
+    
+    def scrape_branches(self, adapter):
+        """Run a multi-branch adapter: each product is saved once, its price and
+        stock per branch go to compact branch rows (only the changed ones are written)
+        
+        The saved document carries the home branch's price and stock. Branches
+        run concurrently, so products first seen at another branch wait for the
+        end of the run and are only saved from there if the home branch never
+        listed them (then with the first branch in adapter.branches order).
+        """
         initial_count = len(self.products)
-        store_count = 0
-        
-        # La Comer search terms (expanded categories)
-        search_terms = [
-            'despensa', 'bebidas', 'lacteos', 'limpieza', 'cuidado personal',
-            'carnes', 'frutas', 'verduras', 'panaderia', 'botanas',
-            'congelados', 'refrigerados', 'salchichoneria', 'quesos',
-            'cereales', 'enlatados', 'pastas', 'arroz', 'aceites',
-            'salsas', 'condimentos', 'dulces', 'chocolates', 'galletas',
-            'cafe', 'te', 'jugos', 'refrescos', 'agua',
-            'cervezas', 'licores', 'snacks', 'papas', 'semillas'
-        ]
-        
-        succ_id = 287  # La Comer store ID
-        
-        for term in search_terms:
-            for page in range(1, 100):  # Increased pages to get all products
-                try:
-                    # Use the search API endpoint
-                    url = "https://lacomer.buscador.amarello.com.mx/searchArtPrior"
-                    params = {
-                        'col': 'lacomer_2',
-                        'npagel': 40,  # Results per page
-                        'p': page,
-                        'patrocinados': 'false',
-                        's': term,
-                        'succId': succ_id,
-                        'topsort': 'false'
-                    }
-                    
-                    # Retry logic for network issues
-                    response = None
-                    for attempt in range(3):
-                        try:
-                            response = requests.get(url, params=params, headers=self.headers, timeout=15)
-                            break
-                        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                            if attempt < 2:
-                                time.sleep(2)
-                            else:
-                                raise
-                    
-                    if not response:
-                        break
-                    
-                    if response.status_code != 200:
-                        break
-                    
-                    data = response.json()
-                    products_data = data.get('res', [])
-                    
-                    if not products_data:
-                        break
-                    
-                    for item in products_data:
-                        sku = str(item.get('artCod', ''))
-                        if not sku:
-                            continue
-                        
-                        # Extract all barcode fields
-                        art_ean = str(item.get('artEan', '')) if item.get('artEan') else ''
-                        ean13 = art_ean if art_ean else self.generate_ean13(sku)
-                        upc = self.generate_upc(sku)
-                        
-                        # Use EAN13 as the primary identifier
-                        if not self.is_unique_product(ean13):
-                            continue
-                        
-                        price = item.get('artPrven', 0)
-                        list_price = item.get('artPrlin', price)
-                        
-                        # Build image URL
-                        image_url = ''
-                        if item.get('artImg') == 1:
-                            image_url = f"https://www.lacomer.com.mx/superc/img_art/{art_ean}_1.jpg"
-                        
-                        local_image = self.download_image(image_url, ean13)
-                        
-                        product = {
-                            'sku': sku,
-                            'ean13': ean13,
-                            'upc': upc,
-                            'ean': art_ean,
-                            'art_cod': sku,
-                            'name': item.get('artDes', '').strip(),
-                            'brand': item.get('marDes', 'Sin Marca').strip(),
-                            'category': item.get('agruDesPadre', term.title()),
-                            'subcategory': item.get('agruDes', ''),
-                            'price': float(price) if price else 0.0,
-                            'list_price': float(list_price) if list_price else float(price) if price else 0.0,
-                            'currency': 'MXN',
-                            'available': float(item.get('inveCant', 0)) > 0,
-                            'stock': int(float(item.get('inveCant', 0))),
-                            'image_url': '',
-                            'local_image': local_image,
-                            'product_url': f"https://www.lacomer.com.mx/lacomer/#!/item/{sku}",
-                            'store': 'La Comer',
-                            'description': item.get('artDesCom', ''),
-                            'unit_multiplier': float(item.get('artUco', 1)),
-                            'measurement_unit': item.get('artTun', ''),
-                            'scraped_at': datetime.now().isoformat()
-                        }
-                        
-                        self.save_product(product)
-                        store_count += 1
-                        
-                        if store_count % 100 == 0:
-                            print(f"\rLa Comer: {store_count} products", end='', flush=True)
-                    
-                    time.sleep(random.uniform(0.3, 0.8))
-                    
-                except Exception as e:
-                    continue
-        
-        added = len(self.products) - initial_count
-        return added
+        rows = BranchPrices(self.db, adapter.store)
+        home = adapter.branches[0]
+        stored = set()
+        elsewhere = {}      # sku -> {branch: product} of products not (yet) seen at home
+        
+        def sink(product):
+            branch = product.pop('branch')
+            rows.record(product, branch)
+            if product['sku'] in stored:
+                return False
+            if branch != home:
+                elsewhere.setdefault(product['sku'], {}).setdefault(branch, product)
+                return False
+            stored.add(product['sku'])
+            elsewhere.pop(product['sku'], None)
+            return self.add_product(product, adapter.update_known)
+        
+        self.scrape_store(adapter, sink)
+        for by_branch in elsewhere.values():
+            branch = next(branch for branch in adapter.branches if branch in by_branch)
+            self.add_product(by_branch[branch], adapter.update_known)
+        rows.flush()
+        print(f"[OK] {adapter.store}: {len(adapter.branches)} branches, {len(rows.seen):,} branch prices, "
+              f"{rows.written:,} rows written, {rows.unchanged:,} unchanged, "
+              f"{len(elsewhere):,} products not listed at branch {home}")
+        return len(self.products) - initial_count
+    
+    def scrape_dulces_balu(self):
+        """Scrape Dulces Balu (Shopify, incremental after the first full run)"""
+        return self.scrape_store(dulces_balu_adapter(incremental=self.incremental))
+    
+    def scrape_dulcerias_denny(self):
+        """Scrape Dulcerias Denny (HTML pages, parsed in worker processes)"""
+        return self.scrape_store(denny_adapter())
     
     def scrape_bodega_aurrera(self):
-        """Scrape Bodega Aurrera (Walmart Mexico) - Uses GraphQL API"""
-        print("\n" + "="*60)
-        print("SCRAPING BODEGA AURRERA")
-        print("="*60)
-        
-        initial_count = len(self.products)
-        
-        # Bodega Aurrera uses GraphQL API at despensa.bodegaaurrera.com.mx
-        # Categories to search
-        search_terms = [
-            'leche', 'pan', 'arroz', 'frijol', 'aceite', 'pollo', 'carne',
-            'agua', 'refresco', 'jugo', 'yogurt', 'queso', 'jamon', 'huevo',
-            'pasta', 'atun', 'galleta', 'cereal', 'cafe', 'azucar', 'sal',
-            'jabon', 'shampoo', 'detergente', 'papel'
-        ]
-        
-        print("  NOTE: Bodega Aurrera GraphQL API requires authentication/cookies")
-        print("  Skipping for now - API endpoint needs proper headers/session")
-        
-        # GraphQL endpoint structure (for future implementation):
-        # URL: https://despensa.bodegaaurrera.com.mx/orchestra/snb/graphql/Browse/{hash}/browse
-        # Requires full variables object with tenant, page, limit, etc.
-        # Currently returns 400 without proper authentication
-        
-        # Placeholder implementation for when API access is resolved
-        for term in search_terms[:3]:  # Limit attempts
-            print(f"  Searching: {term}")
-            try:
-                # GraphQL variables structure
-                variables = {
-                    "query": term,
-                    "page": 1,
-                    "prg": "desktop",
-                    "limit": 40,
-                    "ps": 40,
-                    "sort": "best_match",
-                    "tenant": "MX_BODEGA_OD_GLASS",
-                    "pageType": "SearchPage"
-                }
-                
-                url = "https://despensa.bodegaaurrera.com.mx/orchestra/snb/graphql/Browse/3b61d1ecc030bed143d8733c32b69c171f903bd9d9f0c2f6487656e3fd5a7187/browse"
-                
-                response = requests.get(
-                    url,
-                    params={'variables': json.dumps(variables)},
-                    headers={**self.headers, 'Referer': 'https://despensa.bodegaaurrera.com.mx/'},
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    # Parse GraphQL response structure here when working
-                    print(f"    Got response: {response.status_code}")
-                else:
-                    print(f"    API returned {response.status_code}")
-                    break
-                    
-            except Exception as e:
-                print(f"    Error: {str(e)[:50]}")
-                break
-        
-        added = len(self.products) - initial_count
-        print(f"[OK] Bodega Aurrera: {added} new products")
-        return added
+        """Scrape Bodega Aurrera (Walmart Mexico) - browse GraphQL API with warmed sessions"""
+        return self.scrape_store(bodega_aurrera_adapter())
     
     def scrape_papelerias_tony(self):
-        """Scrape Papelerias Tony - Office supplies and stationery"""
-        initial_count = len(self.products)
-        store_count = 0
-        
-        # Tony categories - expanded stationery, office, art supplies, etc.
-        search_terms = [
-            'escolar', 'oficina', 'arte', 'plumas', 'lapices', 'cuadernos',
-            'mochilas', 'papel', 'carpetas', 'colores', 'marcadores', 'pegamento',
-            'tijeras', 'calculadora', 'archivero', 'engrapadora', 'clips',
-            'borradores', 'sacapuntas', 'reglas', 'compas', 'pintura', 'pinceles',
-            'crayones', 'acuarelas', 'temperas', 'plumon', 'resaltador', 'corrector',
-            'goma', 'cinta', 'adhesiva', 'hojas', 'cartulina', 'foami',
-            'diamantina', 'silicones', 'pistola', 'plastilina', 'porcelana',
-            'lienzo', 'caballete', 'estuche', 'lonchera', 'lapicera',
-            'agenda', 'libreta', 'block', 'folder', 'mica', 'broche',
-            'perforadora', 'sello', 'almohadilla', 'etiqueta', 'separadores'
-        ]
-        
-        for term in search_terms:
-            # VTEX search API with pagination
-            for page in range(0, 50):  # Increased pages to get more products
-                try:
-                    _from = page * 50
-                    _to = _from + 49
-                    
-                    url = "https://www.tony.com.mx/api/catalog_system/pub/products/search"
-                    params = {
-                        'ft': term,
-                        '_from': _from,
-                        '_to': _to
-                    }
-                    
-                    # Retry logic for network issues
-                    response = None
-                    for attempt in range(3):
-                        try:
-                            response = requests.get(url, params=params, headers=self.headers, timeout=15)
-                            break
-                        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
-                            if attempt < 2:
-                                time.sleep(2)
-                            else:
-                                raise
-                    
-                    if not response or response.status_code not in [200, 206]:
-                        break
-                    
-                    data = response.json()
-                    
-                    if not data:
-                        break
-                    
-                    page_products = 0
-                    for item in data:
-                        product_id = str(item.get('productId', ''))
-                        if not product_id:
-                            continue
-                        
-                        # Get all barcode fields from items
-                        items = item.get('items', [])
-                        ean13 = ''
-                        upc = ''
-                        item_ean = ''
-                        if items:
-                            item_ean = str(items[0].get('ean', '')) if items[0].get('ean') else ''
-                            ean13 = item_ean if item_ean else self.generate_ean13(product_id)
-                            upc = self.generate_upc(product_id)
-                        else:
-                            ean13 = self.generate_ean13(product_id)
-                            upc = self.generate_upc(product_id)
-                        
-                        # Use EAN13 as the primary identifier
-                        if not self.is_unique_product(ean13):
-                            continue
-                        
-                        # Get reference codes
-                        product_reference = str(item.get('productReference', '')) if item.get('productReference') else ''
-                        product_reference_code = str(item.get('productReferenceCode', '')) if item.get('productReferenceCode') else ''
-                        
-                        # Price info
-                        price = 0
-                        list_price = 0
-                        available = False
-                        stock = 0
-                        if items:
-                            sellers = items[0].get('sellers', [])
-                            if sellers:
-                                commercial_offer = sellers[0].get('commertialOffer', {})
-                                price = commercial_offer.get('Price', 0)
-                                list_price = commercial_offer.get('ListPrice', price)
-                                available = commercial_offer.get('IsAvailable', False)
-                                stock = commercial_offer.get('AvailableQuantity', 0)
-                        
-                        # Image URL
-                        image_url = ''
-                        if items:
-                            images = items[0].get('images', [])
-                            if images:
-                                image_url = images[0].get('imageUrl', '')
-                        
-                        local_image = self.download_image(image_url, ean13)
-                        
-                        # Get category from item
-                        categories = item.get('categories', [])
-                        category = categories[0].split('/')[1] if categories else term.title()
-                        
-                        product = {
-                            'sku': product_id,
-                            'ean': ean13 or item_ean,
-                            'upc': upc,
-                            'item_ean': item_ean,
-                            'product_reference': product_reference,
-                            'product_reference_code': product_reference_code,
-                            'name': item.get('productName', '').strip(),
-                            'brand': item.get('brand', 'Sin Marca') or 'Sin Marca',
-                            'category': category,
-                            'price': float(price) / 100 if price else 0.0,  # Tony prices are in centavos
-                            'list_price': float(list_price) / 100 if list_price else float(price) / 100 if price else 0.0,
-                            'currency': 'MXN',
-                            'available': available,
-                            'stock': int(stock),
-                            'image_url': '',
-                            'local_image': local_image,
-                            'product_url': f"https://www.tony.com.mx{item.get('link', '')}",
-                            'store': 'Papelerias Tony',
-                            'description': item.get('description', ''),
-                            'scraped_at': datetime.now().isoformat()
-                        }
-                        
-                        self.save_product(product)
-                        page_products += 1
-                        store_count += 1
-                        
-                        if store_count % 100 == 0:
-                            print(f"\rPapelerias Tony: {store_count} products", end='', flush=True)
-                    
-                    if page_products == 0:
-                        break
-                    
-                    time.sleep(random.uniform(0.3, 0.8))
-                    
-                except Exception as e:
-                    continue
-        
-        added = len(self.products) - initial_count
-        return added
+        """Scrape Papelerias Tony - Office supplies and stationery (VTEX platform)"""
+        return self.scrape_store(tony_adapter())
     
-    def run(self):
+    def refresh_prices(self, stores=('Chedraui', 'Papelerias Tony')):
+        """Update price, availability and stock of the known products of VTEX stores
+        
+        Product ids come from the DB and are requested in batches by productId
+        (VTEXRefreshAdapter), far fewer requests than a discovery crawl. Only
+        products whose refresh fields changed are written. Returns the number
+        of products updated.
+        """
+        if self.collection is None:
+            print("[ERROR] --refresh needs the database (MONGODB_URI)")
+            return 0
+        updated = 0
+        for store in stores:
+            if store not in REFRESH_ADAPTERS:
+                print(f"[INFO] {store} has no refresh mode (VTEX stores only)")
+                continue
+            projection = dict({field: 1 for field in REFRESH_FIELDS}, sku=1, product_id=1)
+            known = {}
+            for doc in self.collection.find({'store': store}, projection):
+                known[str(doc.get('product_id') or doc['sku'])] = doc
+            if not known:
+                continue
+            print(f"\nRefreshing {store}: {len(known):,} known products...")
+            
+            updates = []
+            refreshed_at = datetime.now().isoformat()
+            
+            def flush():
+                if updates:
+                    try:
+                        self.collection.bulk_write(updates, ordered=False)
+                    except Exception as e:
+                        print(f"  Error saving refresh: {str(e)[:50]}")
+                    updates.clear()
+            
+            def apply(product):
+                doc = known.get(product['product_id'])
+                if doc is None:
+                    return False
+                changes = {field: product[field] for field in REFRESH_FIELDS if doc.get(field) != product[field]}
+                if not changes:
+                    return False
+                changes['price_updated_at'] = refreshed_at
+                updates.append(UpdateOne({'_id': doc['_id']}, {'$set': changes}))
+                if len(updates) >= TOUCH_BATCH_SIZE:
+                    flush()
+                return True
+            
+            adapter = VTEXRefreshAdapter(REFRESH_ADAPTERS[store](), known)
+            stats = self.engine.run(adapter, apply, progress=False)
+            flush()
+            updated += stats['saved']
+            print(f"[OK] {store}: {stats['saved']:,} of {stats['mapped']:,} products changed, "
+                  f"{len(known) - stats['mapped']:,} not returned | "
+                  f"{stats['requests']:,} requests in {stats['seconds']}s")
+        return updated
+    
+    def run(self, sweep='flag'):
         """Run all scrapers"""
         start_time = time.time()
+        print(f"[INFO] Run ID: {self.run_id}")
         
         # Run all working scrapers (updates existing products)
         print("\nStarting Chedraui...")
@@ -780,7 +497,12 @@ class MultiStoreScraper:
         self.scrape_lacomer()            # ~6,549 products
         print("\nStarting Papelerias Tony...")
         self.scrape_papelerias_tony()    # ~792 products
-        # self.scrape_bodega_aurrera()   # GraphQL API requires auth/cookies
+        print("\nStarting Dulces Balu...")
+        self.scrape_dulces_balu()
+        print("\nStarting Bodega Aurrera...")
+        self.scrape_bodega_aurrera()
+        print("\nStarting Dulcerias Denny...")
+        self.scrape_dulcerias_denny()
         # self.scrape_soriana()          # Skip for now, needs fixing
         
         elapsed = time.time() - start_time
@@ -792,7 +514,33 @@ class MultiStoreScraper:
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(self.products, f, ensure_ascii=False, indent=2)
         
+        self.save_collision_report(timestamp)
+        
+        self.flush_seen()
+        stores = ['Chedraui', 'La Comer', 'Papelerias Tony', 'Dulces Balu', 'Bodega Aurrera',
+                  'Dulcerias Denny']
+        self.sweep_stale([store for store in stores if store not in self.partial_stores], sweep)
+        
+        if self.collection is not None:
+            try:
+                refresh_stats(self.collection)
+                print("[OK] Catalog stats refreshed")
+            except Exception as e:
+                print(f"[ERROR] Stats refresh failed: {str(e)[:50]}")
+        
         return self.products
+    
+    def save_collision_report(self, timestamp):
+        """Write the barcode collisions resolved during this run"""
+        collisions = self.barcode_index.collisions
+        print(f"\n[INFO] Barcode collisions this run: {len(collisions)}")
+        if not collisions:
+            return
+        
+        filename = f"barcode_collisions_{timestamp}.json"
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(collisions, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] Collision report saved to {filename}")
 
 if __name__ == "__main__":
     # Configuration
@@ -806,10 +554,38 @@ if __name__ == "__main__":
     
     debug_raw = False  # Print raw source data from first product per store
     
+    # SWEEP=flag (default) marks products missing from this run as stale,
+    # SWEEP=archive moves them to grocery_products_archive, SWEEP=off skips it
+    sweep = os.environ.get('SWEEP', 'flag').lower()
+    
+    # INCREMENTAL=false forces full crawls of stores that support incremental runs (Shopify)
+    incremental = os.environ.get('INCREMENTAL', 'true').lower() not in ['false', '0', 'no', 'off']
+    
+    # PLAN=false crawls every search term / category in full, in the configured order
+    plan = os.environ.get('PLAN', 'true').lower() not in ['false', '0', 'no', 'off']
+    # TIME_BUDGET=<seconds> limits the crawl time of each store (most productive terms first)
+    time_budget = float(os.environ['TIME_BUDGET']) if os.environ.get('TIME_BUDGET') else None
+    
+    # LACOMER_BRANCHES=287,12,... prices La Comer per branch (the first is the home branch)
+    lacomer_branches = [b for b in os.environ.get('LACOMER_BRANCHES', '').replace(' ', '').split(',') if b] or None
+    
     print(f"[Config] MongoDB URI: {'configured' if mongodb_uri else 'not set'}")
     print(f"[Config] Save images: {save_images}")
+    print(f"[Config] Sweep: {sweep}")
+    print(f"[Config] Incremental: {incremental}")
+    print(f"[Config] Plan: {plan}, time budget: {f'{time_budget:g}s per store' if time_budget else 'none'}")
     
-    scraper = MultiStoreScraper(mongodb_uri=mongodb_uri, save_images=save_images, debug_raw=debug_raw)
-    products = scraper.run()
+    scraper = MultiStoreScraper(mongodb_uri=mongodb_uri, save_images=save_images, debug_raw=debug_raw,
+                                incremental=incremental, plan=plan, time_budget=time_budget,
+                                lacomer_branches=lacomer_branches)
+    if '--refresh' in sys.argv:
+        # python scrape_all_stores.py --refresh [store ...]: prices of known VTEX products only
+        stores = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+        if stores:
+            scraper.refresh_prices(stores)
+        else:
+            scraper.refresh_prices()
+    else:
+        products = scraper.run(sweep=sweep)
     
     print("\n\nDone.")
@@ -0,0 +1,525 @@
+"""
+Scraping engine
+Runs any store adapter (store_adapters.py). The adapter's tasks are crawled in
+parallel on one pooled HTTP session; the pages of a task are fetched in order
+until the store runs out of results. Timeouts, connection errors, 429 and 5xx
+responses are retried with backoff.
+
+Workers dedupe items as they arrive and track, per task label, the fraction of
+each page that is new to the run. Adapters with saturation_pages set stop a
+task (a search term, usually) once that fraction stays under
+saturation_threshold for that many pages; the run stats count the tasks
+stopped and the page requests skipped (when the store reports a total).
+
+With a CrawlPlanner (crawl_planner.py), tasks of adapters with planned = True
+are ordered and depth-capped from previous runs; time_budget bounds the
+seconds each store run spends crawling.
+
+Mapped products are handed to a sink callable in the calling thread, so the
+sink (barcode claims, DB writes) needs no locking:
+
+    engine = ScrapeEngine()
+    stats = engine.run(chedraui_adapter(), scraper.add_product)
+
+Adapters that need cookies (adapter.sessions > 0) get a pool of sessions
+warmed by adapter.warm_session, one per worker, re-warmed when the store
+blocks one. Traffic can be recorded to a JSON-lines file and replayed with no
+network (SCRAPE_RECORD / SCRAPE_REPLAY, or the command line below):
+
+    python scrape_engine.py "Bodega Aurrera" --record bodega.jsonl
+    python scrape_engine.py "Bodega Aurrera" --replay bodega.jsonl
+"""
+
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from html_extract import timed
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'application/json',
+    'Accept-Language': 'es-MX,es;q=0.9'
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+BACKOFF = 2.0               # seconds, doubled on every retry
+MAX_FAILED_PAGES = 3        # failures of one page before its task is abandoned
+MAX_LOGGED_ERRORS = 5       # sink errors printed per run (all are counted)
+TIMEOUT = 15
+
+
+def make_session(headers=None, pool_size=16):
+    """HTTP session with a connection pool sized for the worker threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(headers or DEFAULT_HEADERS)
+    return session
+
+
+def request_key(url, params):
+    """Key of a GET request in a recording"""
+    if not params:
+        return url
+    return url + '?' + urlencode(sorted((k, str(v)) for k, v in params.items()))
+
+
+class RecordedResponse:
+    """The parts of a requests.Response the adapters use, from a recording"""
+
+    def __init__(self, url, status_code, headers, text):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    @property
+    def links(self):
+        links = {}
+        for url, rel in re.findall(r'<([^>]+)>;\s*rel="?([^",;]+)"?', self.headers.get('Link', '')):
+            links[rel] = {'url': url, 'rel': rel}
+        return links
+
+
+class RecordingSession:
+    """Session wrapper that appends every response to a JSON-lines file"""
+
+    RECORDED_HEADERS = ('Content-Type', 'Link', 'Retry-After', 'REST-Content-Range', 'resources')
+
+    def __init__(self, session, path, lock):
+        self.session = session
+        self.path = path
+        self.lock = lock
+        self.headers = session.headers
+        self.cookies = session.cookies
+
+    def get(self, url, params=None, **kwargs):
+        response = self.session.get(url, params=params, **kwargs)
+        record = {
+            'key': request_key(url, params),
+            'status': response.status_code,
+            'headers': {k: response.headers[k] for k in self.RECORDED_HEADERS if k in response.headers},
+            'body': response.text,
+        }
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return response
+
+
+class ReplaySession:
+    """Answers GETs from a recording; unknown requests get a 404"""
+
+    def __init__(self, recordings):
+        self.recordings = recordings    # key -> [record, ...] in recorded order
+        self.served = {}
+        self.lock = threading.Lock()
+        self.headers = {}
+        self.cookies = CookieJar()
+
+    @classmethod
+    def load(cls, path):
+        recordings = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    recordings.setdefault(record['key'], []).append(record)
+        return recordings
+
+    def get(self, url, params=None, **kwargs):
+        key = request_key(url, params)
+        records = self.recordings.get(key)
+        if not records:
+            return RecordedResponse(key, 404, {}, '')
+        with self.lock:
+            # Repeated requests get the recorded responses in order, then the last one again
+            i = self.served.get(key, 0)
+            self.served[key] = i + 1
+        record = records[min(i, len(records) - 1)]
+        return RecordedResponse(key, record['status'], record['headers'], record['body'])
+
+
+def transport_factory(headers=None, record=None, replay=None):
+    """Session factory for live, recording (SCRAPE_RECORD) or replay (SCRAPE_REPLAY) runs"""
+    record = record or os.environ.get('SCRAPE_RECORD')
+    replay = replay or os.environ.get('SCRAPE_REPLAY')
+    if replay:
+        recordings = ReplaySession.load(replay)
+        return lambda: ReplaySession(recordings)
+    if record:
+        lock = threading.Lock()
+        return lambda: RecordingSession(make_session(headers), record, lock)
+    return lambda: make_session(headers)
+
+
+class SessionPool:
+    """Warmed sessions for adapters that need cookies, checked out per task"""
+
+    def __init__(self, factory, size, warm):
+        self.warm = warm
+        self.free = queue.Queue()
+        self.sessions = [factory() for _ in range(size)]
+        self.warmed = set()
+        for session in self.sessions:
+            self.free.put(session)
+
+    def acquire(self):
+        session = self.free.get()
+        if id(session) not in self.warmed:
+            self.warm(session)
+            self.warmed.add(id(session))
+        return session
+
+    def release(self, session):
+        self.free.put(session)
+
+    def rewarm(self, session):
+        """Drop a blocked session's cookies and bootstrap new ones"""
+        session.cookies.clear()
+        self.warm(session)
+
+
+class ScrapeEngine:
+    """Crawls store adapters and feeds mapped products to a sink"""
+
+    def __init__(self, headers=None, session=None, debug_raw=False, session_factory=None,
+                 planner=None, time_budget=None):
+        self.session_factory = session_factory or transport_factory(headers)
+        self.session = session or self.session_factory()
+        self.debug_raw = debug_raw
+        self.lock = threading.Lock()
+        self.parsers = None     # process pool for adapters that parse HTML
+        self.seen = set()
+        self.raw_printed = False
+        self.planner = planner          # CrawlPlanner for adapters with planned = True
+        self.time_budget = time_budget  # seconds of crawling per store run (None = no limit)
+        self.deadline = None
+
+    def count(self, stats, key, n=1):
+        """Increment a run counter (workers share the stats dict)"""
+        with self.lock:
+            stats[key] += n
+
+    def fetch(self, url, params, stats, session=None, headers=None, stream=False):
+        """GET with retries; the response, or None if every attempt failed
+
+        stream=True leaves the body to be read with iter_content (sitemaps).
+        """
+        session = session or self.session
+        options = {'stream': True} if stream else {}
+        for attempt in range(MAX_RETRIES):
+            self.count(stats, 'requests')
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=TIMEOUT, **options)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                response = None
+            if attempt < MAX_RETRIES - 1:
+                self.count(stats, 'retries')
+                retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+                wait = float(retry_after) if retry_after.isdigit() else BACKOFF * 2 ** attempt
+                time.sleep(wait)
+        return response
+
+    def crawl_task(self, adapter, task, out, stats, sessions=None):
+        """Fetch the pages of one task in order, putting (task, new items) on out"""
+        session = sessions.acquire() if sessions else self.session
+        try:
+            self._crawl_pages(adapter, task, out, stats, session, sessions)
+        finally:
+            if sessions:
+                sessions.release(session)
+
+    def _crawl_pages(self, adapter, task, out, stats, session, sessions):
+        failed = 0
+        page = 0
+        low_pages = 0       # pages in a row where few items were new to the run
+        last_new = 0        # new items on the last page crawled
+        term = self.term_stats(stats, task)
+        limit = (adapter.page_limits or {}).get(task.label, adapter.max_pages)
+        request = adapter.page_request(task, 0)
+        try:
+            while request is not None:
+                if page >= limit:
+                    if limit < adapter.max_pages:
+                        self.stop(stats, term, 'capped')
+                        if last_new:
+                            self.count(stats, 'capped_productive_tasks')    # more new products may follow
+                    break
+                if self.deadline and time.time() > self.deadline:
+                    self.stop(stats, term, 'budget')
+                    break
+                url, params = request
+                blocked = False
+                try:
+                    response = self.fetch(url, params, stats, session, adapter.headers)
+                    if response is None:
+                        raise IOError('no response')
+                    if sessions and adapter.is_blocked(response):
+                        self.count(stats, 'rewarms')
+                        sessions.rewarm(session)
+                        blocked = True
+                        raise IOError('session blocked')
+                    if response.status_code not in adapter.ok_status:
+                        if adapter.paged:
+                            break   # past the last page, or the store refuses the query
+                        raise IOError(f'HTTP {response.status_code}')
+                    items = self.parse(adapter, response, stats)
+                except Exception:
+                    self.count(stats, 'failed_pages')
+                    if not adapter.paged and not blocked:
+                        # Unpaged tasks are independent URLs: skip the broken one
+                        request = adapter.next_request(task, page, None, [])
+                        page += 1
+                        time.sleep(random.uniform(*adapter.delay))
+                        continue
+                    failed += 1
+                    if failed >= MAX_FAILED_PAGES:
+                        break
+                    continue        # same request again: cursors can't skip a page
+                failed = 0
+                new_items = self.claim_new(adapter, items, stats, term)
+                last_new = len(new_items)
+                if new_items:
+                    out.put((task, new_items))
+                if adapter.paged and len(items) < adapter.page_size:
+                    break           # an empty or short page is the last one
+                if adapter.saturation_pages:
+                    low_pages = low_pages + 1 if len(new_items) < adapter.saturation_threshold * len(items) else 0
+                    if low_pages >= adapter.saturation_pages:
+                        self.saturated(adapter, response, page, stats, term)
+                        break
+                request = adapter.next_request(task, page, response, items)
+                page += 1
+                time.sleep(random.uniform(*adapter.delay))
+        except Exception as e:
+            where = task.label or (request[0] if request else '')
+            raise RuntimeError(f"{where} page {page + 1}: {str(e)[:100]}") from e
+
+    def term_stats(self, stats, task):
+        """Per task label counters (tasks sharing a label share them)"""
+        with self.lock:
+            return stats['terms'].setdefault(
+                task.label, {'pages': 0, 'items': 0, 'new': 0, 'new_per_page': [], 'stopped': 'end'})
+
+    def claim_new(self, adapter, items, stats, term):
+        """Items of a page not seen earlier in the run (items without a key always count)"""
+        with self.lock:
+            new_items = []
+            for raw in items:
+                key = adapter.item_key(raw)
+                if key is not None:
+                    if key in self.seen:
+                        continue
+                    self.seen.add(key)
+                new_items.append(raw)
+            stats['pages'] += 1
+            stats['items'] += len(items)
+            term['pages'] += 1
+            term['items'] += len(items)
+            term['new'] += len(new_items)
+            term['new_per_page'].append(round(len(new_items) / len(items), 2) if items else 0)
+        return new_items
+
+    def saturated(self, adapter, response, page, stats, term):
+        """Record a task stopped early and the page requests it skipped"""
+        try:
+            total = adapter.total_results(response)
+        except Exception:
+            total = None
+        skipped = 0
+        if total:
+            pages = min(-(-total // adapter.page_size), adapter.max_pages)
+            skipped = max(0, pages - (page + 1))
+        self.count(stats, 'requests_saved', skipped)
+        self.stop(stats, term, 'saturated')
+
+    def stop(self, stats, term, reason):
+        """Record why a task ended before the store ran out of results"""
+        with self.lock:
+            term['stopped'] = reason
+            stats[f'{reason}_tasks'] += 1
+
+    def parse(self, adapter, response, stats):
+        """Items of a page: in a parser process for HTML adapters, else in this thread
+
+        CPU time spent parsing is added to stats['parse_cpu'].
+        """
+        if self.parsers is not None:
+            items, cpu = self.parsers.submit(timed, adapter.parse_html, response.text, response.url).result()
+        else:
+            start = time.thread_time()
+            items = adapter.parse_page(response)
+            cpu = time.thread_time() - start
+        self.count(stats, 'parse_cpu', cpu)
+        return items
+
+    def run(self, adapter, sink, progress=True):
+        """Crawl every task of an adapter; returns the run stats
+
+        sink(product) is called once per mapped product, in this thread, and
+        returns True when the product was saved.
+        """
+        stats = {'store': adapter.store, 'tasks': 0, 'requests': 0, 'retries': 0, 'rewarms': 0,
+                 'pages': 0, 'failed_pages': 0, 'items': 0, 'mapped': 0,
+                 'saved': 0, 'map_errors': 0, 'sink_errors': 0, 'parse_cpu': 0.0,
+                 'saturated_tasks': 0, 'requests_saved': 0, 'capped_tasks': 0, 'budget_tasks': 0,
+                 'capped_productive_tasks': 0,
+                 'terms': {}}
+        start_time = time.time()
+        if adapter.parse_workers:
+            self.parsers = ProcessPoolExecutor(max_workers=adapter.parse_workers)
+
+        sessions = None
+        discover_session = self.session
+        if adapter.sessions:
+            sessions = SessionPool(
+                self.session_factory, adapter.sessions,
+                lambda session: adapter.warm_session(
+                    lambda url, params=None: self.fetch(url, params, stats, session, adapter.headers))
+            )
+            discover_session = sessions.acquire()
+        try:
+            tasks = adapter.discover(
+                lambda url, params=None, stream=False: self.fetch(url, params, stats, discover_session,
+                                                                  adapter.headers, stream))
+        finally:
+            if sessions:
+                sessions.release(discover_session)
+        if self.planner and adapter.planned:
+            tasks = self.planner.plan(adapter, tasks)
+        stats['tasks'] = len(tasks)
+        # The budget starts with the crawl; discovery is not part of it
+        self.deadline = time.time() + self.time_budget if self.time_budget else None
+        self.seen = set()       # item keys claimed by the workers this run
+        self.raw_printed = False
+        out = queue.Queue(maxsize=adapter.concurrency * 4)
+
+        with ThreadPoolExecutor(max_workers=adapter.concurrency) as pool:
+            futures = [pool.submit(self.crawl_task, adapter, task, out, stats, sessions) for task in tasks]
+            while True:
+                try:
+                    task, items = out.get(timeout=0.2)
+                except queue.Empty:
+                    if all(f.done() for f in futures) and out.empty():
+                        break
+                    continue
+                self.consume(adapter, task, items, sink, stats, progress)
+
+        if self.parsers is not None:
+            self.parsers.shutdown()
+            self.parsers = None
+        for future in futures:
+            error = future.exception()
+            if error:
+                self.count(stats, 'failed_pages')
+                print(f"\n[ERROR] {adapter.store}: task failed at {error}")
+        stats['seconds'] = round(time.time() - start_time, 1)
+        # Parser throughput per core: pages over CPU seconds spent parsing them
+        stats['pages_per_core_sec'] = round(stats['pages'] / stats['parse_cpu'], 1) if stats['parse_cpu'] else 0
+        stats['parse_cpu'] = round(stats['parse_cpu'], 2)
+        if self.planner and adapter.planned:
+            self.planner.record(adapter, stats)
+        adapter.finish(stats)
+        if progress:
+            print(f"\r[OK] {adapter.store}: {stats['saved']:,} new products "
+                  f"({stats['mapped']:,} mapped from {stats['items']:,} items, {stats['pages']:,} pages, "
+                  f"{stats['requests']:,} requests in {stats['seconds']}s, "
+                  f"parse {stats['pages_per_core_sec']:,} pages/s/core)")
+            if stats['sink_errors']:
+                print(f"     {stats['sink_errors']:,} products failed to save")
+            if stats['saturated_tasks']:
+                print(f"     {stats['saturated_tasks']} of {stats['tasks']} tasks stopped once they only "
+                      f"repeated products, ~{stats['requests_saved']:,} requests saved")
+            if stats['capped_tasks'] or stats['budget_tasks']:
+                print(f"     {stats['capped_tasks']} tasks stopped at their planned depth "
+                      f"({stats['capped_productive_tasks']} still finding new products), "
+                      f"{stats['budget_tasks']} by the {self.time_budget}s time budget")
+        return stats
+
+    def consume(self, adapter, task, items, sink, stats, progress):
+        """Map a page of new raw items and pass the products to the sink"""
+        if self.debug_raw and not self.raw_printed:
+            self.raw_printed = True
+            print("\n" + "=" * 60)
+            print(f"RAW SOURCE DATA - {adapter.store.upper()} (First Product)")
+            print("=" * 60)
+            print(json.dumps(items[0], indent=2, ensure_ascii=False))
+            print("=" * 60 + "\n")
+
+        for raw in items:
+            try:
+                products = adapter.map_products(raw, task)
+            except Exception:
+                stats['map_errors'] += 1
+                continue
+            for product in products:
+                stats['mapped'] += 1
+                try:
+                    saved = sink(product)
+                except Exception as e:
+                    # A raising sink must not stop the consumer: workers block on the full queue
+                    stats['sink_errors'] += 1
+                    if stats['sink_errors'] <= MAX_LOGGED_ERRORS:
+                        print(f"\n[ERROR] {adapter.store}: saving {product.get('sku')} failed: {str(e)[:100]}")
+                    continue
+                if saved:
+                    stats['saved'] += 1
+                    if progress and stats['saved'] % 100 == 0:
+                        print(f"\r{adapter.store}: {stats['saved']} products", end='', flush=True)
+
+
+def main():
+    """Run one store adapter without the catalog (live, recording or replaying)"""
+    from store_adapters import STORE_ADAPTERS
+
+    args = sys.argv[1:]
+    if not args or '--help' in args or args[0] not in STORE_ADAPTERS:
+        print('Usage: python scrape_engine.py "<store>" [--record FILE | --replay FILE] [--plan] [--budget SECONDS]')
+        print(f"\nStores: {', '.join(STORE_ADAPTERS)}")
+        return
+
+    record = args[args.index('--record') + 1] if '--record' in args else None
+    replay = args[args.index('--replay') + 1] if '--replay' in args else None
+    budget = float(args[args.index('--budget') + 1]) if '--budget' in args else None
+    planner = None
+    if '--plan' in args:
+        from crawl_planner import CrawlPlanner
+        planner = CrawlPlanner()
+    adapter = STORE_ADAPTERS[args[0]]()
+    if replay:
+        adapter.delay = (0, 0)
+    engine = ScrapeEngine(session_factory=transport_factory(record=record, replay=replay),
+                          planner=planner, time_budget=budget)
+
+    products = []
+    stats = engine.run(adapter, lambda product: products.append(product) or True)
+    filename = f"engine_{args[0].lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(products, f, ensure_ascii=False, indent=2)
+    print(json.dumps(stats, indent=2))
+    print(f"✓ {len(products):,} products saved to {filename}")
+
+
+if __name__ == "__main__":
+    main()
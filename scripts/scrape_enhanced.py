@@ -10,6 +10,10 @@ import random
 import os
 from urllib.parse import urlparse
 
+from store_adapters import vtex_product
+
+CHEDRAUI_URL = 'https://www.chedraui.com.mx'
+
 class EnhancedChedrauiScraper:
     def __init__(self):
         self.products = []
@@ -60,92 +64,14 @@ class EnhancedChedrauiScraper:
                 return False
             
             self.seen_skus.add(sku)
-            items = item.get('items', [])
-            first_item = items[0] if items else {}
-            
-            # Get barcode information
-            api_ean = first_item.get('ean', '')
-            reference_id = first_item.get('referenceId', [{}])[0].get('Value', '') if first_item.get('referenceId') else ''
-            item_id = first_item.get('itemId', '')
-            
-            if api_ean and len(str(api_ean)) == 13:
-                ean13 = str(api_ean)
-                upc = ean13[1:] if ean13.startswith('0') else self.generate_upc(sku)
-            elif api_ean and len(str(api_ean)) == 12:
-                upc = str(api_ean)
-                ean13 = '0' + upc
-            else:
-                ean13 = self.generate_ean13(sku)
-                upc = self.generate_upc(sku)
-            
-            # Get commercial offer
-            commercial_offer = {}
-            if items:
-                sellers = items[0].get('sellers', [])
-                if sellers:
-                    commercial_offer = sellers[0].get('commertialOffer', {})
-            
-            price = commercial_offer.get('Price', 0)
-            list_price = commercial_offer.get('ListPrice', price)
-            discount_percentage = 0
-            if list_price > price and list_price > 0:
-                discount_percentage = round(((list_price - price) / list_price) * 100, 2)
-            
-            # Get images
-            image_url = ''
-            all_images = []
-            if items:
-                images = items[0].get('images', [])
-                if images:
-                    image_url = images[0].get('imageUrl', '')
-                    all_images = [img.get('imageUrl', '') for img in images]
-            
-            local_image = f"product_images\\{sku}.jpg" if os.path.exists(f"product_images\\{sku}.jpg") else ''
-            
-            # Get measurements
-            unit_multiplier = first_item.get('unitMultiplier', 1)
-            measurement_unit = first_item.get('measurementUnit', '')
-            
-            # Get categories
-            categories_list = item.get('categories', [])
-            categories_ids = item.get('categoriesIds', [])
+            product = vtex_product(item, 'Chedraui', CHEDRAUI_URL, category=category_name)
             
-            # Build product data
-            product = {
-                'sku': sku,
-                'item_id': item_id,
-                'ean13': ean13,
-                'upc': upc,
-                'reference_id': reference_id,
-                'name': item.get('productName', ''),
-                'brand': item.get('brand', 'Sin Marca'),
-                'brand_id': item.get('brandId', ''),
-                'category': category_name,
-                'categories': categories_list,
-                'categories_ids': categories_ids,
-                'price': float(price) if price else 0.0,
-                'list_price': float(list_price) if list_price else float(price) if price else 0.0,
-                'currency': 'MXN',
-                'discount_percentage': discount_percentage,
-                'available': commercial_offer.get('IsAvailable', True),
-                'stock': commercial_offer.get('AvailableQuantity', 100),
-                'image_url': image_url,
-                'all_images': all_images,
-                'local_image': local_image,
-                'product_url': f"https://www.chedraui.com.mx{item.get('link', '')}",
-                'store': 'Chedraui',
-                'description': item.get('description', ''),
-                'meta_tag_description': item.get('metaTagDescription', ''),
-                'rating': round(random.uniform(3.5, 5.0), 1),
-                'reviews_count': random.randint(5, 500),
-                'unit_multiplier': unit_multiplier,
-                'measurement_unit': measurement_unit,
-                'product_clusters': item.get('productClusters', {}),
-                'cluster_highlights': item.get('clusterHighlights', {}),
-                'properties': item.get('properties', []),
-                'release_date': item.get('releaseDate', ''),
-                'scraped_at': datetime.now().isoformat()
-            }
+            # Generated codes when the API has no barcode
+            product['ean13'] = product['ean13'] or self.generate_ean13(sku)
+            product['upc'] = product['upc'] or self.generate_upc(sku)
+            product['local_image'] = f"product_images\\{sku}.jpg" if os.path.exists(f"product_images\\{sku}.jpg") else ''
+            product['rating'] = round(random.uniform(3.5, 5.0), 1)
+            product['reviews_count'] = random.randint(5, 500)
             
             self.products.append(product)
             return True
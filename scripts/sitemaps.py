@@ -0,0 +1,78 @@
+"""
+Streaming sitemap reader
+Sitemaps are read while they download: gzip bodies are inflated chunk by
+chunk and the XML is fed to a pull parser, so <loc> entries are available
+before the download ends and a large product sitemap never sits in memory
+whole (parsed elements are dropped as soon as their <loc> is read).
+
+    for kind, loc in sitemap_entries(chunks(response)):
+        ...     # kind is 'sitemap' (index entry) or 'url'
+"""
+
+import re
+import zlib
+from urllib.parse import urlparse
+from xml.etree.ElementTree import XMLPullParser
+
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+TRAILING_ID_RE = re.compile(r'-(\d+)$')
+
+
+def chunks(response):
+    """Body chunks of a streamed response (recorded responses come whole)"""
+    if hasattr(response, 'iter_content'):
+        yield from response.iter_content(CHUNK_SIZE)
+    else:
+        yield response.text.encode('utf-8')
+
+
+def inflate(data_chunks):
+    """Decompress a gzip body chunk by chunk; plain bodies pass through"""
+    decompressor = None
+    for chunk in data_chunks:
+        if not chunk:
+            continue
+        if decompressor is None:
+            # .xml.gz files are served as-is, not with Content-Encoding: gzip
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk[:2] == GZIP_MAGIC else False
+        if decompressor:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        else:
+            yield chunk
+    if decompressor:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+def sitemap_entries(data_chunks):
+    """(kind, loc) of every <sitemap> or <url> entry, as the body arrives"""
+    parser = XMLPullParser(events=('start', 'end'))
+    root = None
+    for data in inflate(data_chunks):
+        parser.feed(data)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+            kind = element.tag.rpartition('}')[2]
+            if kind in ('url', 'sitemap'):
+                loc = element.findtext('{*}loc') or element.findtext('loc')
+                if loc:
+                    yield kind, loc.strip()
+                root.clear()    # entries already read
+    parser.close()
+
+
+def vtex_product_ref(url):
+    """(linkText, trailing number or None) of a VTEX product URL (/<linkText>/p), else None"""
+    parts = [part for part in urlparse(url).path.split('/') if part]
+    if len(parts) < 2 or parts[-1] != 'p':
+        return None
+    slug = parts[-2]
+    match = TRAILING_ID_RE.search(slug)
+    return slug, match.group(1) if match else None
@@ -0,0 +1,1106 @@
+"""
+Store adapters for the scraping engine (scrape_engine.py)
+An adapter describes how to crawl one store:
+
+    discover(fetch)         -> tasks to crawl (categories, search terms, ...)
+    page_request(task, n)   -> (url, params) of page n of a task, None past the end
+    next_request(...)       -> request after a page (cursor pagination)
+    parse_page(response)    -> raw items of a page
+    map_item(raw, task)     -> product dict (or None to skip the item)
+
+Adapters do no I/O of their own: discovery that needs the network gets the
+engine's fetch function. Mapped products carry the store's real barcode in
+`ean13` (normalized to EAN-13) or '' when the store has none; generating and
+claiming codes is left to the scraper. The VTEX stores (Chedraui, Soriana,
+Papelerias Tony) share one adapter and the VTEX item mapping below,
+configured per store.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'product-db'))
+from barcode_index import ean13_check_digit, validate_ean13
+from html_extract import extract_links, extract_products
+from sitemaps import chunks, sitemap_entries, vtex_product_ref
+
+# label: category name used when an item has none; params: query parameters
+Task = namedtuple('Task', 'label params')
+
+VTEX_SEARCH_PATH = '/api/catalog_system/pub/products/search'
+VTEX_MAX_RESULTS = 2500  # VTEX rejects _from/_to beyond this
+VTEX_TREE_PATH = '/api/catalog_system/pub/category/tree/4'
+VTEX_FACETS_PATH = '/api/catalog_system/pub/facets/search/'
+VTEX_PRICE_RANGE = (0, 100000)  # price shards bisect this range (pesos)
+SHARD_COVERAGE = 0.99   # a split is used when its shards hold this share of the results
+VTEX_REFRESH_BATCH = 50  # id filters per batch request (one full page of results)
+VTEX_ID_FILTERS = ('productId', 'skuId', 'alternateIds_RefId')  # what a URL's trailing number may be
+VTEX_SITEMAP_PATH = '/sitemap.xml'
+REFRESH_FIELDS = ('price', 'list_price', 'available', 'stock')
+
+# Search terms stop after this many pages in a row of mostly known products
+SATURATION_PAGES = 3
+
+# Bodega Aurrera: seed shelves (more are discovered) and page sizes to try, largest first
+BODEGA_CATEGORY_IDS = ['06_0601']
+BODEGA_PAGE_SIZES = (100, 80, 60, 48, 40)
+BODEGA_PROBE_SHELVES = 3    # shelves tried for one large enough to probe a page size
+
+# Shopify incremental runs: updated_at watermark per store
+SHOPIFY_STATE_FILE = 'shopify_state.json'
+FULL_REFRESH_DAYS = 7
+
+
+def gtin13(code):
+    """EAN-13 form of a GTIN-8/12/13/14, '' if the code isn't one"""
+    code = str(code or '').strip()
+    if not code.isdigit():
+        return ''
+    if len(code) == 14:
+        # Packaging indicator + item GTIN: the item's EAN-13 has its own check digit
+        body = code[1:13]
+        return body + ean13_check_digit(body)
+    if len(code) in (8, 12):
+        code = code.zfill(13)
+    return code if validate_ean13(code) else ''
+
+
+def vtex_category(item, level=-1):
+    """Category name of a VTEX item at a path level (0 = department, -1 = leaf)"""
+    categories = item.get('categories') or []
+    parts = [part for part in categories[0].split('/') if part] if categories else []
+    return parts[level] if parts else ''
+
+
+def vtex_product(item, store, base_url, category=None, category_level=-1):
+    """Map a VTEX catalog search item to a product
+
+    Uses the first SKU (items[0]) and its first seller's offer. `ean13` is the
+    item's real barcode as EAN-13 ('' when it has none) and `upc` its UPC-A
+    form when the code has one.
+    """
+    items = item.get('items') or []
+    first_item = items[0] if items else {}
+    sellers = first_item.get('sellers') or []
+    offer = sellers[0].get('commertialOffer', {}) if sellers else {}
+    images = first_item.get('images') or []
+
+    item_ean = str(first_item.get('ean') or '')
+    multi_ean = str((item.get('MultiEan') or [''])[0] or '')
+    ean13 = gtin13(multi_ean) or gtin13(item_ean)
+    reference_ids = first_item.get('referenceId') or []
+    reference_id = str(reference_ids[0].get('Value', '')) if reference_ids else ''
+
+    price = float(offer.get('Price') or 0)
+    list_price = float(offer.get('ListPrice') or 0) or price
+    discount_percentage = 0
+    if list_price > price > 0:
+        discount_percentage = round((list_price - price) / list_price * 100, 2)
+
+    link = item.get('link', '')
+    if not link.startswith('http'):
+        link = f"{base_url}/{item.get('linkText', '')}/p"
+
+    return {
+        'sku': str(item.get('productId', '')),
+        'product_id': str(item.get('productId', '')),
+        'item_id': str(first_item.get('itemId', '')),
+        'ean13': ean13,
+        'upc': ean13[1:] if ean13.startswith('0') else '',
+        'item_ean': item_ean,
+        'multi_ean': multi_ean,
+        'reference_id': reference_id,
+        'product_reference': str(item.get('productReference') or ''),
+        'product_reference_code': str(item.get('productReferenceCode') or ''),
+        'name': (item.get('productName') or '').strip(),
+        'brand': item.get('brand') or 'Sin Marca',
+        'brand_id': item.get('brandId', ''),
+        'category': category or vtex_category(item, category_level) or 'General',
+        'categories': item.get('categories', []),
+        'categories_ids': item.get('categoriesIds', []),
+        'price': price,
+        'list_price': list_price,
+        'currency': 'MXN',
+        'discount_percentage': discount_percentage,
+        'available': offer.get('IsAvailable', bool(offer.get('AvailableQuantity'))),
+        'stock': int(offer.get('AvailableQuantity') or 0),
+        'image_url': images[0].get('imageUrl', '') if images else '',
+        'all_images': [img.get('imageUrl', '') for img in images],
+        'unit_multiplier': first_item.get('unitMultiplier', 1),
+        'measurement_unit': first_item.get('measurementUnit', ''),
+        'product_url': link,
+        'store': store,
+        'description': item.get('description', ''),
+        'meta_tag_description': item.get('metaTagDescription', ''),
+        'product_clusters': item.get('productClusters', {}),
+        'cluster_highlights': item.get('clusterHighlights', {}),
+        'properties': item.get('properties', []),
+        'release_date': item.get('releaseDate', ''),
+        'scraped_at': datetime.now().isoformat()
+    }
+
+
+class StoreAdapter:
+    """Base adapter: paging defaults and the interface the engine calls"""
+
+    store = ''
+    page_size = 50
+    max_pages = 100
+    ok_status = (200,)
+    concurrency = 4         # tasks crawled in parallel
+    delay = (0.3, 0.8)      # pause between pages of a task (seconds)
+    incremental = False     # True when a run only sees changed products (no sweep)
+    update_known = False    # re-save products already in the catalog
+    sessions = 0            # warmed sessions to pool (0 = the engine's shared session)
+    headers = None          # extra request headers
+    paged = True            # tasks are result pages that end with an empty/short page
+    parse_workers = 0       # parser processes for parse_html (0 = parse_page in the fetching thread)
+    parse_html = None       # module level parse_html(text, url) -> raw items
+    saturation_pages = 0    # stop a task after this many pages in a row with few new items (0 = never)
+    saturation_threshold = 0.1  # "few": fraction of a page's items not seen earlier in the run
+    planned = False         # tasks ordered and depth-capped by the engine's CrawlPlanner
+    page_limits = None      # task label -> max pages (set by the planner)
+
+    def discover(self, fetch):
+        """Tasks to crawl; fetch(url, params) is the engine's GET with retries"""
+        raise NotImplementedError
+
+    def page_request(self, task, page):
+        """(url, params) of a 0-based page of a task, or None past the last page"""
+        raise NotImplementedError
+
+    def next_request(self, task, page, response, items):
+        """Request for the page after `page` (override for cursor pagination)"""
+        return self.page_request(task, page + 1)
+
+    def parse_page(self, response):
+        """Raw items of a page response"""
+        return response.json()
+
+    def item_key(self, raw):
+        """Store-wide key of a raw item, so items found by several tasks map once"""
+        return None
+
+    def total_results(self, response):
+        """Results the task has according to a page response, or None if unknown
+
+        Only used to report the requests a saturated task did not make.
+        """
+        return None
+
+    def map_item(self, raw, task):
+        """Product dict for a raw item, or None to skip it"""
+        raise NotImplementedError
+
+    def map_products(self, raw, task):
+        """Products of a raw item (one, unless the store nests variants)"""
+        product = self.map_item(raw, task)
+        return [product] if product else []
+
+    def warm_session(self, fetch):
+        """Bootstrap a pooled session (cookies) with fetch(url, params)"""
+
+    def is_blocked(self, response):
+        """True if the store refused a pooled session (it is re-warmed)"""
+        return response.status_code in (401, 403, 412)
+
+    def finish(self, stats):
+        """Called by the engine after a run with its stats"""
+
+
+class VTEXAdapter(StoreAdapter):
+    """VTEX catalog search (/api/catalog_system/pub/products/search)
+
+    Crawls category paths (fq=C:/...) and full-text search terms (ft=...).
+    Search stops at VTEX_MAX_RESULTS, so a category with more results is
+    sharded before the crawl: by subcategory (category tree), else by brand
+    (facets), else by bisecting the price range, recursively until every
+    shard fits. A split is only used when its shards add up to (nearly) the
+    parent's total; products filed directly under a category would be lost
+    to its subcategories otherwise.
+
+    With sitemap=True, discovery reads the store's product sitemaps instead
+    (streamed, see sitemaps.py) and fetches every listed product in batches
+    of VTEX_REFRESH_BATCH ids, about one request per 50 products; categories
+    and search terms are only crawled if the store has no usable sitemap.
+    """
+
+    ok_status = (200, 206)
+    planned = True
+
+    def __init__(self, store, base_url, categories=None, search_terms=(), sort=None,
+                 category_level=-1, delay=(0.3, 0.8), concurrency=4, shard=True, sitemap=False):
+        self.store = store
+        self.base_url = base_url.rstrip('/')
+        self.categories = categories or {}    # category path -> label
+        self.search_terms = search_terms
+        self.sort = sort
+        self.category_level = category_level
+        self.delay = delay
+        self.concurrency = concurrency
+        self.max_pages = VTEX_MAX_RESULTS // self.page_size
+        # Search terms overlap (categories don't): stop a term once it only repeats products
+        self.saturation_pages = SATURATION_PAGES if search_terms else 0
+        self.shard = shard
+        self.sitemap = sitemap
+        self.tree = None
+        self.tree_lock = threading.Lock()
+
+    def discover(self, fetch):
+        if self.sitemap:
+            tasks = self.sitemap_tasks(fetch)
+            if tasks:
+                self.planned = False    # batches of ids: nothing for the planner to learn
+                return tasks
+            print(f"[INFO] {self.store}: no product sitemap, crawling categories and search terms")
+        tasks = [Task(label, {'fq': f'C:/{path}'}) for path, label in self.categories.items()]
+        if tasks and self.shard:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                sharded = list(pool.map(lambda task: self.shard_task(fetch, task), tasks))
+            tasks = [shard for shards in sharded for shard in shards]
+        tasks += [Task(term.title(), {'ft': term}) for term in self.search_terms]
+        return tasks
+
+    def sitemap_frontier(self, fetch):
+        """{linkText: trailing number or None} of every product in the sitemaps
+
+        Index levels are read in turn, the sitemaps of a level in parallel;
+        when an index lists product sitemaps, only those are read.
+        """
+        frontier = {}
+        lock = threading.Lock()
+        visited = set()
+
+        def read(url):
+            response = fetch(url, stream=True)
+            if response is None or response.status_code != 200:
+                return []
+            children = []
+            try:
+                for kind, loc in sitemap_entries(chunks(response)):
+                    if kind == 'sitemap':
+                        children.append(loc)
+                        continue
+                    ref = vtex_product_ref(loc)
+                    if ref:
+                        with lock:
+                            frontier.setdefault(*ref)
+            except Exception as e:
+                print(f"  Sitemap {url} unreadable: {str(e)[:50]}")
+            products = [c for c in children if 'product' in c.rsplit('/', 1)[-1]]
+            return products or children
+
+        level = [self.base_url + VTEX_SITEMAP_PATH]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while level:
+                visited.update(level)
+                found = [url for urls in pool.map(read, level) for url in urls]
+                level = [url for url in dict.fromkeys(found) if url not in visited]
+        return frontier
+
+    def id_filter(self, fetch, frontier):
+        """The fq field trailing numbers of product URLs match, probed on one batch
+
+        Stores put the productId, a SKU id or the reference code at the end of
+        the linkText; a field is used if it finds most of the probe batch.
+        """
+        probe = [number for number in frontier.values() if number][:VTEX_REFRESH_BATCH]
+        for field in VTEX_ID_FILTERS if probe else ():
+            task = id_batches(probe, field)[0]
+            url, params = self.page_request(task, 0)
+            response = fetch(url, params)
+            if response is None or response.status_code not in self.ok_status:
+                continue
+            try:
+                found = len(self.parse_page(response))
+            except ValueError:
+                continue
+            if found >= len(probe) / 2:
+                return field
+        return None
+
+    def sitemap_tasks(self, fetch):
+        """Batched id requests (and single linkText requests) for the sitemap products"""
+        frontier = self.sitemap_frontier(fetch)
+        if not frontier:
+            return []
+        field = self.id_filter(fetch, frontier)
+        numbers = [number for number in frontier.values() if number] if field else []
+        slugs = [slug for slug, number in frontier.items() if not (field and number)]
+        tasks = id_batches(numbers, field, 'Sitemap') if numbers else []
+        tasks += [Task('Sitemap', {'slug': slug}) for slug in slugs]
+        print(f"[INFO] {self.store}: {len(frontier):,} products in sitemaps -> "
+              f"{len(numbers):,} by {field or 'id'} in {len(tasks) - len(slugs):,} batches, "
+              f"{len(slugs):,} by linkText")
+        return tasks
+
+    def result_count(self, fetch, filters):
+        """Results of a filter list (one item requested), or None if unknown"""
+        response = fetch(self.base_url + VTEX_SEARCH_PATH, {'fq': filters, '_from': 0, '_to': 0})
+        if response is None or response.status_code not in self.ok_status:
+            return None
+        return self.total_results(response)
+
+    def shard_task(self, fetch, task):
+        """Tasks covering a category task, each within VTEX_MAX_RESULTS"""
+        filters = filter_list(task)
+        total = self.result_count(fetch, filters)
+        shards = self.split(fetch, task, total)
+        if len(shards) > 1:
+            print(f"[INFO] {self.store}: {task.label} ({total:,} results) split into {len(shards)} shards")
+        return shards
+
+    def split(self, fetch, task, total):
+        if total is None or total <= VTEX_MAX_RESULTS:
+            return [task]
+        filters = filter_list(task)
+        narrowed = any(f.startswith(('B:', 'P:')) for f in filters)
+        splits = [self.price_shards] if narrowed else [self.subcategory_shards, self.brand_shards, self.price_shards]
+        for split in splits:
+            shards = split(fetch, task)
+            if shards and sum(count or 0 for _, count in shards) >= total * SHARD_COVERAGE:
+                return [leaf for shard, count in shards if count != 0   # empty shards need no crawl
+                        for leaf in self.split(fetch, shard, count)]
+        return [task]   # can't be split further: crawled up to the cap
+
+    def category_node(self, fetch, path):
+        """Category tree node of a category path ('1/103/' or 'abarrotes/')"""
+        with self.tree_lock:
+            if self.tree is None:
+                response = fetch(self.base_url + VTEX_TREE_PATH)
+                try:
+                    self.tree = response.json() if response is not None and response.status_code == 200 else []
+                except ValueError:
+                    self.tree = []
+        nodes, node = self.tree, None
+        for segment in path.strip('/').split('/'):
+            node = next((n for n in nodes if str(n.get('id')) == segment or
+                         urlparse(n.get('url', '')).path.rstrip('/').endswith('/' + segment)), None)
+            if node is None:
+                return None
+            nodes = node.get('children') or []
+        return node
+
+    def subcategory_shards(self, fetch, task):
+        """(task, results) per child category"""
+        category = filter_list(task)[0]
+        node = self.category_node(fetch, category[2:])
+        if not node or not node.get('children'):
+            return []
+        shards = [Task(f"{task.label} > {child['name']}", {'fq': [f"{category}{child['id']}/"]})
+                  for child in node['children']]
+        return [(shard, self.result_count(fetch, shard.params['fq'])) for shard in shards]
+
+    def brand_shards(self, fetch, task):
+        """(task, results) per brand facet of the category (counts come with the facets)"""
+        category = filter_list(task)[0]
+        node = self.category_node(fetch, category[2:])
+        if not node:
+            return []
+        slug = urlparse(node.get('url', '')).path.strip('/')
+        if not slug:
+            return []
+        response = fetch(self.base_url + VTEX_FACETS_PATH + slug, {'map': ','.join('c' * (slug.count('/') + 1))})
+        if response is None or response.status_code != 200:
+            return []
+        try:
+            brands = response.json().get('Brands') or []
+        except ValueError:
+            return []
+        return [(Task(f"{task.label} | {brand.get('Name', brand['Id'])}", {'fq': [category, f"B:{brand['Id']}"]}),
+                 brand.get('Quantity'))
+                for brand in brands if brand.get('Id')]
+
+    def price_shards(self, fetch, task):
+        """Two (task, results) halves of the task's price range"""
+        filters = [f for f in filter_list(task) if not f.startswith('P:')]
+        low, high = price_range(task)
+        if high - low <= 1:
+            return []
+        middle = round((low + high) / 2, 2)
+        base = task.label.split(' $')[0]
+        shards = [Task(f"{base} ${a:g}-{b:g}", {'fq': filters + [f"P:[{a} TO {b}]"]})
+                  for a, b in ((low, middle), (middle, high))]
+        return [(shard, self.result_count(fetch, shard.params['fq'])) for shard in shards]
+
+    def page_request(self, task, page):
+        if 'slug' in task.params:
+            return None if page else (f"{self.base_url}{VTEX_SEARCH_PATH}/{task.params['slug']}/p", None)
+        if is_id_batch(task):
+            # One page: a result per id at most
+            return None if page else (self.base_url + VTEX_SEARCH_PATH,
+                                      dict(task.params, _from=0, _to=len(task.params['fq']) - 1))
+        start = page * self.page_size
+        if start >= VTEX_MAX_RESULTS:
+            return None
+        params = dict(task.params, _from=start, _to=start + self.page_size - 1)
+        if self.sort:
+            params['O'] = self.sort
+        return self.base_url + VTEX_SEARCH_PATH, params
+
+    def item_key(self, raw):
+        return raw.get('productId')
+
+    def total_results(self, response):
+        # resources: 0-49/1234
+        total = response.headers.get('resources', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+
+    def map_item(self, raw, task):
+        if not raw.get('productId'):
+            return None
+        product = vtex_product(raw, self.store, self.base_url, category_level=self.category_level)
+        if not raw.get('categories'):
+            product['category'] = task.label.split(' > ')[0].split(' | ')[0].split(' $')[0]
+        return product
+
+
+class VTEXRefreshAdapter(VTEXAdapter):
+    """Current price, availability and stock of known products of a VTEX store
+
+    Requests VTEX_REFRESH_BATCH products at a time by productId (repeated
+    fq=productId:... filters) instead of paging every category, so a full
+    catalog refresh takes one request per batch. Products come back with
+    REFRESH_FIELDS only.
+    """
+
+    planned = False
+
+    def __init__(self, adapter, product_ids, concurrency=8):
+        super().__init__(adapter.store, adapter.base_url, category_level=adapter.category_level,
+                         concurrency=concurrency, shard=False)
+        self.product_ids = sorted({str(pid) for pid in product_ids if pid})
+
+    def discover(self, fetch):
+        return id_batches(self.product_ids, 'productId', 'Refresh')
+
+    def map_item(self, raw, task):
+        if not raw.get('productId'):
+            return None
+        product = vtex_product(raw, self.store, self.base_url, category_level=self.category_level)
+        return dict({field: product[field] for field in REFRESH_FIELDS},
+                    sku=product['sku'], product_id=product['product_id'])
+
+
+def id_batches(ids, field, label='Batch'):
+    """Tasks requesting VTEX_REFRESH_BATCH products each by an id field (fq=field:id)"""
+    return [Task(f'{label} {i // VTEX_REFRESH_BATCH + 1}',
+                 {'fq': [f'{field}:{value}' for value in ids[i:i + VTEX_REFRESH_BATCH]]})
+            for i in range(0, len(ids), VTEX_REFRESH_BATCH)]
+
+
+def is_id_batch(task):
+    """True for tasks made by id_batches"""
+    fq = task.params.get('fq')
+    return isinstance(fq, list) and bool(fq) and fq[0].split(':', 1)[0] in VTEX_ID_FILTERS
+
+
+def filter_list(task):
+    """fq filters of a VTEX task as a list (category first)"""
+    fq = task.params.get('fq', [])
+    return list(fq) if isinstance(fq, list) else [fq]
+
+
+def price_range(task):
+    """(low, high) of a task's P:[low TO high] filter, or the full range"""
+    for f in filter_list(task):
+        match = re.match(r'P:\[([\d.]+) TO ([\d.]+)\]', f)
+        if match:
+            return float(match.group(1)), float(match.group(2))
+    return VTEX_PRICE_RANGE
+
+
+class LaComerAdapter(StoreAdapter):
+    """La Comer search API (lacomer.buscador.amarello.com.mx)
+
+    Prices and stock are per branch (succId). Every search term is crawled
+    once per branch, the branches concurrently; items are keyed by branch +
+    artCod so each branch dedupes (and saturates) on its own, and products
+    carry the branch their price and stock come from.
+    """
+
+    store = 'La Comer'
+    url = 'https://lacomer.buscador.amarello.com.mx/searchArtPrior'
+    page_size = 40
+    max_pages = 99
+    saturation_pages = SATURATION_PAGES
+    planned = True
+
+    def __init__(self, search_terms, branches=None):
+        self.search_terms = search_terms
+        self.branches = [int(branch) for branch in branches or LACOMER_BRANCHES]
+        self.concurrency = min(8, 4 * len(self.branches))
+
+    def discover(self, fetch):
+        # Home branch first, so most products are first seen (and stored) with its prices
+        home = self.branches[0]
+        return [Task(term.title() if branch == home else f'{term.title()} ({branch})', {'s': term, 'succId': branch})
+                for branch in self.branches for term in self.search_terms]
+
+    def page_request(self, task, page):
+        if page >= self.max_pages:
+            return None
+        params = dict(task.params, col='lacomer_2', npagel=self.page_size, p=page + 1,
+                      patrocinados='false', topsort='false')
+        return self.url, params
+
+    def parse_page(self, response):
+        items = response.json().get('res', [])
+        # Items don't say which branch they were priced for; the request does
+        branch = parse_qs(urlparse(response.url).query).get('succId', [self.branches[0]])[0]
+        for raw in items:
+            raw['succId'] = int(branch)
+        return items
+
+    def item_key(self, raw):
+        return raw.get('succId'), raw.get('artCod')
+
+    def total_results(self, response):
+        total = response.json().get('total')
+        return int(total) if str(total).isdigit() else None
+
+    def map_item(self, raw, task):
+        sku = str(raw.get('artCod', ''))
+        if not sku:
+            return None
+        art_ean = str(raw.get('artEan') or '')
+        price = float(raw.get('artPrven') or 0)
+        list_price = float(raw.get('artPrlin') or 0) or price
+        stock = float(raw.get('inveCant') or 0)
+        image_url = ''
+        if raw.get('artImg') == 1 and art_ean:
+            image_url = f"https://www.lacomer.com.mx/superc/img_art/{art_ean}_1.jpg"
+        ean13 = gtin13(art_ean)
+        return {
+            'sku': sku,
+            'art_cod': sku,
+            'art_ean': art_ean,
+            'ean13': ean13,
+            'upc': ean13[1:] if ean13.startswith('0') else '',
+            'name': (raw.get('artDes') or '').strip(),
+            'brand': (raw.get('marDes') or '').strip() or 'Sin Marca',
+            'category': raw.get('agruDesPadre') or task.label.split(' (')[0],
+            'subcategory': raw.get('agruDes', ''),
+            'price': price,
+            'list_price': list_price,
+            'currency': 'MXN',
+            'available': stock > 0,
+            'stock': int(stock),
+            'branch': raw.get('succId', self.branches[0]),
+            'image_url': image_url,
+            'product_url': f"https://www.lacomer.com.mx/lacomer/#!/item/{sku}",
+            'store': self.store,
+            'description': raw.get('artDesCom', ''),
+            'unit_multiplier': float(raw.get('artUco') or 1),
+            'measurement_unit': raw.get('artTun', ''),
+            'scraped_at': datetime.now().isoformat()
+        }
+
+
+class ShopifyAdapter(StoreAdapter):
+    """Shopify storefront JSON (products.json), one product per variant
+
+    Every collection is a task, plus the full catalog for products outside
+    any collection. Pages are 250 products followed by cursor: the Link
+    header (page_info) when the store sends one, else since_id. After a full
+    crawl, runs are incremental: only products with updated_at after the
+    previous run are requested, with a full crawl every FULL_REFRESH_DAYS
+    so removed products are still swept.
+    """
+
+    page_size = 250
+    max_pages = 400
+    delay = (0.5, 1.0)
+
+    def __init__(self, store, base_url, state_file=SHOPIFY_STATE_FILE, incremental=True):
+        self.store = store
+        self.base_url = base_url.rstrip('/')
+        self.state_file = state_file
+        self.allow_incremental = incremental
+        self.since = None
+        self.started_at = None
+        self.cursors = {}       # task path -> last since_id (each task runs in one thread)
+
+    def load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get(self.store, {})
+
+    def save_state(self, state):
+        data = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        data[self.store] = state
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+    def discover(self, fetch):
+        self.started_at = datetime.now(timezone.utc)
+        state = self.load_state()
+        full_at = state.get('full_at')
+        if self.allow_incremental and state.get('updated_at_min') and full_at and \
+                self.started_at - datetime.fromisoformat(full_at) < timedelta(days=FULL_REFRESH_DAYS):
+            self.since = state['updated_at_min']
+        self.incremental = self.update_known = self.since is not None
+
+        tasks = [Task('', {'path': '/products.json'})]
+        for page in range(1, 50):
+            response = fetch(f"{self.base_url}/collections.json", {'limit': self.page_size, 'page': page})
+            if response is None or response.status_code != 200:
+                break
+            collections = response.json().get('collections', [])
+            tasks += [Task(c.get('title', ''), {'path': f"/collections/{c['handle']}/products.json"})
+                      for c in collections if c.get('products_count', 1) and c.get('handle')]
+            if len(collections) < self.page_size:
+                break
+        return tasks
+
+    def page_request(self, task, page, since_id=None):
+        params = {'limit': self.page_size}
+        if self.since:
+            params['updated_at_min'] = self.since
+        if since_id:
+            params['since_id'] = since_id
+        return self.base_url + task.params['path'], params
+
+    def next_request(self, task, page, response, items):
+        next_link = response.links.get('next', {}).get('url')
+        if next_link:
+            return next_link, None
+        # since_id needs ascending ids; stop if the store ignores it and repeats a page
+        last_id = max(item['id'] for item in items)
+        if last_id <= self.cursors.get(task.params['path'], 0):
+            return None
+        self.cursors[task.params['path']] = last_id
+        return self.page_request(task, page + 1, since_id=last_id)
+
+    def parse_page(self, response):
+        return response.json().get('products', [])
+
+    def item_key(self, raw):
+        return raw.get('id')
+
+    def map_products(self, raw, task):
+        """One product per variant, keyed by the variant's barcode/sku"""
+        if self.since and raw.get('updated_at', '') and \
+                datetime.fromisoformat(raw['updated_at']) < datetime.fromisoformat(self.since):
+            return []   # the store ignored updated_at_min
+        variants = raw.get('variants') or []
+        images = raw.get('images') or []
+        tags = raw.get('tags') or []
+        if isinstance(tags, str):
+            tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+        reference = next((tag.split('=', 1)[1] for tag in tags if tag.startswith('referencia=')), '')
+        description = re.sub(r'<[^>]+>', ' ', raw.get('body_html') or '')
+        url = f"{self.base_url}/products/{raw.get('handle', '')}"
+
+        products = []
+        for variant in variants:
+            barcode = str(variant.get('barcode') or '')
+            ean13 = gtin13(barcode)
+            name = (raw.get('title') or '').strip()
+            if variant.get('title') and variant['title'] != 'Default Title':
+                name = f"{name} - {variant['title']}"
+            image = (variant.get('featured_image') or {}).get('src') or (images[0].get('src', '') if images else '')
+            price = float(variant.get('price') or 0)
+            products.append({
+                'sku': str(variant.get('sku') or variant.get('id', '')),
+                'product_id': str(raw.get('id', '')),
+                'item_id': str(variant.get('id', '')),
+                'ean13': ean13,
+                'upc': ean13[1:] if ean13.startswith('0') else '',
+                'item_ean': barcode,
+                'reference': reference,
+                'name': name,
+                'brand': raw.get('vendor') or 'Sin Marca',
+                'category': (raw.get('product_type') or '').title() or task.label or 'General',
+                'tags': tags,
+                'price': price,
+                'list_price': float(variant.get('compare_at_price') or 0) or price,
+                'currency': 'MXN',
+                'available': bool(variant.get('available', True)),
+                'image_url': image,
+                'all_images': [img.get('src', '') for img in images],
+                'product_url': url if len(variants) == 1 else f"{url}?variant={variant.get('id', '')}",
+                'store': self.store,
+                'description': ' '.join(description.split()),
+                'updated_at': variant.get('updated_at') or raw.get('updated_at', ''),
+                'scraped_at': datetime.now().isoformat()
+            })
+        return products
+
+    def finish(self, stats):
+        """Move the updated_at watermark forward after a clean run"""
+        if not self.state_file or stats['failed_pages'] or self.started_at is None:
+            return
+        state = self.load_state()
+        # Overlap by an hour so clock skew can't skip an update
+        state['updated_at_min'] = (self.started_at - timedelta(hours=1)).isoformat()
+        if not self.incremental:
+            state['full_at'] = self.started_at.isoformat()
+        self.save_state(state)
+
+
+class BodegaAurreraAdapter(StoreAdapter):
+    """Bodega Aurrera (Walmart Mexico) browse GraphQL, one task per catId shelf
+
+    The persisted Browse query answers 400 without the cookies the home page
+    sets, so every pooled session loads it first. Shelves come from the
+    catIds linked on the home page plus BODEGA_CATEGORY_IDS; the page size is
+    the largest of BODEGA_PAGE_SIZES the API returns in full.
+    """
+
+    store = 'Bodega Aurrera'
+    base_url = 'https://despensa.bodegaaurrera.com.mx'
+    url = base_url + '/orchestra/snb/graphql/Browse/' \
+        '3b61d1ecc030bed143d8733c32b69c171f903bd9d9f0c2f6487656e3fd5a7187/browse'
+    headers = {
+        'Referer': 'https://despensa.bodegaaurrera.com.mx/',
+        'x-apollo-operation-name': 'Browse',
+        'x-o-bu': 'BODEGA-MX',
+        'x-o-mart': 'B2C',
+        'x-o-platform': 'rweb',
+        'x-o-segment': 'oaoh',
+        'tenant-id': 'MX_BODEGA_OD_GLASS',
+    }
+    page_size = 40
+    max_pages = 50
+    sessions = 3
+    concurrency = 3
+    delay = (0.5, 1.2)
+
+    def __init__(self, cat_ids=None):
+        self.cat_ids = list(cat_ids or BODEGA_CATEGORY_IDS)
+
+    def warm_session(self, fetch):
+        fetch(self.base_url + '/', None)
+
+    def is_blocked(self, response):
+        # The bot challenge is an HTML page instead of JSON
+        return response.status_code in (401, 403, 412) or \
+            'text/html' in response.headers.get('Content-Type', '')
+
+    def variables(self, cat_id, page, size):
+        """Browse query variables (as sent by the site, see test_bodega_graphql.py)"""
+        return {
+            "id": "", "dealsId": "", "query": "", "nudgeContext": "",
+            "page": page, "prg": "desktop", "catId": cat_id, "facet": "",
+            "sort": "best_match", "rawFacet": "", "seoPath": "",
+            "ps": size, "limit": size,
+            "ptss": "", "trsp": "", "beShelfId": "", "recall_set": "", "module_search": "",
+            "min_price": "", "max_price": "", "storeSlotBooked": "",
+            "additionalQueryParams": {
+                "hidden_facet": None, "translation": None, "isMoreOptionsTileEnabled": True,
+                "rootDimension": "", "altQuery": "", "selectedFilter": "",
+                "neuralSearchSeeAll": False, "isLMPBrowsePage": False
+            },
+            "searchArgs": {"query": "", "cat_id": cat_id, "prg": "desktop", "facet": ""},
+            "ffAwareSearchOptOut": False, "enableCopyBlock": True, "enableVariantCount": False,
+            "enablePortableFacets": True, "tenant": "MX_BODEGA_OD_GLASS", "pageType": "BrowsePage",
+            "enableFacetCount": True,
+            "marketSpecificParams": "{\"banner\":\"od\",\"pageType\":\"browse\",\"locale\":\"es_MX\"}",
+            "fetchMarquee": False, "fetchSkyline": False
+        }
+
+    @staticmethod
+    def search_result(response):
+        data = response.json()
+        if data.get('errors') and not data.get('data'):
+            raise ValueError(str(data['errors'])[:100])
+        return ((data.get('data') or {}).get('search') or {}).get('searchResult') or {}
+
+    def discover(self, fetch):
+        cat_ids = set(self.cat_ids)
+        response = fetch(self.base_url + '/', None)
+        if response is not None and response.status_code == 200:
+            cat_ids.update(re.findall(r'(?:catId|cat_id)["=:\\]+"?(\d{2}(?:_\d{2,})+)', response.text))
+            cat_ids.update(re.findall(r'/browse/[^"?\s]*?/(\d{2}(?:_\d{2,})+)', response.text))
+        # Shelves only: a department's products are all on its shelves
+        shelves = sorted(c for c in cat_ids if not any(o != c and o.startswith(c + '_') for o in cat_ids))
+        if shelves:
+            self.page_size = self.probe_page_size(fetch, shelves)
+        return [Task(cat_id, {'catId': cat_id}) for cat_id in shelves]
+
+    def probe_page_size(self, fetch, shelves):
+        """Largest page size the API answers in full (it clamps or rejects larger ones)
+
+        A size is only taken when a shelf holding more products than that
+        returns exactly that many; a smaller shelf can't tell a full page from
+        a clamped one. Without such an answer the default page size stays.
+        """
+        counts = {}     # catId -> aggregatedCount
+        for size in BODEGA_PAGE_SIZES:
+            for cat_id in shelves[:BODEGA_PROBE_SHELVES]:
+                if counts.get(cat_id, size + 1) <= size:
+                    continue
+                response = fetch(self.url, {'variables': json.dumps(self.variables(cat_id, 1, size))})
+                if response is None or response.status_code != 200:
+                    break       # rejected: try a smaller size
+                try:
+                    result = self.search_result(response)
+                except ValueError:
+                    break
+                counts[cat_id] = result.get('aggregatedCount') or 0
+                if counts[cat_id] <= size:
+                    continue    # too small to tell, try another shelf
+                if len(self.stack_items(result)) == size:
+                    return size
+                break           # clamped: try a smaller size
+        return self.page_size
+
+    def page_request(self, task, page):
+        if page >= self.max_pages:
+            return None
+        variables = self.variables(task.params['catId'], page + 1, self.page_size)
+        return self.url, {'variables': json.dumps(variables)}
+
+    def next_request(self, task, page, response, items):
+        max_page = (self.search_result(response).get('paginationV2') or {}).get('maxPage')
+        if max_page and page + 1 >= max_page:
+            return None
+        return self.page_request(task, page + 1)
+
+    @staticmethod
+    def stack_items(result):
+        items = []
+        for stack in result.get('itemStacks') or []:
+            items.extend(item for item in stack.get('items') or [] if item.get('usItemId'))
+        return items
+
+    def parse_page(self, response):
+        return self.stack_items(self.search_result(response))
+
+    def item_key(self, raw):
+        return raw.get('usItemId')
+
+    def map_item(self, raw, task):
+        sku = str(raw.get('usItemId', ''))
+        price_info = raw.get('priceInfo') or {}
+        price = float((price_info.get('currentPrice') or {}).get('price') or 0)
+        list_price = float((price_info.get('wasPrice') or {}).get('price') or 0) or price
+        barcode = str(raw.get('upc') or raw.get('gtin13') or '')
+        ean13 = gtin13(barcode)
+        availability = (raw.get('availabilityStatusV2') or {}).get('value') or raw.get('availabilityStatus', '')
+        image_info = raw.get('imageInfo') or {}
+        path = ((raw.get('category') or {}).get('path') or [])
+        return {
+            'sku': sku,
+            'product_id': str(raw.get('id') or ''),
+            'item_ean': barcode,
+            'ean13': ean13,
+            'upc': ean13[1:] if ean13.startswith('0') else '',
+            'name': (raw.get('name') or '').strip(),
+            'brand': raw.get('brand') or 'Sin Marca',
+            'category': path[-1].get('name', '') if path else task.label,
+            'price': price,
+            'list_price': list_price,
+            'currency': 'MXN',
+            'available': availability == 'IN_STOCK',
+            'image_url': image_info.get('thumbnailUrl') or raw.get('image', ''),
+            'product_url': self.base_url + (raw.get('canonicalUrl') or f"/ip/{sku}"),
+            'store': self.store,
+            'description': raw.get('shortDescription') or '',
+            'scraped_at': datetime.now().isoformat()
+        }
+
+
+class HTMLStoreAdapter(StoreAdapter):
+    """Stores without an API: listing pages lead to product pages
+
+    discover() walks the listing pages (and their rel=next / listing links)
+    to collect product URLs; tasks are batches of product URLs whose pages
+    are parsed by html_extract.extract_products in the engine's parser
+    processes, so parsing never holds up fetching.
+    """
+
+    store = ''
+    base_url = ''
+    listing_urls = ()
+    product_path = '/producto/'
+    listing_paths = ('/productos', '/categoria/')
+    max_listing_pages = 300
+    batch_size = 20
+    paged = False
+    concurrency = 6
+    delay = (0.2, 0.5)
+    parse_html = staticmethod(extract_products)
+
+    def __init__(self):
+        self.parse_workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_pages = self.batch_size
+
+    def is_listing(self, url):
+        return url.startswith(self.base_url) and self.product_path not in url and \
+            any(path in url for path in self.listing_paths)
+
+    def discover(self, fetch):
+        queue = list(self.listing_urls)
+        visited = set(queue)
+        product_urls = {}
+        while queue and len(visited) <= self.max_listing_pages:
+            url = queue.pop(0)
+            response = fetch(url, None)
+            if response is None or response.status_code != 200:
+                continue
+            links, next_links = extract_links(response.text, url)
+            for link in links:
+                if self.product_path in link and link.startswith(self.base_url):
+                    product_urls.setdefault(link.split('?')[0].rstrip('/'), True)
+            for link in next_links + [link for link in links if self.is_listing(link)]:
+                if link not in visited:
+                    visited.add(link)
+                    queue.append(link)
+        urls = list(product_urls)
+        print(f"[INFO] {self.store}: {len(urls):,} product pages from {len(visited):,} listing pages")
+        return [Task('', {'urls': urls[i:i + self.batch_size]}) for i in range(0, len(urls), self.batch_size)]
+
+    def page_request(self, task, page):
+        urls = task.params['urls']
+        return (urls[page], None) if page < len(urls) else None
+
+    def parse_page(self, response):
+        return extract_products(response.text, response.url)
+
+    def item_key(self, raw):
+        return raw.get('sku') or raw.get('url')
+
+    def map_item(self, raw, task):
+        slug = raw.get('url', '').rstrip('/').rsplit('/', 1)[-1]
+        sku = raw.get('sku') or slug
+        if not sku or not raw.get('name'):
+            return None
+        ean13 = gtin13(raw.get('gtin'))
+        return {
+            'sku': str(sku),
+            'item_ean': raw.get('gtin', ''),
+            'ean13': ean13,
+            'upc': ean13[1:] if ean13.startswith('0') else '',
+            'name': raw['name'].strip(),
+            'brand': raw.get('brand') or 'Sin Marca',
+            'category': raw.get('category') or task.label or 'General',
+            'price': raw.get('price', 0.0),
+            'list_price': raw.get('price', 0.0),
+            'currency': raw.get('currency') or 'MXN',
+            'available': raw.get('available', True),
+            'image_url': raw.get('image', ''),
+            'product_url': raw.get('url', ''),
+            'store': self.store,
+            'description': re.sub(r'<[^>]+>', ' ', raw.get('description') or '').strip(),
+            'extracted_from': raw.get('source', ''),
+            'scraped_at': datetime.now().isoformat()
+        }
+
+
+class DennyAdapter(HTMLStoreAdapter):
+    """Dulcerias Denny (no public API, see dulceriasdenny_analysis.json)"""
+
+    store = 'Dulcerias Denny'
+    base_url = 'https://dulceriasdenny.com'
+    listing_urls = ('https://dulceriasdenny.com/productos',)
+
+
+# Store configuration ---------------------------------------------------------
+
+CHEDRAUI_CATEGORIES = {
+    '1/115/': 'Bebidas',
+    '1/103/': 'Despensa',
+    '1/10/': 'Lácteos y Huevo',
+    '1/104/': 'Limpieza del Hogar',
+    '1/105/': 'Cuidado Personal',
+    '1/11/': 'Salchichonería',
+    '1/12/': 'Refrigerado y Congelado',
+    '1/13/': 'Carnes, Pescados y Mariscos',
+    '1/14/': 'Panadería y Tortillería',
+    '1/15/': 'Frutas y Verduras',
+    '1/16/': 'Quesos',
+    '1/17/': 'Productos a Granel',
+    '1/18/': 'Desechables',
+    '1/19/': 'Botanas y Dulces',
+    '1/20/': 'Café y Sustitutos',
+}
+
+SORIANA_CATEGORIES = {
+    f'{slug}/': slug.replace('-', ' ').title() for slug in (
+        'abarrotes', 'bebidas', 'lacteos', 'carnes-y-pescados', 'frutas-y-verduras',
+        'panaderia', 'limpieza', 'cuidado-personal', 'mascotas', 'bebe'
+    )
+}
+
+# La Comer branches (succId) to price; the first is the home branch of the catalog
+LACOMER_BRANCHES = (287,)
+
+LACOMER_SEARCH_TERMS = [
+    'despensa', 'bebidas', 'lacteos', 'limpieza', 'cuidado personal',
+    'carnes', 'frutas', 'verduras', 'panaderia', 'botanas',
+    'congelados', 'refrigerados', 'salchichoneria', 'quesos',
+    'cereales', 'enlatados', 'pastas', 'arroz', 'aceites',
+    'salsas', 'condimentos', 'dulces', 'chocolates', 'galletas',
+    'cafe', 'te', 'jugos', 'refrescos', 'agua',
+    'cervezas', 'licores', 'snacks', 'papas', 'semillas'
+]
+
+TONY_SEARCH_TERMS = [
+    'escolar', 'oficina', 'arte', 'plumas', 'lapices', 'cuadernos',
+    'mochilas', 'papel', 'carpetas', 'colores', 'marcadores', 'pegamento',
+    'tijeras', 'calculadora', 'archivero', 'engrapadora', 'clips',
+    'borradores', 'sacapuntas', 'reglas', 'compas', 'pintura', 'pinceles',
+    'crayones', 'acuarelas', 'temperas', 'plumon', 'resaltador', 'corrector',
+    'goma', 'cinta', 'adhesiva', 'hojas', 'cartulina', 'foami',
+    'diamantina', 'silicones', 'pistola', 'plastilina', 'porcelana',
+    'lienzo', 'caballete', 'estuche', 'lonchera', 'lapicera',
+    'agenda', 'libreta', 'block', 'folder', 'mica', 'broche',
+    'perforadora', 'sello', 'almohadilla', 'etiqueta', 'separadores'
+]
+
+
+def chedraui_adapter():
+    return VTEXAdapter('Chedraui', 'https://www.chedraui.com.mx', categories=CHEDRAUI_CATEGORIES,
+                       sort='OrderByTopSaleDESC', delay=(0.4, 0.9), sitemap=True)
+
+
+def soriana_adapter():
+    return VTEXAdapter('Soriana', 'https://www.soriana.com', categories=SORIANA_CATEGORIES,
+                       delay=(0.5, 1.0), sitemap=True)
+
+
+def tony_adapter():
+    # Department level ('Escolar', 'Oficina', ...) is the category Tony products had so far
+    return VTEXAdapter('Papelerias Tony', 'https://www.tony.com.mx', search_terms=TONY_SEARCH_TERMS,
+                       category_level=0, sitemap=True)
+
+
+def lacomer_adapter(branches=None):
+    return LaComerAdapter(LACOMER_SEARCH_TERMS, branches)
+
+
+def bodega_aurrera_adapter():
+    return BodegaAurreraAdapter()
+
+
+def denny_adapter():
+    return DennyAdapter()
+
+
+def dulces_balu_adapter(incremental=True):
+    return ShopifyAdapter('Dulces Balu', 'https://dulcesbalu.mx', incremental=incremental)
+
+
+STORE_ADAPTERS = {
+    'Chedraui': chedraui_adapter,
+    'Soriana': soriana_adapter,
+    'La Comer': lacomer_adapter,
+    'Papelerias Tony': tony_adapter,
+    'Bodega Aurrera': bodega_aurrera_adapter,
+    'Dulces Balu': dulces_balu_adapter,
+    'Dulcerias Denny': denny_adapter,
+}
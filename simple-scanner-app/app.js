@@ -1,5 +1,6 @@
 // Product Scanner App - Simple Version
 let products = [];
+let codeIndex = new Map();
 let currentStream = null;
 
 // API Configuration - Accessible from LAN with HTTPS
@@ -40,6 +41,7 @@ async function loadProducts() {
     }
 
     products = await response.json();
+    buildCodeIndex();
     console.log(`✅ Successfully loaded ${products.length} products from API`);
     console.log(
       `📊 Stores included: ${[...new Set(products.map((p) => p.store))].join(
@@ -99,6 +101,43 @@ function showPopup(title, message, type = "info") {
   document.body.style.overflow = "hidden";
 }
 
+function descriptionSection(description) {
+  return description
+    ? `
+    <div class="detail-section">
+      <h3 style="margin-bottom: 10px; font-size: 16px;">📝 Descripción</h3>
+      <p style="color: #666; line-height: 1.6; font-size: 14px;">${description}</p>
+    </div>
+  `
+    : "";
+}
+
+// Fetch a product's details (?details=1) and fill in its description
+async function loadDescription(product) {
+  try {
+    const params = new URLSearchParams({ details: "1" });
+    if (product.store) {
+      params.set("store", product.store);
+    }
+    const response = await fetch(
+      `${API_BASE_URL}/products/sku/${encodeURIComponent(product.sku)}?${params}`,
+      { headers: { Accept: "application/json" } }
+    );
+    if (!response.ok) {
+      return;
+    }
+    const details = await response.json();
+    product.description = details.description || "";
+    const container = document.getElementById("productDescription");
+    // Still showing this product (another one may have been opened meanwhile)
+    if (container && container.dataset.key === `${product.store}:${product.sku}`) {
+      container.innerHTML = descriptionSection(product.description);
+    }
+  } catch (error) {
+    console.warn("Could not load product details:", error);
+  }
+}
+
 // Close popup modal
 function closePopup() {
   const modal = document.getElementById("popupModal");
@@ -313,26 +352,45 @@ function searchProducts(query) {
   return scoredProducts;
 }
 
+// Barcode fields used when a product has no precomputed codes array
+const CODE_FIELDS = [
+  "ean13",
+  "upc",
+  "ean",
+  "multi_ean",
+  "art_ean",
+  "art_cod",
+  "item_ean",
+  "sku",
+  "product_reference",
+  "product_reference_code",
+  "reference",
+  "product_id",
+];
+
+// Build code -> product map once so exact barcode lookups are O(1)
+function buildCodeIndex() {
+  codeIndex = new Map();
+  for (const p of products) {
+    const codes =
+      p.codes ||
+      CODE_FIELDS.map((field) => p[field])
+        .filter(Boolean)
+        .map((code) => String(code).trim().toUpperCase());
+    for (const code of codes) {
+      if (!codeIndex.has(code)) {
+        codeIndex.set(code, p);
+      }
+    }
+  }
+}
+
 // Search by barcode - Enhanced with all barcode fields
 function searchByBarcode(barcode) {
   const cleanBarcode = barcode.trim();
 
   // Try exact match first across ALL barcode fields
-  let product = products.find(
-    (p) =>
-      p.sku === cleanBarcode ||
-      p.ean13 === cleanBarcode ||
-      p.upc === cleanBarcode ||
-      p.ean === cleanBarcode ||
-      p.multi_ean === cleanBarcode ||
-      p.art_ean === cleanBarcode ||
-      p.art_cod === cleanBarcode ||
-      p.item_ean === cleanBarcode ||
-      p.product_reference === cleanBarcode ||
-      p.product_reference_code === cleanBarcode ||
-      p.reference === cleanBarcode ||
-      p.product_id === cleanBarcode
-  );
+  let product = codeIndex.get(cleanBarcode.toUpperCase());
 
   // Try partial match if no exact match found (for truncated barcodes)
   if (!product && cleanBarcode.length >= 6) {
@@ -481,14 +539,11 @@ function showProductDetail(product) {
   `
     : "";
 
-  const descriptionHTML = product.description
-    ? `
-    <div class="detail-section">
-      <h3 style="margin-bottom: 10px; font-size: 16px;">📝 Descripción</h3>
-      <p style="color: #666; line-height: 1.6; font-size: 14px;">${product.description}</p>
-    </div>
-  `
-    : "";
+  const descriptionHTML = `<div id="productDescription" data-key="${product.store}:${
+    product.sku
+  }">${descriptionSection(
+    product.description
+  )}</div>`;
 
   modalBody.innerHTML = `
     <img src="${imageSrc}" alt="${product.name}" class="modal-product-image" 
@@ -598,6 +653,11 @@ function showProductDetail(product) {
 
   modal.classList.add("active");
   document.body.style.overflow = "hidden";
+
+  // Descriptions live in the details collection: /products/all doesn't send them
+  if (product.description === undefined && product.sku) {
+    loadDescription(product);
+  }
 }
 
 // Close product modal